@@ -21,6 +21,8 @@ export default async function handler(req, res) {
       headers: {
         'Content-Type': 'application/json',
         'Accept': 'application/json',
+        // 変更がなければ304が返る
+        ...(req.headers['if-none-match'] ? { 'If-None-Match': req.headers['if-none-match'] } : {}),
       },
       signal: controller.signal
     });
@@ -29,6 +31,16 @@ export default async function handler(req, res) {
     
     console.log('レスポンスステータス:', response.status);
     
+    // バックエンドのETag・Cache-Controlをクライアントに引き継ぐ
+    ['etag', 'cache-control'].forEach(name => {
+      const value = response.headers.get(name);
+      if (value) res.setHeader(name, value);
+    });
+    
+    if (response.status === 304) {
+      return res.status(304).end();
+    }
+    
     // レスポンステキストを取得
     const responseText = await response.text();
     console.log('レスポンステキスト:', responseText.substring(0, 500));
@@ -54,7 +66,9 @@ export default async function handler(req, res) {
       });
     }
     
-    return res.status(200).json(data);
+    // 本文はそのまま転送（ETagと一致させるため再シリアライズしない）
+    res.setHeader('Content-Type', 'application/json; charset=utf-8');
+    return res.status(200).send(responseText);
     
   } catch (error) {
     console.error('プロキシエラー:', error);
@@ -1,13 +1,23 @@
 // pages/api/proxy/patient-records/[id].js
 export default async function handler(req, res) {
-  const { id } = req.query;
+  const { id, ...params } = req.query;
 
   try {
     console.log(`患者記録を取得します: ID = ${id}`);
     
     // Pythonバックエンドからフェッチ
     const apiUrl = process.env.PATIENT_RECORDS_API_URL || 'http://localhost:8000';
-    const response = await fetch(`${apiUrl}/api/patient-records/${id}`);
+    // format=structured などのクエリパラメータはそのまま転送
+    const query = new URLSearchParams(params).toString();
+    // If-None-Matchを転送し、変更がなければ304をそのまま返す
+    const response = await fetch(`${apiUrl}/api/patient-records/${id}${query ? `?${query}` : ''}`, {
+      headers: req.headers['if-none-match'] ? { 'If-None-Match': req.headers['if-none-match'] } : {}
+    });
+    forwardCacheHeaders(response, res);
+    
+    if (response.status === 304) {
+      return res.status(304).end();
+    }
     
     if (!response.ok) {
       const errorText = await response.text();
@@ -18,9 +28,10 @@ export default async function handler(req, res) {
       });
     }
     
-    // JSONデータをクライアントに転送
-    const data = await response.json();
-    return res.status(200).json(data);
+    // JSONはパース・再シリアライズせずにそのまま転送（圧縮はNext.js側で行われる）
+    const body = await response.text();
+    res.setHeader('Content-Type', 'application/json; charset=utf-8');
+    return res.status(200).send(body);
   } catch (error) {
     console.error('患者記録取得処理エラー:', error);
     return res.status(500).json({ 
@@ -28,4 +39,12 @@ export default async function handler(req, res) {
       details: error.message
     });
   }
-}
\ No newline at end of file
+}
+
+// バックエンドのETag・Cache-Controlをクライアントに引き継ぐ
+function forwardCacheHeaders(response, res) {
+  ['etag', 'cache-control'].forEach(name => {
+    const value = response.headers.get(name);
+    if (value) res.setHeader(name, value);
+  });
+}
@@ -0,0 +1,125 @@
+# python/asgi.py
+"""本番用のASGIエントリーポイント
+
+実際に配信しているFlaskアプリ（server_build.app）を、上限付きのスレッドプールで
+実行するASGIアプリとして公開する。WSGIからASGIへの変換は a2wsgi（なければ asgiref）を使う。
+ODBCの呼び出しはすべてプールのスレッド内で行われるため、遅いIRISクエリがあっても
+イベントループは他のリクエストの受付を続けられる。
+
+起動方法は serve.py を参照。
+"""
+import logging
+import os
+from config.database import POOL_DEFAULTS, close_pools, warm_pools
+
+logger = logging.getLogger(__name__)
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # a2wsgiが無い環境ではasgirefを使う
+    WSGIMiddleware = None
+
+# 1ワーカープロセスあたりのリクエスト処理スレッド数（DB接続プールの上限に合わせる）
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', POOL_DEFAULTS['max_size']))
+
+# 処理中＋待機中のリクエストがこれを超えたら503を返す
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', ASGI_THREADS * 8))
+
+class ServingApp:
+    """WSGI→ASGI変換したアプリに、起動・停止処理と同時受付数の上限を加える
+
+    http以外のlifespanスコープはここで処理し、起動時に接続プールの準備と
+    マスター・患者索引の更新開始を、停止時に接続プールの解放を行う。
+    """
+
+    def __init__(self, asgi_app, threads=ASGI_THREADS, max_pending=ASGI_MAX_PENDING,
+                 on_startup=None, on_shutdown=None):
+        self.asgi_app = asgi_app
+        self.threads = threads
+        self.max_pending = max_pending
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+        self._pending = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._handle_lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            await self.asgi_app(scope, receive, send)
+            return
+
+        if self._pending >= self.max_pending:
+            logger.warning(f"同時リクエスト数が上限に達しました ({self._pending}件)")
+            await _send_busy(send)
+            return
+
+        self._pending += 1
+        try:
+            await self.asgi_app(scope, receive, send)
+        finally:
+            self._pending -= 1
+
+    async def _handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    if self.on_startup:
+                        self.on_startup()
+                except Exception as e:
+                    logger.error(f"起動処理エラー: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.on_shutdown:
+                    self.on_shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def status(self):
+        """スレッド数と処理中のリクエスト数"""
+        return {'threads': self.threads, 'pending': self._pending, 'maxPending': self.max_pending}
+
+def wrap_wsgi(wsgi_app, threads=ASGI_THREADS):
+    """WSGIアプリをASGIアプリに変換（a2wsgiは指定したスレッド数のプールで実行する）"""
+    if WSGIMiddleware is not None:
+        return WSGIMiddleware(wsgi_app, workers=threads)
+
+    from asgiref.wsgi import WsgiToAsgi
+    logger.warning("a2wsgiがインストールされていないため、asgirefで変換します（スレッド数は指定できません）")
+    return WsgiToAsgi(wsgi_app)
+
+async def _send_busy(send):
+    body = '{"error": "サーバーが混雑しています。しばらくしてから再度お試しください"}'.encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': 503,
+        'headers': [
+            (b'content-type', b'application/json; charset=utf-8'),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            (b'retry-after', b'1'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+def on_startup():
+    from modules.master_cache import master_cache
+    from modules.patient_index import patient_index
+    warm_pools()
+    master_cache.start_refresh_timer()
+    patient_index.start_refresher()
+    logger.info(f"ASGIサーバーを起動しました (pid={os.getpid()}, スレッド数={ASGI_THREADS})")
+
+def on_shutdown():
+    close_pools()
+    logger.info(f"ASGIサーバーを停止しました (pid={os.getpid()})")
+
+def create_asgi_app():
+    """server_build.pyのFlaskアプリをASGIアプリとして返す"""
+    from server_build import app as flask_app
+    return ServingApp(wrap_wsgi(flask_app), on_startup=on_startup, on_shutdown=on_shutdown)
+
+app = create_asgi_app()
@@ -0,0 +1,175 @@
+# python/benchmarks/bench_endpoints.py
+"""APIエンドポイントのベンチマーク（合成データベース使用）
+
+synthetic_db で作ったSQLiteをIRISの代わりに接続し、Flaskのテストクライアントで
+各エンドポイントを繰り返し呼び出して所要時間を計測する。
+
+使い方（pythonディレクトリで実行）:
+    python -m benchmarks.bench_endpoints                          # 全シナリオ
+    python -m benchmarks.bench_endpoints -k records --rounds 50   # 名前で絞り込み
+    python -m benchmarks.bench_endpoints --patients 2000 --records 50
+    python -m benchmarks.bench_endpoints --save baseline.json     # 結果を保存
+    python -m benchmarks.bench_endpoints --compare baseline.json  # 退行を検出（終了コード1）
+
+--cold を付けると毎回マスター・記載内容・カルテ・患者検索キャッシュを空にしてから計測する。
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from benchmarks import synthetic_db
+
+# --compareで退行とみなす中央値の悪化率
+REGRESSION_THRESHOLD = 0.20
+
+def create_bench_app():
+    """計測対象のアプリ（本番と同じserver_buildのアプリ）"""
+    import server_build
+    return server_build.app
+
+def build_scenarios(sizes):
+    """(名前, 説明, リクエストを送る関数) の一覧"""
+    day = sizes['start_date'].isoformat()
+    week_end = (sizes['start_date'] + timedelta(days=min(sizes['days'], 7) - 1)).isoformat()
+    patient_id = f"{max(1, sizes['patients'] // 2):08d}"
+    guest_ids = [f"{i:08d}" for i in range(1, min(sizes['patients'], 100) + 1)]
+
+    return [
+        ('appointments_day', f"予約一覧 ({day})",
+         lambda client: client.get(f"/api/appointments/{day}")),
+        ('appointments_week', f"予約一覧 ({day}～{week_end})",
+         lambda client: client.get(f"/api/appointments?from={day}&to={week_end}")),
+        ('search_patients_name', "患者検索（氏名）",
+         lambda client: client.get("/api/search-patients?query=山田")),
+        ('search_patients_id', "患者検索（ゲスト番号）",
+         lambda client: client.get(f"/api/search-patients?query={patient_id[-4:]}")),
+        ('patient_records_full', "診療記録（全件）",
+         lambda client: client.get(f"/api/patient-records/{patient_id}")),
+        ('patient_records_page', "診療記録（limit=20）",
+         lambda client: client.get(f"/api/patient-records/{patient_id}?limit=20")),
+        ('patient_records_ndjson', "診療記録（NDJSON）",
+         lambda client: client.get(f"/api/patient-records/{patient_id}?stream=ndjson")),
+        ('guest_record', "ゲスト記録",
+         lambda client: client.get(f"/api/next-record/guest-record/{patient_id}")),
+        ('guest_list', f"ゲストリスト ({len(guest_ids)}件)",
+         lambda client: client.post("/api/next-record/guest-list", json={'guestIds': guest_ids})),
+    ]
+
+def run_scenario(client, request, rounds, warmup, cold):
+    from modules.chart_cache import chart_cache
+    from modules.content_cache import content_cache
+    from modules.master_cache import master_cache
+    from modules.search_cache import typeahead_cache
+
+    for _ in range(warmup):
+        _check(request(client))
+
+    timings = []
+    for _ in range(rounds):
+        if cold:
+            master_cache.clear()
+            content_cache.clear()
+            chart_cache.clear()
+            typeahead_cache.clear()
+        started = time.perf_counter()
+        response = request(client)
+        response.get_data()
+        timings.append(time.perf_counter() - started)
+        _check(response)
+
+    timings.sort()
+    return {
+        'rounds': rounds,
+        'min_ms': round(timings[0] * 1000, 3),
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        'max_ms': round(timings[-1] * 1000, 3),
+    }
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"ステータス {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    data = response.get_json(silent=True)
+    if isinstance(data, dict) and data.get('error'):
+        raise RuntimeError(f"エラー応答: {data['error']}")
+
+def compare(results, baseline_path):
+    """保存済みの結果と中央値を比べ、退行したシナリオ名の一覧を返す"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['median_ms'], result['median_ms']
+        change = (after - before) / before if before else 0.0
+        mark = "  << 退行" if change > REGRESSION_THRESHOLD else ""
+        print(f"  {name:<26} {before:>9.2f}ms -> {after:>9.2f}ms ({change:+.0%}){mark}")
+        if mark:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='APIエンドポイントのベンチマーク')
+    parser.add_argument('-k', dest='keyword', help='シナリオ名に含まれる文字列で絞り込む')
+    parser.add_argument('--patients', type=int, default=500)
+    parser.add_argument('--records', type=int, default=20, help='患者1人あたりのカルテ記載数')
+    parser.add_argument('--appointments', type=int, default=150, help='1日あたりの予約数')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--cold', action='store_true', help='毎回キャッシュを空にする')
+    parser.add_argument('--db-dir', help='合成データベースの作成先（省略時は一時ディレクトリ）')
+    parser.add_argument('--save', help='結果をJSONで保存するパス')
+    parser.add_argument('--compare', help='比較する保存済み結果のパス')
+    args = parser.parse_args()
+
+    sizes = {
+        'patients': args.patients,
+        'records_per_patient': args.records,
+        'appointments_per_day': args.appointments,
+        'days': args.days,
+        'seed': args.seed,
+        'start_date': date(2025, 5, 1),
+    }
+
+    started = time.perf_counter()
+    database = synthetic_db.build(args.db_dir, **sizes)
+    print(f"合成データ作成: {database.counts} ({time.perf_counter() - started:.1f}秒, {database.directory})")
+
+    synthetic_db.install(database)
+    client = create_bench_app().test_client()
+
+    results = {}
+    for name, description, request in build_scenarios(sizes):
+        if args.keyword and args.keyword not in name:
+            continue
+        result = run_scenario(client, request, args.rounds, args.warmup, args.cold)
+        results[name] = result
+        print(f"{name:<26} {description:<24} median={result['median_ms']:>9.2f}ms "
+              f"p95={result['p95_ms']:>9.2f}ms min={result['min_ms']:>9.2f}ms")
+
+    exit_code = 0
+    if args.compare:
+        print(f"\n{args.compare} との比較（中央値, 閾値 +{REGRESSION_THRESHOLD:.0%}）:")
+        if compare(results, args.compare):
+            exit_code = 1
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'sizes': {key: str(value) for key, value in sizes.items()},
+                'cold': args.cold,
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を保存しました: {args.save}")
+
+    sys.exit(exit_code)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# python/benchmarks/bench_parser.py
+"""カルテ記載内容パーサーのゴールデンファイル照合とスループット計測
+
+使い方（pythonディレクトリで実行）:
+    python -m benchmarks.bench_parser            # 照合 + 計測
+    python -m benchmarks.bench_parser --update   # 期待値ファイルを再生成
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from modules.content_parser import extract_text_from_json
+
+CORPUS_DIR = Path(__file__).parent / 'parser_corpus'
+
+def load_corpus():
+    """(名前, 入力, 期待値ファイルのパス) の一覧"""
+    cases = []
+    for input_path in sorted(CORPUS_DIR.glob('*.txt')):
+        if input_path.name.endswith('.expected.txt'):
+            continue
+        expected_path = input_path.with_name(input_path.stem + '.expected.txt')
+        cases.append((input_path.stem, input_path.read_text(encoding='utf-8'), expected_path))
+    return cases
+
+def check(cases, update=False):
+    """期待値ファイルと照合（updateなら書き換え）。不一致の件数を返す"""
+    failures = 0
+    for name, content, expected_path in cases:
+        actual = extract_text_from_json(content)
+        if update:
+            expected_path.write_text(actual, encoding='utf-8')
+            print(f"更新: {expected_path.name}")
+            continue
+
+        expected = expected_path.read_text(encoding='utf-8') if expected_path.exists() else None
+        if actual != expected:
+            failures += 1
+            print(f"不一致: {name}\n  期待値: {expected!r}\n  実際:   {actual!r}")
+        else:
+            print(f"OK: {name}")
+    return failures
+
+def benchmark(cases, target_bytes=20 * 1024 * 1024):
+    """コーパスを繰り返し解析してMB/sを計測"""
+    # 長い履歴の患者を想定して1件あたりの入力を大きくしたものも含める
+    inputs = [content for _, content, _ in cases]
+    inputs.append('","'.join([inputs[0].strip().strip('"')] * 200).join('""'))
+
+    print(f"\n{'入力':<24}{'サイズ':>10}{'MB/s':>10}{'件/s':>12}")
+    for label, content in zip([name for name, _, _ in cases] + ['a_json_x200'], inputs):
+        size = len(content.encode('utf-8'))
+        iterations = max(1, target_bytes // max(size, 1))
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            extract_text_from_json(content)
+        elapsed = time.perf_counter() - started
+
+        print(f"{label:<24}{size:>10}{size * iterations / elapsed / 1e6:>10.1f}{iterations / elapsed:>12.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--update', action='store_true', help='期待値ファイルを再生成する')
+    parser.add_argument('--no-bench', action='store_true', help='照合のみ行う')
+    args = parser.parse_args()
+
+    cases = load_corpus()
+    failures = check(cases, update=args.update)
+    if not args.update and not args.no_bench:
+        benchmark(cases)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
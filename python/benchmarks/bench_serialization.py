@@ -0,0 +1,96 @@
+# python/benchmarks/bench_serialization.py
+"""診療記録レスポンスのJSON生成時間と転送量の計測（合成データベース使用）
+
+記録件数の異なる応答について、以下を比較する。
+    - JSON生成: Flask既定（標準json, ensure_ascii, sort_keys）と dumps_bytes（orjson）
+    - 転送量: 無圧縮 / gzip / brotli（インストールされている場合）と圧縮時間
+
+使い方（pythonディレクトリで実行）:
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --records 1000 --limits 20,100,500,all
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks import synthetic_db
+from modules import response_encoding
+from modules.response_encoding import compress, dumps_bytes
+
+def measure(func, rounds):
+    """中央値（ミリ秒）と最後の戻り値"""
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, result
+
+def flask_default_dumps(obj):
+    """Flask既定のJSONプロバイダーと同じ設定の標準json"""
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, default=str).encode('utf-8')
+
+def fetch_payloads(client, patient_id, limits, formats):
+    """(ラベル, レスポンスのオブジェクト) の一覧"""
+    payloads = []
+    for limit in limits:
+        for response_format in formats:
+            query = f"?format={response_format}" + (f"&limit={limit}" if limit != 'all' else "")
+            response = client.get(f"/api/patient-records/{patient_id}{query}",
+                                  headers={'Accept-Encoding': 'identity'})
+            data = response.get_json()
+            if response.status_code != 200 or data.get('error'):
+                raise RuntimeError(f"取得に失敗しました: {query}: {response.get_data(as_text=True)[:200]}")
+            count = len(data['records']) if isinstance(data['records'], list) else data['records'].count('\n\n---\n\n') + 1
+            payloads.append((f"{response_format} {count}件", data))
+    return payloads
+
+def wire_bytes(client, patient_id, encoding):
+    """テストクライアント経由の実際の応答サイズ（Content-Encoding付き）"""
+    response = client.get(f"/api/patient-records/{patient_id}", headers={'Accept-Encoding': encoding})
+    return len(response.get_data()), response.headers.get('Content-Encoding', 'identity')
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON生成時間と転送量の計測')
+    parser.add_argument('--patients', type=int, default=20)
+    parser.add_argument('--records', type=int, default=500, help='患者1人あたりのカルテ記載数')
+    parser.add_argument('--limits', default='20,100,all', help='取得件数（カンマ区切り, allは全件）')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--db-dir', help='合成データベースの作成先（省略時は一時ディレクトリ）')
+    args = parser.parse_args()
+
+    database = synthetic_db.build(args.db_dir, patients=args.patients,
+                                  records_per_patient=args.records, days=1)
+    synthetic_db.install(database)
+    print(f"合成データ: {database.counts}")
+
+    import server_build
+    client = server_build.app.test_client()
+    patient_id = f"{max(1, args.patients // 2):08d}"
+
+    encodings = ['gzip'] + (['br'] if response_encoding.brotli is not None else [])
+    limits = [limit.strip() for limit in args.limits.split(',')]
+
+    print(f"\n{'応答':<20} {'標準json':>10} {'orjson':>10} {'標準json':>10} {'orjson':>10}"
+          + "".join(f" {name:>16}" for name in encodings))
+    print(f"{'':<20} {'(ms)':>10} {'(ms)':>10} {'(KB)':>10} {'(KB)':>10}"
+          + "".join(f" {'(KB / ms)':>16}" for _ in encodings))
+
+    for label, data in fetch_payloads(client, patient_id, limits, ['text', 'structured']):
+        std_ms, std_body = measure(lambda: flask_default_dumps(data), args.rounds)
+        fast_ms, fast_body = measure(lambda: dumps_bytes(data), args.rounds)
+        line = (f"{label:<20} {std_ms:>10.2f} {fast_ms:>10.2f} "
+                f"{len(std_body) / 1024:>10.1f} {len(fast_body) / 1024:>10.1f}")
+        for encoding in encodings:
+            compress_ms, compressed = measure(lambda: compress(fast_body, encoding), max(1, args.rounds // 4))
+            line += f" {len(compressed) / 1024:>8.1f} / {compress_ms:>5.1f}"
+        print(line)
+
+    print("\nHTTP応答（全件, text）:")
+    for encoding in ['identity'] + encodings:
+        size, content_encoding = wire_bytes(client, patient_id, encoding)
+        print(f"  Accept-Encoding: {encoding:<9} -> {size / 1024:>9.1f}KB (Content-Encoding: {content_encoding})")
+
+if __name__ == '__main__':
+    main()
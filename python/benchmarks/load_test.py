@@ -0,0 +1,102 @@
+# python/benchmarks/load_test.py
+"""同時利用者数を指定した負荷試験
+
+起動済みのサーバーに対して、各利用者（スレッド）が指定パスへのリクエストを
+一定時間繰り返し、スループットとレイテンシーの分布を表示する。
+
+使い方（pythonディレクトリで実行）:
+    python serve.py --workers 4 --port 8000 &
+    python -m benchmarks.load_test --users 50 --duration 30 \\
+        --path /api/appointments/2025-05-26 --path /api/health/live
+
+開発サーバー（python server_build.py 8000）に同じ条件で実行すると比較できる。
+"""
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from datetime import date
+
+def percentile(sorted_values, ratio):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(ratio * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_user(base_url, paths, deadline, offset, results, lock, timeout):
+    """1人の利用者として締切までリクエストを繰り返す"""
+    latencies = []
+    statuses = Counter()
+    count = offset
+
+    while time.monotonic() < deadline:
+        url = base_url + paths[count % len(paths)]
+        count += 1
+
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                response.read()
+                statuses[response.status] += 1
+        except urllib.error.HTTPError as e:
+            statuses[e.code] += 1
+        except Exception as e:
+            statuses[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - started)
+
+    with lock:
+        results['latencies'].extend(latencies)
+        results['statuses'].update(statuses)
+
+def run(base_url, paths, users, duration, timeout):
+    results = {'latencies': [], 'statuses': Counter()}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    threads = [
+        threading.Thread(target=run_user, args=(base_url, paths, deadline, i, results, lock, timeout))
+        for i in range(users)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return results, elapsed
+
+def report(results, elapsed, users):
+    latencies = sorted(results['latencies'])
+    total = len(latencies)
+
+    print(f"同時利用者数: {users}, 計測時間: {elapsed:.1f}秒")
+    print(f"リクエスト数: {total}, スループット: {total / elapsed:.1f} req/s")
+    if latencies:
+        print(
+            "レイテンシー(ms): "
+            f"p50={percentile(latencies, 0.50) * 1000:.1f}, "
+            f"p95={percentile(latencies, 0.95) * 1000:.1f}, "
+            f"p99={percentile(latencies, 0.99) * 1000:.1f}, "
+            f"max={latencies[-1] * 1000:.1f}"
+        )
+    print("ステータス: " + ", ".join(f"{status}={count}" for status, count in sorted(results['statuses'].items(), key=str)))
+
+def main():
+    parser = argparse.ArgumentParser(description='同時利用者数を指定した負荷試験')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--path', action='append', dest='paths')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    paths = args.paths or [f"/api/appointments/{date.today().isoformat()}", "/api/health/live"]
+    results, elapsed = run(args.url.rstrip('/'), paths, args.users, args.duration, args.timeout)
+    report(results, elapsed, args.users)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# python/benchmarks/synthetic_db.py
+"""ベンチマーク用のIRIS代替データベース（SQLite）
+
+コードが参照するスキーマ（cresc_data / view_cresc_data / wrb_data）を
+SQLiteのATTACHで再現し、患者・カルテ記載・予約の件数を指定して合成データを作る。
+install()で cresc-sora / wrb-sora のコネクションプールをこのデータベースに差し替える。
+
+IRIS固有の構文は IrisCompatCursor で最低限読み替える（SELECT TOP n → LIMIT n、
+予約の delete 列の引用）。
+"""
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+
+SCHEMAS = ('cresc_data', 'view_cresc_data', 'wrb_data')
+
+TABLES = [
+    """CREATE TABLE view_cresc_data.ゲスト基本情報 (
+        uId TEXT PRIMARY KEY, ゲスト番号 TEXT, 漢字氏名 TEXT, カナ氏名 TEXT,
+        生年月日 INTEGER, 性別 TEXT, isActive INTEGER, isDelete INTEGER)""",
+    "CREATE INDEX view_cresc_data.ゲスト番号_idx ON ゲスト基本情報 (ゲスト番号)",
+    """CREATE TABLE cresc_data.ユーザー (
+        uId TEXT PRIMARY KEY, Code TEXT, name TEXT, isActive INTEGER, isDelete INTEGER)""",
+    """CREATE TABLE view_cresc_data.ユーザー (
+        uId TEXT PRIMARY KEY, 漢字氏名 TEXT, isActive INTEGER, isDelete INTEGER)""",
+    """CREATE TABLE cresc_data.診療科マスター (
+        uId TEXT PRIMARY KEY, name TEXT, isActive INTEGER, isDelete INTEGER)""",
+    """CREATE TABLE cresc_data.カルテ記載種別マスター (
+        uId TEXT PRIMARY KEY, name TEXT, isActive INTEGER, isDelete INTEGER)""",
+    """CREATE TABLE cresc_data.カルテ記載タグマスター (
+        uId TEXT PRIMARY KEY, name TEXT, isActive INTEGER, isDelete INTEGER)""",
+    """CREATE TABLE cresc_data.カルテ記載 (
+        uId TEXT PRIMARY KEY, 患者uId TEXT, updateStamp INTEGER, 診療科uId TEXT,
+        記載者uId TEXT, 指示者uId TEXT, updateUserId TEXT, 記載種別uId TEXT,
+        記載内容リスト TEXT, 保険自費区分 INTEGER, 入外区分 INTEGER,
+        isActive INTEGER, isDelete INTEGER)""",
+    "CREATE INDEX cresc_data.カルテ記載_患者_idx ON カルテ記載 (患者uId, updateStamp)",
+    """CREATE TABLE cresc_data.カルテ記載内容 (
+        uId TEXT PRIMARY KEY, 記載区分 TEXT, 記載内容 TEXT, updateStamp INTEGER,
+        isActive INTEGER, isDelete INTEGER)""",
+    """CREATE TABLE cresc_data.カルテ記載タグ (
+        uId TEXT PRIMARY KEY, items TEXT, isActive INTEGER, isDelete INTEGER)""",
+    """CREATE TABLE wrb_data.診療予約 (
+        ID TEXT PRIMARY KEY, patientCd TEXT, 予約Kbn INTEGER, 診療x予約日 TEXT,
+        診療x予約時刻 TEXT, 診療x終了時刻 TEXT, 診療x予約項目 TEXT, 予約枠 TEXT,
+        コメント TEXT, コメント詳細 TEXT, z初回登録者Cd TEXT, z初回登録日時 TEXT,
+        z登録者Cd TEXT, z登録日時 TEXT, 診療x表示順 INTEGER, "delete" INTEGER)""",
+    "CREATE INDEX wrb_data.診療予約_日付_idx ON 診療予約 (診療x予約日, 診療x予約時刻)",
+]
+
+_TOP = re.compile(r'\bSELECT\s+TOP\s+(\d+)', re.IGNORECASE)
+_DELETE_COLUMN = re.compile(r'(?<!")\bdelete\b(?=\s*(=|<>|!=|,|\)|$))', re.IGNORECASE)
+
+def translate_sql(sql):
+    """IRIS向けのSQLをSQLiteで実行できる形に読み替える"""
+    match = _TOP.search(sql)
+    if match:
+        sql = f"{sql[:match.start()]}SELECT{sql[match.end():].rstrip()} LIMIT {match.group(1)}"
+    return _DELETE_COLUMN.sub('"delete"', sql)
+
+class IrisCompatCursor:
+    """SQLを読み替えてから実行するsqlite3カーソルのラッパー"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._cursor.execute(translate_sql(sql), list(params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate_sql(sql), [list(params) for params in seq_of_params])
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class IrisCompatConnection:
+    """cursor()がIrisCompatCursorを返すsqlite3接続のラッパー"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self):
+        return IrisCompatCursor(self._connection.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+class SyntheticDatabase:
+    """スキーマごとに1ファイルのSQLiteデータベース
+
+    接続ごとに各スキーマのファイルをATTACHするため、プールの複数接続から
+    並行して読み出せる。
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or tempfile.mkdtemp(prefix='ai_kurume_bench_')
+        self.main_path = os.path.join(self.directory, 'main.db')
+
+    def connect(self):
+        connection = sqlite3.connect(self.main_path, check_same_thread=False)
+        for schema in SCHEMAS:
+            path = os.path.join(self.directory, f"{schema}.db")
+            connection.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        return IrisCompatConnection(connection)
+
+    def create_tables(self):
+        connection = self.connect()
+        for statement in TABLES:
+            connection.execute(statement)
+        connection.commit()
+        connection.close()
+
+# 合成データの語彙
+FAMILY_NAMES = ['山田', '佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '中村', '小林', '加藤']
+GIVEN_NAMES = ['花子', '美咲', '陽子', '由美', '恵', '真由美', '愛', '彩', '結衣', '直子']
+FAMILY_KANA = ['ヤマダ', 'サトウ', 'スズキ', 'タカハシ', 'タナカ', 'イトウ', 'ワタナベ', 'ナカムラ', 'コバヤシ', 'カトウ']
+GIVEN_KANA = ['ハナコ', 'ミサキ', 'ヨウコ', 'ユミ', 'メグミ', 'マユミ', 'アイ', 'アヤ', 'ユイ', 'ナオコ']
+SECTIONS = ['Subject', 'Object', 'Assessment', 'Plan', '自由記載', '処方', '超音波']
+PHRASES = ['', '経過良好', 'LMP：5/6', '所見なし', '内膜 8.5mm', 'E2 250pg/ml', '次回 D3 来院', '採卵予定']
+APPOINTMENT_ITEMS = ['採卵', '移植', '診察', None]
+SLOTS = ['午前', '午後', None]
+
+def make_content(rng):
+    """JSONコンバーター形式（"..."で囲まれたJSON配列の連結）の記載内容を作る"""
+    arrays = []
+    for _ in range(rng.randint(1, 3)):
+        texts = [
+            {"Text": rng.choice(PHRASES), "Foreground": "#FF000000", "Size": "12"}
+            for _ in range(rng.randint(1, 6))
+        ]
+        array = json.dumps(texts, ensure_ascii=False, separators=(',', ':'))
+        arrays.append('"' + array.replace('"', '""') + '"')
+    return ",".join(arrays)
+
+def make_stamp(day, rng):
+    """updateStamp（YYYYMMDDhhmmssの数値）を作る"""
+    return int(f"{day:%Y%m%d}{rng.randint(9, 18):02d}{rng.randint(0, 59):02d}{rng.randint(0, 59):02d}")
+
+def generate(database, patients=500, records_per_patient=20, appointments_per_day=150,
+             days=30, start_date=date(2025, 5, 1), users=40, seed=0):
+    """合成データを投入する。件数を返す"""
+    rng = random.Random(seed)
+    connection = database.connect()
+    execute_many = connection.executemany
+
+    execute_many("INSERT INTO cresc_data.ユーザー VALUES (?, ?, ?, 1, 0)", [
+        (f"U{i}", f"C{i:04d}", f"職員{i}" if i % 5 else None) for i in range(users)
+    ])
+    execute_many("INSERT INTO view_cresc_data.ユーザー VALUES (?, ?, 1, 0)", [
+        (f"U{i}", f"{rng.choice(FAMILY_NAMES)}{rng.choice(GIVEN_NAMES)}") for i in range(users)
+    ])
+    execute_many("INSERT INTO cresc_data.診療科マスター VALUES (?, ?, 1, 0)",
+                 [('D1', '婦人科'), ('D2', '生殖医療科'), ('D3', '内科')])
+    execute_many("INSERT INTO cresc_data.カルテ記載種別マスター VALUES (?, ?, 1, 0)",
+                 [('T1', '自由記載'), ('T2', 'SOAP'), ('T3', '処方')])
+    execute_many("INSERT INTO cresc_data.カルテ記載タグマスター VALUES (?, ?, 1, 0)",
+                 [('G1', '重要'), ('G2', '要確認'), ('G3', '採卵周期')])
+
+    guests = []
+    for i in range(1, patients + 1):
+        family, given = rng.randrange(len(FAMILY_NAMES)), rng.randrange(len(GIVEN_NAMES))
+        guests.append((
+            f"P{i}", f"{i:08d}",
+            f"{FAMILY_NAMES[family]}{GIVEN_NAMES[given]}",
+            f"{FAMILY_KANA[family]} {GIVEN_KANA[given]}",
+            int(f"{rng.randint(1970, 2000)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"),
+            '女', 1, 0,
+        ))
+    execute_many("INSERT INTO view_cresc_data.ゲスト基本情報 VALUES (?, ?, ?, ?, ?, ?, ?, ?)", guests)
+
+    records, contents, tags = [], [], []
+    content_count = 0
+    for patient in range(1, patients + 1):
+        for index in range(records_per_patient):
+            # 過去に向かって数日おきに記録がある想定
+            record_day = start_date - timedelta(days=(records_per_patient - index) * 7)
+            stamp = make_stamp(record_day, rng)
+            content_ids = []
+            for _ in range(rng.randint(1, 5)):
+                content_count += 1
+                content_ids.append(f"K{content_count}")
+                contents.append((f"K{content_count}", rng.choice(SECTIONS), make_content(rng), stamp, 1, 0))
+            record_uid = f"R{patient}_{index}"
+            records.append((
+                record_uid, f"P{patient}", stamp,
+                rng.choice(['D1', 'D2', 'D3']), f"U{rng.randrange(users)}", rng.choice([f"U{rng.randrange(users)}", None]),
+                f"U{rng.randrange(users)}", rng.choice(['T1', 'T2', 'T3']), ",".join(content_ids),
+                rng.choice([0, 1, 3]), rng.choice([0, 1]), 1, 0,
+            ))
+            if rng.random() < 0.3:
+                tags.append((record_uid, rng.choice(['G1', 'G1,G2', 'G3']), 1, 0))
+    execute_many("INSERT INTO cresc_data.カルテ記載 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+    execute_many("INSERT INTO cresc_data.カルテ記載内容 VALUES (?, ?, ?, ?, ?, ?)", contents)
+    execute_many("INSERT INTO cresc_data.カルテ記載タグ VALUES (?, ?, ?, ?)", tags)
+
+    appointments = []
+    for day_offset in range(days):
+        day = (start_date + timedelta(days=day_offset)).isoformat()
+        for index in range(appointments_per_day):
+            minutes = 9 * 60 + (index * 480) // max(appointments_per_day, 1)
+            time_text = f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+            appointments.append((
+                f"A{day_offset}_{index}", f"{rng.randint(1, patients):08d}", rng.choice([1, 2, 3]),
+                day, time_text, time_text, rng.choice(APPOINTMENT_ITEMS), rng.choice(SLOTS),
+                None, None, f"C{rng.randrange(users):04d}", f"{day} 08:00:00",
+                f"C{rng.randrange(users):04d}", f"{day} 08:30:00", index, 0,
+            ))
+    execute_many("INSERT INTO wrb_data.診療予約 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", appointments)
+
+    connection.commit()
+    connection.close()
+    return {
+        'patients': len(guests),
+        'records': len(records),
+        'contents': len(contents),
+        'appointments': len(appointments),
+    }
+
+def build(directory=None, **sizes):
+    """テーブルを作成して合成データを投入したSyntheticDatabaseを返す"""
+    database = SyntheticDatabase(directory)
+    database.create_tables()
+    database.counts = generate(database, **sizes)
+    return database
+
+def install(database, max_size=10):
+    """cresc-sora / wrb-sora のプールを合成データベースに差し替え、キャッシュを空にする"""
+    from config.database import ConnectionPool, register_pool
+    from modules.chart_cache import chart_cache
+    from modules.content_cache import content_cache
+    from modules.master_cache import master_cache
+    from modules.search_cache import typeahead_cache
+
+    for db_name in ('cresc-sora', 'wrb-sora'):
+        register_pool(ConnectionPool(db_name, database.connect, min_size=0, max_size=max_size))
+
+    master_cache.clear()
+    content_cache.clear()
+    chart_cache.clear()
+    typeahead_cache.clear()
@@ -1,6 +1,12 @@
 # python/config/database.py
 import pyodbc
 import logging
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from config.query_stats import wrap_cursor
 
 logger = logging.getLogger(__name__)
 
@@ -24,31 +30,388 @@ DATABASE_CONFIGS = {
     }
 }
 
+# コネクションプール設定（DATABASE_CONFIGSの各エントリに'pool'キーで上書き可能）
+POOL_DEFAULTS = {
+    'min_size': 1,
+    'max_size': 10,
+    'timeout': 10.0,         # 接続貸出の最大待ち時間（秒）
+    'max_idle': 300.0,       # アイドル接続を破棄するまでの時間（秒）
+    'validation_query': "SELECT 1",
+}
+
+class PoolTimeoutError(Exception):
+    """接続の貸出待ちがタイムアウトした"""
+
+def build_connection_string(db_name):
+    """ODBC接続文字列を組み立てる"""
+    config = DATABASE_CONFIGS[db_name]
+    database = config['cache_name'] if db_name == 'cresc-sora' else config['namespace']
+
+    return (
+        f"DRIVER={{{config['driver_name']}}};"
+        f"SERVER={config['host']};"
+        f"PORT={config['port']};"
+        f"DATABASE={database};"
+        f"UID={config['username']};"
+        f"PWD={config['password']}"
+    )
+
+class PooledConnection:
+    """プールから貸し出された接続。close()で物理接続を閉じずにプールへ返却する
+
+    close()されないまま参照がなくなった場合は、物理接続を破棄してプールの枠を空ける。
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+        # selfを参照しない関数で後始末を登録する（返却漏れの保険）
+        self._finalizer = weakref.finalize(self, pool.reclaim_leaked, raw)
+
+    def cursor(self):
+        if self._released:
+            raise RuntimeError("返却済みの接続は使用できません")
+        # リクエスト単位のクエリ集計中であれば計測用のラッパーを返す
+        return wrap_cursor(self._raw.cursor(), self._pool.name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._finalizer.detach()
+            self._pool.release(self._raw)
+
+    def invalidate(self):
+        """接続を壊れたものとして破棄する（プールへは戻さない）"""
+        if not self._released:
+            self._released = True
+            self._finalizer.detach()
+            self._pool.discard(self._raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+class ConnectionPool:
+    """スレッドセーフなコネクションプール
+
+    connectは物理接続を生成する引数なしの関数。pyodbc以外（sqlite3等）でも動作する。
+    """
+
+    def __init__(self, name, connect, min_size=1, max_size=10, timeout=10.0,
+                 max_idle=300.0, validation_query="SELECT 1"):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"プールサイズの指定が不正です: min={min_size}, max={max_size}")
+
+        self.name = name
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.validation_query = validation_query
+
+        self._idle = deque()  # (raw接続, 返却時刻)
+        self._size = 0        # 貸出中 + アイドルの物理接続数
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.stats = {
+            'created': 0,
+            'acquired': 0,
+            'discarded': 0,
+            'evicted': 0,
+            'timeouts': 0,
+            'validation_failures': 0,
+            'leaked': 0,
+        }
+
+    def fill(self):
+        """min_sizeまで接続を事前生成する"""
+        with self._cond:
+            missing = self.min_size - self._size
+            self._size += max(missing, 0)
+
+        for _ in range(max(missing, 0)):
+            try:
+                raw = self._create()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            self.release(raw)
+
+    def acquire(self, timeout=None):
+        """接続を貸し出す。空きがなくmax_sizeに達している場合は待機する"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            raw = None
+            create = False
+
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError(f"プール {self.name} は閉じられています")
+
+                    self._evict_idle_locked()
+
+                    if self._idle:
+                        raw, _ = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"接続の取得がタイムアウトしました ({self.name}, {timeout}秒)"
+                        )
+                    self._cond.wait(remaining)
+
+            if create:
+                try:
+                    raw = self._create()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._validate(raw):
+                with self._cond:
+                    self.stats['validation_failures'] += 1
+                self.discard(raw)
+                continue
+
+            with self._cond:
+                self.stats['acquired'] += 1
+            return PooledConnection(self, raw)
+
+    def release(self, raw):
+        """接続をプールへ返却する"""
+        try:
+            # 未完了のトランザクションを残さない
+            raw.rollback()
+        except Exception as e:
+            logger.debug(f"返却時のrollbackに失敗したため破棄します ({self.name}): {e}")
+            self.discard(raw)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._close_raw(raw)
+            else:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, raw):
+        """接続を破棄する"""
+        self._close_raw(raw)
+        with self._cond:
+            self._size -= 1
+            self.stats['discarded'] += 1
+            self._cond.notify()
+
+    def reclaim_leaked(self, raw):
+        """返却されずに参照がなくなった接続を破棄する（状態が不明なためプールへは戻さない）"""
+        logger.warning(f"返却されていない接続を破棄しました ({self.name})")
+        with self._cond:
+            self.stats['leaked'] += 1
+        self.discard(raw)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """with文で接続を借りて自動返却する"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except Exception as e:
+            if _is_connection_error(e):
+                conn.invalidate()
+            raise
+        finally:
+            conn.close()
+
+    def close(self):
+        """アイドル接続を全て閉じ、以後の貸出を停止する"""
+        with self._cond:
+            self._closed = True
+            idle = [raw for raw, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+
+        for raw in idle:
+            self._close_raw(raw)
+
+    def status(self):
+        """プールの利用状況"""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'name': self.name,
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                **self.stats,
+            }
+
+    def _create(self):
+        raw = self._connect()
+        with self._cond:
+            self.stats['created'] += 1
+        logger.debug(f"新規接続を作成しました ({self.name})")
+        return raw
+
+    def _validate(self, raw):
+        if not self.validation_query:
+            return True
+        try:
+            cursor = raw.cursor()
+            try:
+                cursor.execute(self.validation_query)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"接続の検証に失敗しました ({self.name}): {e}")
+            return False
+
+    def _evict_idle_locked(self):
+        """max_idleを超えたアイドル接続をmin_sizeを下回らない範囲で破棄する（ロック保持中に呼ぶ）"""
+        if not self.max_idle:
+            return
+
+        now = time.monotonic()
+        # 最も古い接続は左端にある
+        while self._idle and self._size > self.min_size:
+            raw, released_at = self._idle[0]
+            if now - released_at < self.max_idle:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self.stats['evicted'] += 1
+            self._close_raw(raw)
+
+    def _close_raw(self, raw):
+        try:
+            raw.close()
+        except Exception as e:
+            logger.debug(f"接続のクローズに失敗しました ({self.name}): {e}")
+
+def _is_connection_error(error):
+    """接続自体が壊れている可能性のあるエラーか"""
+    if isinstance(error, pyodbc.Error) and error.args:
+        # SQLSTATE 08xxx: 接続例外
+        return str(error.args[0]).startswith('08')
+    return False
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_name='cresc-sora'):
+    """データベースごとのコネクションプールを取得（初回呼び出し時に作成）"""
+    pool = _pools.get(db_name)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None:
+            config = DATABASE_CONFIGS[db_name]
+            settings = {**POOL_DEFAULTS, **config.get('pool', {})}
+            connection_string = build_connection_string(db_name)
+            pool = ConnectionPool(
+                db_name,
+                lambda: pyodbc.connect(connection_string),
+                **settings
+            )
+            _pools[db_name] = pool
+    return pool
+
+def register_pool(pool):
+    """プールを差し替える（ローカルのSQLite等で動かす場合に使用）"""
+    with _pools_lock:
+        old = _pools.get(pool.name)
+        _pools[pool.name] = pool
+    if old is not None and old is not pool:
+        old.close()
+
+def warm_pools(db_names=None):
+    """各データベースのプールにmin_sizeまで接続を作っておく（起動時に呼ぶ）
+
+    接続できないデータベースがあっても起動は続ける（最初の貸出時に再度接続を試みる）。
+    """
+    for db_name in db_names or DATABASE_CONFIGS:
+        try:
+            pool = get_pool(db_name)
+            pool.fill()
+            logger.info(f"コネクションプールを準備しました ({db_name}, {pool.status()['size']}接続)")
+        except Exception as e:
+            logger.warning(f"コネクションプールの事前接続に失敗しました ({db_name}): {e}")
+
+def close_pools():
+    """全プールを閉じる"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+def pool_statuses():
+    """作成済みの全プールの利用状況（未使用のデータベースのプールは作らない）"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.status() for pool in pools}
+
 def get_db_connection(db_name='cresc-sora'):
-    """データベース接続を取得"""
+    """データベース接続を取得（プールから貸出。close()で返却される）"""
     try:
-        config = DATABASE_CONFIGS[db_name]
-        
-        if db_name == 'cresc-sora':
-            connection_string = (
-                f"DRIVER={{{config['driver_name']}}};"
-                f"SERVER={config['host']};"
-                f"PORT={config['port']};"
-                f"DATABASE={config['cache_name']};"
-                f"UID={config['username']};"
-                f"PWD={config['password']}"
-            )
-        else:  # wrb-sora
-            connection_string = (
-                f"DRIVER={{{config['driver_name']}}};"
-                f"SERVER={config['host']};"
-                f"PORT={config['port']};"
-                f"DATABASE={config['namespace']};"
-                f"UID={config['username']};"
-                f"PWD={config['password']}"
-            )
-        
-        return pyodbc.connect(connection_string)
+        return get_pool(db_name).acquire()
     except Exception as e:
         logger.error(f"データベース接続エラー ({db_name}): {e}")
-        raise
\ No newline at end of file
+        raise
+
+def close_quietly(*resources):
+    """カーソル・接続を順に閉じる（Noneと閉じ済みのものは無視する。finallyでの後始末用）"""
+    for resource in resources:
+        if resource is None:
+            continue
+        try:
+            resource.close()
+        except Exception as e:
+            logger.debug(f"クローズに失敗しました: {e}")
+
+@contextmanager
+def db_connection(db_name='cresc-sora', timeout=None):
+    """with文でプールの接続を借りる"""
+    with get_pool(db_name).connection(timeout) as conn:
+        yield conn
+
+# IN句1回あたりのパラメータ数上限
+IN_CLAUSE_CHUNK_SIZE = 200
+
+def chunked(values, size=IN_CLAUSE_CHUNK_SIZE):
+    """IN (...) 用に値のリストを一定サイズごとに分割する"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def in_placeholders(count):
+    """IN句のプレースホルダ文字列 '?, ?, ...' を返す"""
+    return ", ".join("?" * count)
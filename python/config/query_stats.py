@@ -0,0 +1,199 @@
+# python/config/query_stats.py
+import contextvars
+import re
+import threading
+import time
+
+# 同じSQLをパラメータだけ変えてこの回数以上実行したらN+1の疑いとする
+# （IN句の分割実行で数回繰り返すのは正常なので余裕を持たせる）
+N_PLUS_ONE_THRESHOLD = 10
+
+# N+1判定のために記憶するパラメータの種類数の上限（SQLごと）
+MAX_TRACKED_PARAMS = 50
+
+# パラメータがこの数以上の実行はIN句の一括取得（chunked・in_placeholdersで分割したもの）とみなし、
+# N+1の判定に数えない。1件ずつ取得するSQLのパラメータは数個程度
+BULK_PARAMS_MIN = 20
+
+_WHITESPACE = re.compile(r'\s+')
+
+_current = contextvars.ContextVar('query_stats', default=None)
+
+# SQL実行ごとに呼ばれる関数 (データベース名, 所要秒数) -> None
+_execute_listeners = []
+
+class QueryStats:
+    """1リクエスト中のSQL実行回数・DB時間・取得行数を集計する
+
+    並行処理のスレッドからも同じインスタンスに加算されるためロックで保護する。
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.databases = {}  # データベース名 -> {'statements', 'db_time', 'rows'}
+        self._queries = {}   # 正規化したSQL -> {'count', 'params', 'db_time'}
+        self._lock = threading.Lock()
+
+    def record_execute(self, db_name, sql, params, elapsed):
+        key = _WHITESPACE.sub(' ', sql).strip()
+        try:
+            params_key = tuple(params)
+            hash(params_key)
+        except TypeError:
+            params_key = repr(params)
+
+        with self._lock:
+            self.statements += 1
+            self.db_time += elapsed
+
+            database = self.databases.setdefault(db_name, {'statements': 0, 'db_time': 0.0, 'rows': 0})
+            database['statements'] += 1
+            database['db_time'] += elapsed
+
+            query = self._queries.setdefault(key, {'count': 0, 'bulk': 0, 'params': set(), 'db_time': 0.0})
+            query['count'] += 1
+            if isinstance(params_key, tuple) and len(params_key) >= BULK_PARAMS_MIN:
+                query['bulk'] += 1
+            query['db_time'] += elapsed
+            if len(query['params']) < MAX_TRACKED_PARAMS:
+                query['params'].add(params_key)
+
+        for listener in _execute_listeners:
+            listener(db_name, elapsed)
+
+    def record_rows(self, db_name, count, elapsed=0.0):
+        with self._lock:
+            self.rows += count
+            self.db_time += elapsed
+            database = self.databases.setdefault(db_name, {'statements': 0, 'db_time': 0.0, 'rows': 0})
+            database['rows'] += count
+            database['db_time'] += elapsed
+
+    def suspected_n_plus_one(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """パラメータだけを変えて繰り返し実行されたSQLの一覧（IN句の一括取得は除く）"""
+        with self._lock:
+            suspects = [
+                {
+                    'sql': sql[:200],
+                    'count': query['count'],
+                    'distinctParams': len(query['params']),
+                    'dbTimeMs': round(query['db_time'] * 1000, 1),
+                }
+                for sql, query in self._queries.items()
+                if query['count'] - query['bulk'] >= threshold and len(query['params']) > 1
+            ]
+        return sorted(suspects, key=lambda suspect: suspect['count'], reverse=True)
+
+    def header_value(self):
+        """レスポンスヘッダー用の短い要約"""
+        suspects = self.suspected_n_plus_one()
+        with self._lock:
+            return (
+                f"statements={self.statements}; time={self.db_time * 1000:.1f}ms; "
+                f"rows={self.rows}; n+1={len(suspects)}"
+            )
+
+    def to_dict(self):
+        suspects = self.suspected_n_plus_one()
+        with self._lock:
+            return {
+                'statements': self.statements,
+                'dbTimeMs': round(self.db_time * 1000, 1),
+                'rows': self.rows,
+                'databases': {
+                    name: {
+                        'statements': values['statements'],
+                        'dbTimeMs': round(values['db_time'] * 1000, 1),
+                        'rows': values['rows'],
+                    }
+                    for name, values in self.databases.items()
+                },
+                'nPlusOne': suspects,
+            }
+
+class InstrumentedCursor:
+    """実行したSQLと取得行数をQueryStatsに記録するカーソルのラッパー"""
+
+    def __init__(self, cursor, stats, db_name):
+        self._cursor = cursor
+        self._stats = stats
+        self._db_name = db_name
+
+    def execute(self, sql, *params):
+        # pyodbcはexecute(sql, (a, b))とexecute(sql, a, b)の両方を受け付ける
+        recorded = params[0] if len(params) == 1 and isinstance(params[0], (list, tuple)) else params
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(sql, *params)
+        finally:
+            self._stats.record_execute(self._db_name, sql, recorded, time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, seq_of_params)
+        finally:
+            self._stats.record_execute(self._db_name, sql, ('executemany', len(seq_of_params)), time.perf_counter() - started)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._stats.record_rows(self._db_name, 0 if row is None else 1, time.perf_counter() - started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)
+        self._stats.record_rows(self._db_name, len(rows), time.perf_counter() - started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._stats.record_rows(self._db_name, len(rows), time.perf_counter() - started)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats.record_rows(self._db_name, 1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+def add_execute_listener(listener):
+    """SQL実行ごとに listener(データベース名, 所要秒数) を呼び出すよう登録する"""
+    if listener not in _execute_listeners:
+        _execute_listeners.append(listener)
+
+def start_query_stats():
+    """現在のコンテキストで集計を開始する（戻り値のトークンはstop_query_statsに渡す）"""
+    stats = QueryStats()
+    return stats, _current.set(stats)
+
+def stop_query_stats(token):
+    _current.reset(token)
+
+def current_query_stats():
+    """集計中のQueryStats（集計していなければNone）"""
+    return _current.get()
+
+def wrap_cursor(cursor, db_name):
+    """集計中であればカーソルをInstrumentedCursorで包む"""
+    stats = _current.get()
+    if stats is None:
+        return cursor
+    return InstrumentedCursor(cursor, stats, db_name)
+
+def propagate_context(func):
+    """スレッドプールに渡す関数に現在のコンテキスト（集計先）を引き継ぐ"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+    return run
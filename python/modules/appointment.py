@@ -1,12 +1,90 @@
 # python/modules/appointment.py
 from flask import Blueprint, request, jsonify
 import logging
-from datetime import datetime
-from config.database import get_db_connection
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as date_type, datetime, timedelta
+from config.database import db_connection, chunked, in_placeholders
+from config.query_stats import propagate_context
+from modules.conditional import make_etag, is_not_modified, not_modified, with_etag, track_fallbacks, mark_fallback
+from modules.master_cache import master_cache
 
 logger = logging.getLogger(__name__)
 appointment_bp = Blueprint('appointment', __name__)
 
+# 予約一覧の取得クエリ（WHERE句の条件は呼び出し側で指定）
+APPOINTMENT_QUERY = """
+    SELECT 
+        ID, patientCd, 予約Kbn, 診療x予約日, 診療x予約時刻, 診療x終了時刻,
+        診療x予約項目, 予約枠, コメント, コメント詳細,
+        z初回登録者Cd, z初回登録日時, z登録者Cd, z登録日時,
+        診療x表示順
+    FROM wrb_data.診療予約
+    WHERE {conditions} AND delete = 0
+    ORDER BY 診療x予約日 ASC, 診療x予約時刻 ASC, 診療x表示順 ASC
+"""
+
+# 同期トークン（z登録日時）以降、今回のトークンまでに登録・変更・削除された予約（削除済みの行も含める）
+APPOINTMENT_CHANGES_QUERY = """
+    SELECT 
+        ID, patientCd, 予約Kbn, 診療x予約日, 診療x予約時刻, 診療x終了時刻,
+        診療x予約項目, 予約枠, コメント, コメント詳細,
+        z初回登録者Cd, z初回登録日時, z登録者Cd, z登録日時, delete,
+        診療x表示順
+    FROM wrb_data.診療予約
+    WHERE 診療x予約日 = ? AND z登録日時 >= ? AND z登録日時 <= ?
+    ORDER BY 診療x予約日 ASC, 診療x予約時刻 ASC, 診療x表示順 ASC
+"""
+
+# 同期トークン以降、今回のトークンまでに変更され、指定日以外の日付になっている予約（別の日へ移動した可能性がある）
+# 同期トークンより後に初回登録された予約はクライアントが持っていないため除く
+APPOINTMENT_MOVED_QUERY = """
+    SELECT ID, z登録日時
+    FROM wrb_data.診療予約
+    WHERE z登録日時 >= ? AND z登録日時 <= ? AND z初回登録日時 <= ? AND 診療x予約日 <> ?
+"""
+
+# 今回の同期トークン（全予約の最新の登録日時。削除済みの行も含める）
+SYNC_TOKEN_QUERY = """
+    SELECT MAX(z登録日時)
+    FROM wrb_data.診療予約
+"""
+
+# 予約一覧の版（件数と最新の登録日時）。追加・変更・削除で変わる
+APPOINTMENT_VERSION_QUERY = """
+    SELECT COUNT(*), MAX(z登録日時)
+    FROM wrb_data.診療予約
+    WHERE {conditions} AND delete = 0
+"""
+
+# カレンダー用の日ごとの予約件数（日付の範囲で検索し、インデックスを使えるようにする）
+CALENDAR_COUNTS_QUERY = """
+    SELECT 診療x予約日, COUNT(*)
+    FROM wrb_data.診療予約
+    WHERE 診療x予約日 >= ? AND 診療x予約日 < ? AND delete = 0
+    GROUP BY 診療x予約日
+"""
+
+# 月ごとの件数を保持する時間（秒）: 今月・来月は予約が増減するため短く、過去の月は長く
+CALENDAR_TTL_CURRENT = 60
+CALENDAR_TTL_FUTURE = 600
+CALENDAR_TTL_PAST = 24 * 3600
+# 1回のリクエストで取得できる月数
+CALENDAR_MAX_MONTHS = 12
+# 取得できる年の範囲（今年の前後の年数）
+CALENDAR_YEAR_RANGE = 10
+# キャッシュに保持する月数の上限（古い参照から削除する）
+CALENDAR_CACHE_MAX_ENTRIES = 2 * CALENDAR_YEAR_RANGE * 12
+
+# 期間指定の予約一覧で取得できる最大日数
+APPOINTMENT_MAX_RANGE_DAYS = 31
+
+# wrb-sora / cresc-sora への問い合わせを並行して行うスレッドプール
+APPOINTMENT_WORKERS = 8
+_executor = ThreadPoolExecutor(max_workers=APPOINTMENT_WORKERS, thread_name_prefix='appointment')
+
 @appointment_bp.route('/appointments/<date>', methods=['GET'])
 def get_appointments_by_date(date):
     """指定日の予約一覧を取得"""
@@ -19,82 +97,506 @@ def get_appointments_by_date(date):
         except ValueError:
             return jsonify({"error": "日付形式が無効です"}), 400
         
-        # Warabeeデータベースから予約情報を取得
-        wrb_conn = get_db_connection('wrb-sora')
-        wrb_cursor = wrb_conn.cursor()
+        # 前回から変わっていなければ一覧を組み立てずに304を返す（登録者名はマスターの版で判定）
+        track_fallbacks()
+        etag = make_etag('appointments', date, fetch_appointment_version("診療x予約日 = ?", [date]), master_cache.version())
+        if is_not_modified(etag):
+            logger.info(f"予約一覧は変更されていません: 日付 = {date}")
+            return not_modified(etag)
         
-        # CRESC-soraデータベースから患者・ユーザー情報を取得
-        cresc_conn = get_db_connection('cresc-sora')
-        cresc_cursor = cresc_conn.cursor()
+        appointments = load_appointments("診療x予約日 = ?", [date], label=date)
         
-        # 予約データを取得
-        appointment_query = """
-            SELECT 
-                ID, patientCd, 予約Kbn, 診療x予約日, 診療x予約時刻, 診療x終了時刻,
-                診療x予約項目, 予約枠, コメント, コメント詳細,
-                z初回登録者Cd, z初回登録日時, z登録者Cd, z登録日時,
-                診療x表示順
-            FROM wrb_data.診療予約
-            WHERE 診療x予約日 = ? AND delete = 0
-            ORDER BY 診療x予約時刻 ASC, 診療x表示順 ASC
-        """
+        logger.info(f"予約一覧取得完了: {len(appointments)}件")
+        return with_etag(jsonify({
+            "appointments": appointments,
+            "date": date,
+            "total": len(appointments)
+        }), etag)
         
-        wrb_cursor.execute(appointment_query, (date,))
-        appointments = []
+    except Exception as e:
+        logger.error(f"予約一覧取得エラー: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@appointment_bp.route('/appointments', methods=['GET'])
+def get_appointments_by_range():
+    """期間（from～to, 両端を含む）の予約一覧を日ごとにまとめて取得
+
+    予約は1回のSQLで取得し、患者・登録者情報も期間全体で1回だけ検索する。
+    """
+    try:
+        try:
+            start = datetime.strptime(request.args.get('from', ''), '%Y-%m-%d').date()
+            end = datetime.strptime(request.args.get('to', ''), '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({"error": "from・toをYYYY-MM-DD形式で指定してください"}), 400
         
-        columns = [column[0] for column in wrb_cursor.description]
+        days = (end - start).days + 1
+        if not 1 <= days <= APPOINTMENT_MAX_RANGE_DAYS:
+            return jsonify({"error": f"期間は1～{APPOINTMENT_MAX_RANGE_DAYS}日で指定してください"}), 400
         
-        for row in wrb_cursor.fetchall():
-            appointment = dict(zip(columns, row))
-            
-            # 患者情報を取得
-            patient_info = get_patient_info(appointment['patientCd'], cresc_cursor)
-            
-            # 登録者情報を取得
-            initial_user = get_user_info(appointment['z初回登録者Cd'], cresc_cursor)
-            current_user = get_user_info(appointment['z登録者Cd'], cresc_cursor)
-            
-            # 予約表示内容を決定
-            display_content = determine_appointment_display(
-                appointment, wrb_cursor, date, appointment['診療x予約時刻']
-            )
-            
-            # 結果をフォーマット
-            formatted_appointment = {
-                'id': appointment['ID'],
-                'patientCd': appointment['patientCd'],
-                'patientInfo': patient_info,
-                'appointmentDate': appointment['診療x予約日'],
-                'appointmentTime': format_time(appointment['診療x予約時刻']),
-                'endTime': format_time(appointment['診療x終了時刻']),
-                'displayContent': display_content,
-                'comment': appointment['コメント'] or '',
-                'commentDetail': appointment['コメント詳細'] or '',
-                'initialUser': initial_user,
-                'currentUser': current_user,
-                'initialRegDate': format_datetime(appointment['z初回登録日時']),
-                'currentRegDate': format_datetime(appointment['z登録日時']),
-                'displayOrder': appointment['診療x表示順'] or 0
-            }
-            
-            appointments.append(formatted_appointment)
+        conditions, params = "診療x予約日 >= ? AND 診療x予約日 <= ?", [start.isoformat(), end.isoformat()]
+        label = f"{start.isoformat()}～{end.isoformat()}"
+        logger.info(f"予約一覧取得: 期間 = {label}")
         
-        wrb_cursor.close()
-        wrb_conn.close()
-        cresc_cursor.close()
-        cresc_conn.close()
+        track_fallbacks()
+        etag = make_etag('appointments-range', start.isoformat(), end.isoformat(),
+                         fetch_appointment_version(conditions, params), master_cache.version())
+        if is_not_modified(etag):
+            logger.info(f"予約一覧は変更されていません: 期間 = {label}")
+            return not_modified(etag)
         
-        logger.info(f"予約一覧取得完了: {len(appointments)}件")
+        appointments = load_appointments(conditions, params, label=label)
+        
+        by_day = {(start + timedelta(days=offset)).isoformat(): [] for offset in range(days)}
+        for appointment in appointments:
+            by_day.setdefault(_format_day(appointment['appointmentDate']), []).append(appointment)
+        
+        logger.info(f"予約一覧取得完了: 期間 = {label}, {len(appointments)}件")
+        return with_etag(jsonify({
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "days": [
+                {"date": day, "appointments": day_appointments, "total": len(day_appointments)}
+                for day, day_appointments in by_day.items()
+            ],
+            "total": len(appointments)
+        }), etag)
+        
+    except Exception as e:
+        logger.error(f"予約一覧取得エラー: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@appointment_bp.route('/appointments/<date>/changes', methods=['GET'])
+def get_appointment_changes(date):
+    """指定日の予約のうち、同期トークン以降に登録・変更・削除されたものを返す
+
+    sinceには前回のレスポンスのsyncTokenを指定する（省略時は当日の全件）。
+    同じ時刻に登録された予約を取りこぼさないよう境界の時刻も含めて返すため、
+    クライアントはidで上書きすること。syncTokenは差分を取得する前の全予約の最新の
+    登録日時で、差分はsinceからsyncTokenまでの範囲に限る（取得中の変更は次回に含まれる）。
+    deletedには削除された予約に加え、since以降に別の日へ移動した可能性がある予約のIDも含む。
+    クライアントは持っていないIDを無視すること。
+    """
+    try:
+        try:
+            datetime.strptime(date, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({"error": "日付形式が無効です"}), 400
+        
+        since = request.args.get('since')
+        if since:
+            try:
+                since_value = datetime.fromisoformat(since)
+            except ValueError:
+                return jsonify({"error": "sinceの形式が無効です"}), 400
+            # 登録日時はタイムゾーンなしで保存されているため、syncTokenと同じ形式だけを受け付ける
+            if since_value.tzinfo is not None:
+                return jsonify({"error": "sinceにはタイムゾーンを含めず、前回のsyncTokenを指定してください"}), 400
+        else:
+            since_value = datetime.min
+        
+        # 差分より先に今回のトークンを確定する（取得の間に登録された変更は次回の差分に含まれる）
+        upper = fetch_sync_token()
+        if upper is None:
+            # 予約が1件もない場合は前回のトークン（初回は最小の日時）を返す
+            sync_token = since or format_sync_token(since_value)
+        else:
+            sync_token = format_sync_token(upper)
+        
+        if since and upper is None:
+            rows, moved = [], []
+        elif since:
+            rows = fetch_appointment_changes(date, since_value, upper)
+            moved = fetch_moved_appointments(date, since_value, upper)
+        else:
+            rows = [{**row, 'delete': 0} for row in fetch_appointment_rows("診療x予約日 = ?", [date])]
+            moved = []
+        deleted = [row for row in rows if row['delete']]
+        changed = [row for row in rows if not row['delete']]
+        deleted_ids = [row['ID'] for row in deleted] + [row['ID'] for row in moved]
+        
+        # 予約Kbn=3の表示は同じ時刻のKbn=1の予約に左右されるため、
+        # 差分の表示判定用に当日のKbn=1/3の予約を取得する
+        display_context = None
+        if since and any(row['予約Kbn'] in (1, 3) for row in rows):
+            day_rows = fetch_appointment_rows("診療x予約日 = ? AND 予約Kbn IN (1, 3)", [date])
+            display_context = build_display_context(day_rows)
+            # Kbn=1の追加・変更・削除で表示が変わりうる、同じ時刻のKbn=3の予約も送り直す
+            affected_times = {row['診療x予約時刻'] for row in rows if row['予約Kbn'] == 1}
+            changed_ids = {row['ID'] for row in rows}
+            changed += [
+                row for row in day_rows
+                if row['予約Kbn'] == 3 and row['診療x予約時刻'] in affected_times and row['ID'] not in changed_ids
+            ]
+        elif since:
+            display_context = build_display_context([])
+        
+        appointments = format_changed_appointments(changed, display_context, since_value)
+        
+        logger.info(
+            f"予約の差分取得: 日付 = {date}, since = {since}, 変更 {len(appointments)}件, "
+            f"削除 {len(deleted)}件, 他の日付 {len(moved)}件"
+        )
         return jsonify({
-            "appointments": appointments,
             "date": date,
-            "total": len(appointments)
+            "since": since,
+            "syncToken": sync_token,
+            "changes": appointments,
+            "deleted": deleted_ids,
+            "total": len(appointments) + len(deleted_ids)
         })
         
     except Exception as e:
-        logger.error(f"予約一覧取得エラー: {e}")
+        logger.error(f"予約の差分取得エラー: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def fetch_sync_token():
+    """全予約の最新の登録日時（予約がなければNone）"""
+    with db_connection('wrb-sora') as wrb_conn:
+        wrb_cursor = wrb_conn.cursor()
+        try:
+            wrb_cursor.execute(SYNC_TOKEN_QUERY)
+            row = wrb_cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            wrb_cursor.close()
+
+def fetch_appointment_changes(date, since, upper):
+    """wrb-soraからsince以降upper以前に登録日時が更新された予約の行を取得（削除済みを含む）"""
+    with db_connection('wrb-sora') as wrb_conn:
+        wrb_cursor = wrb_conn.cursor()
+        try:
+            wrb_cursor.execute(APPOINTMENT_CHANGES_QUERY, [date, since, upper])
+            columns = [column[0] for column in wrb_cursor.description]
+            return [dict(zip(columns, row)) for row in wrb_cursor.fetchall()]
+        finally:
+            wrb_cursor.close()
+
+def fetch_moved_appointments(date, since, upper):
+    """since以降upper以前に変更され、指定日以外の日付になっている予約の (ID, z登録日時)
+
+    移動前の日付は残っていないため、指定日の一覧から外すべき予約の候補として返す。
+    """
+    with db_connection('wrb-sora') as wrb_conn:
+        wrb_cursor = wrb_conn.cursor()
+        try:
+            wrb_cursor.execute(APPOINTMENT_MOVED_QUERY, [since, upper, since, date])
+            columns = [column[0] for column in wrb_cursor.description]
+            return [dict(zip(columns, row)) for row in wrb_cursor.fetchall()]
+        finally:
+            wrb_cursor.close()
+
+def format_changed_appointments(rows, display_context, since):
+    """差分の予約を整形し、新規（created）か変更（modified）かを付ける"""
+    if not rows:
+        return []
+    
+    patient_infos = _with_cresc_cursor(get_patient_infos, [row['patientCd'] for row in rows])
+    user_infos = _with_cresc_cursor(
+        get_user_infos, [row['z初回登録者Cd'] for row in rows] + [row['z登録者Cd'] for row in rows]
+    )
+    display_contexts = None
+    if display_context is not None:
+        display_contexts = {row['診療x予約日']: display_context for row in rows}
+    
+    appointments = format_appointments(rows, patient_infos, user_infos, display_contexts)
+    for appointment, row in zip(appointments, rows):
+        created = _as_datetime(row['z初回登録日時'])
+        appointment['changeType'] = 'created' if created is not None and created >= since else 'modified'
+    return appointments
+
+def format_sync_token(value):
+    """z登録日時を同期トークンの文字列にする"""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return str(value) if value is not None else None
+
+def _as_datetime(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+@appointment_bp.route('/appointments/calendar-dates', methods=['GET'])
+def get_calendar_dates():
+    """カレンダー用の予約がある日付と件数を月ごとに取得
+
+    months=2025-05,2025-06 で複数月をまとめて取得できる。
+    year・month を指定した場合（または省略時は今月）は1か月分を従来の形式で返す。
+    """
+    try:
+        if request.args.get('months'):
+            try:
+                months = [parse_month(value) for value in request.args.get('months').split(',') if value.strip()]
+            except ValueError:
+                return jsonify({"error": "monthsはYYYY-MMのカンマ区切りで指定してください"}), 400
+            if not 1 <= len(months) <= CALENDAR_MAX_MONTHS:
+                return jsonify({"error": f"monthsは1～{CALENDAR_MAX_MONTHS}か月で指定してください"}), 400
+        else:
+            today = datetime.now()
+            try:
+                months = [(int(request.args.get('year', today.year)), int(request.args.get('month', today.month)))]
+                date_type(months[0][0], months[0][1], 1)
+            except ValueError:
+                return jsonify({"error": "年月の指定が無効です"}), 400
+        
+        this_year = datetime.now().year
+        if any(abs(year - this_year) > CALENDAR_YEAR_RANGE for year, _ in months):
+            return jsonify({"error": f"年は{this_year - CALENDAR_YEAR_RANGE}～{this_year + CALENDAR_YEAR_RANGE}年で指定してください"}), 400
+        
+        counts = calendar_cache.get_months(months)
+        results = [
+            {"year": year, "month": month, "dates": counts[(year, month)]}
+            for year, month in dict.fromkeys(months)
+        ]
+        
+        if request.args.get('months'):
+            return jsonify({"months": results})
+        return jsonify(results[0])
+        
+    except Exception as e:
+        logger.error(f"カレンダー日付取得エラー: {e}")
         return jsonify({"error": str(e)}), 500
 
+def parse_month(value):
+    """YYYY-MM を (年, 月) にする（不正な値はValueError）"""
+    month = datetime.strptime(value.strip(), '%Y-%m')
+    return month.year, month.month
+
+def month_range(year, month):
+    """月初日と翌月初日（YYYY-MM-DD）"""
+    start = date_type(year, month, 1)
+    end = date_type(year + month // 12, month % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+def fetch_calendar_counts(start, end):
+    """期間内の日ごとの予約件数（YYYY-MM-DD -> 件数）"""
+    with db_connection('wrb-sora') as wrb_conn:
+        wrb_cursor = wrb_conn.cursor()
+        try:
+            wrb_cursor.execute(CALENDAR_COUNTS_QUERY, [start, end])
+            return {_format_day(day): count for day, count in wrb_cursor.fetchall()}
+        finally:
+            wrb_cursor.close()
+
+class CalendarCountCache:
+    """月ごとの日別予約件数のキャッシュ
+
+    キャッシュにない月はまとめて1回の範囲検索で取得する。
+    保持時間は月によって変える（今月・来月は短く、過去の月は長く）。
+    保持する月数が上限を超えたら、最も長く参照されていない月から削除する。
+    """
+
+    def __init__(self, fetch_func=fetch_calendar_counts, max_entries=CALENDAR_CACHE_MAX_ENTRIES):
+        self.fetch_func = fetch_func
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (年, 月) -> (有効期限, 日付ごとの件数のリスト)
+        self._lock = threading.Lock()
+
+    def get_months(self, months):
+        """(年, 月) -> [{'date', 'count'}, ...] を返す"""
+        now = time.monotonic()
+        with self._lock:
+            result = {
+                month: entry[1] for month, entry in
+                ((month, self._entries.get(month)) for month in months)
+                if entry is not None and entry[0] > now
+            }
+            for month in result:
+                self._entries.move_to_end(month)
+        
+        for run in _consecutive_runs(sorted(set(months) - set(result))):
+            # 連続する不足月は1回の範囲検索でまとめて取得する
+            start, _ = month_range(*run[0])
+            _, end = month_range(*run[-1])
+            counts = sorted(self.fetch_func(start, end).items())
+            
+            loaded = {
+                (year, month): [
+                    {'date': day, 'count': count}
+                    for day, count in counts if day.startswith(f"{year:04d}-{month:02d}-")
+                ]
+                for year, month in run
+            }
+            with self._lock:
+                for key, dates in loaded.items():
+                    self._entries[key] = (time.monotonic() + self.ttl_for(*key), dates)
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            result.update(loaded)
+        
+        return result
+
+    @staticmethod
+    def ttl_for(year, month):
+        today = datetime.now()
+        current = (today.year, today.month)
+        following = (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1)
+        if (year, month) in (current, following):
+            return CALENDAR_TTL_CURRENT
+        if (year, month) < current:
+            return CALENDAR_TTL_PAST
+        return CALENDAR_TTL_FUTURE
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+calendar_cache = CalendarCountCache()
+
+def _consecutive_runs(months):
+    """昇順の(年, 月)のリストを連続する月ごとに分ける"""
+    runs = []
+    for year, month in months:
+        if runs:
+            last_year, last_month = runs[-1][-1]
+            if (year, month) == ((last_year + 1, 1) if last_month == 12 else (last_year, last_month + 1)):
+                runs[-1].append((year, month))
+                continue
+        runs.append([(year, month)])
+    return runs
+
+def _format_day(value):
+    if isinstance(value, (datetime, date_type)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+def load_appointments(conditions, params, label=""):
+    """予約を取得して患者・登録者情報と結合した一覧を返す
+
+    wrb-soraからの予約取得とcresc-soraの準備（接続・マスターキャッシュ）を並行して行い、
+    その後の患者・ユーザーの一括検索も並行して実行する。
+    """
+    timings = {}
+    started = time.perf_counter()
+    
+    # 予約の取得とCRESC側の準備を並行実行
+    rows_future = _executor.submit(propagate_context(_timed), timings, '予約取得', fetch_appointment_rows, conditions, params)
+    warmup_future = _executor.submit(propagate_context(_timed), timings, 'CRESC準備', warm_up_cresc)
+    rows = rows_future.result()
+    warmup_future.result()
+    
+    # 患者・登録者情報を並行して一括取得
+    patients_future = _executor.submit(
+        propagate_context(_timed), timings, '患者検索',
+        _with_cresc_cursor, get_patient_infos, [row['patientCd'] for row in rows]
+    )
+    users_future = _executor.submit(
+        propagate_context(_timed), timings, 'ユーザー検索',
+        _with_cresc_cursor, get_user_infos,
+        [row['z初回登録者Cd'] for row in rows] + [row['z登録者Cd'] for row in rows]
+    )
+    patient_infos = patients_future.result()
+    user_infos = users_future.result()
+    
+    format_started = time.perf_counter()
+    appointments = format_appointments(rows, patient_infos, user_infos)
+    timings['整形'] = time.perf_counter() - format_started
+    timings['合計'] = time.perf_counter() - started
+    
+    logger.info(
+        f"予約一覧の所要時間 ({label}, {len(rows)}件): "
+        + ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+    )
+    return appointments
+
+def fetch_appointment_rows(conditions, params):
+    """wrb-soraから予約の行を取得"""
+    with db_connection('wrb-sora') as wrb_conn:
+        wrb_cursor = wrb_conn.cursor()
+        try:
+            wrb_cursor.execute(APPOINTMENT_QUERY.format(conditions=conditions), params)
+            columns = [column[0] for column in wrb_cursor.description]
+            return [dict(zip(columns, row)) for row in wrb_cursor.fetchall()]
+        finally:
+            wrb_cursor.close()
+
+def fetch_appointment_version(conditions, params):
+    """予約の版 (件数, 最新の登録日時) を1回のSQLで取得"""
+    with db_connection('wrb-sora') as wrb_conn:
+        wrb_cursor = wrb_conn.cursor()
+        try:
+            wrb_cursor.execute(APPOINTMENT_VERSION_QUERY.format(conditions=conditions), params)
+            count, latest = wrb_cursor.fetchone()
+            return int(count or 0), str(latest) if latest is not None else None
+        finally:
+            wrb_cursor.close()
+
+def warm_up_cresc():
+    """cresc-soraの接続とマスターキャッシュを用意しておく"""
+    master_cache.warm()
+    with db_connection('cresc-sora'):
+        pass
+
+def format_appointments(rows, patient_infos, user_infos, display_contexts=None):
+    """予約の行を一括取得済みの患者・登録者情報と結合してレスポンス形式にする
+
+    display_contextsを省略した場合は、rowsを日ごとの全予約とみなして表示判定用の情報を作る。
+    """
+    appointments = []
+    
+    # 予約表示の判定に使う予約枠情報（日ごと）
+    if display_contexts is None:
+        display_contexts = {}
+        for row in rows:
+            display_contexts.setdefault(row['診療x予約日'], []).append(row)
+        display_contexts = {day: build_display_context(day_rows) for day, day_rows in display_contexts.items()}
+    
+    for appointment in rows:
+        # 患者情報を取得
+        patient_info = lookup_patient_info(patient_infos, appointment['patientCd'])
+        
+        # 登録者情報を取得
+        initial_user = lookup_user_info(user_infos, appointment['z初回登録者Cd'])
+        current_user = lookup_user_info(user_infos, appointment['z登録者Cd'])
+        
+        # 予約表示内容を決定
+        display_content = determine_appointment_display(
+            appointment, display_contexts[appointment['診療x予約日']]
+        )
+        
+        # 結果をフォーマット
+        formatted_appointment = {
+            'id': appointment['ID'],
+            'patientCd': appointment['patientCd'],
+            'patientInfo': patient_info,
+            'appointmentDate': appointment['診療x予約日'],
+            'appointmentTime': format_time(appointment['診療x予約時刻']),
+            'endTime': format_time(appointment['診療x終了時刻']),
+            'displayContent': display_content,
+            'comment': appointment['コメント'] or '',
+            'commentDetail': appointment['コメント詳細'] or '',
+            'initialUser': initial_user,
+            'currentUser': current_user,
+            'initialRegDate': format_datetime(appointment['z初回登録日時']),
+            'currentRegDate': format_datetime(appointment['z登録日時']),
+            'displayOrder': appointment['診療x表示順'] or 0
+        }
+        
+        appointments.append(formatted_appointment)
+    
+    return appointments
+
+def _with_cresc_cursor(func, *args):
+    """cresc-soraの接続を借りてfunc(*args, cursor)を実行"""
+    with db_connection('cresc-sora') as cresc_conn:
+        cresc_cursor = cresc_conn.cursor()
+        try:
+            return func(*args, cresc_cursor)
+        finally:
+            cresc_cursor.close()
+
+def _timed(timings, stage, func, *args):
+    """funcを実行して所要時間をtimings[stage]に記録"""
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timings[stage] = time.perf_counter() - started
+
 def get_patient_info(patient_cd, cursor):
     """患者情報を取得（patientCd=ゲスト番号）"""
     if not patient_cd:
@@ -120,6 +622,7 @@ def get_patient_info(patient_cd, cursor):
             }
     except Exception as e:
         logger.debug(f"患者情報取得エラー: {e}")
+        mark_fallback()
     
     return {"name": "不明", "gender": "不明", "birthDate": "不明"}
 
@@ -142,40 +645,128 @@ def get_user_info(user_cd, cursor):
             return {"name": result[0], "code": str(user_cd)}
     except Exception as e:
         logger.debug(f"ユーザー情報取得エラー: {e}")
+        mark_fallback()
     
     return {"name": "不明", "code": str(user_cd) if user_cd else ""}
 
-def determine_appointment_display(appointment, cursor, date, time):
-    """予約表示内容を決定"""
-    kbn = appointment['予約Kbn']
-    
-    if kbn == 1:
-        return "診：診察"
-    elif kbn == 2:
-        return f"診：{appointment['予約枠'] or '予約'}"
-    elif kbn == 3:
-        # 同じ日時にKbn=1の予約があるかチェック
-        check_query = """
-            SELECT COUNT(*)
-            FROM wrb_data.診療予約
-            WHERE 診療x予約日 = ? AND 診療x予約時刻 = ? AND 予約Kbn = 1 AND delete = 0
-        """
-        
+def get_patient_infos(patient_cds, cursor):
+    """複数の患者情報をIN句でまとめて取得（ゲスト番号 -> 患者情報）"""
+    patient_cds = _distinct_codes(patient_cds)
+    patient_infos = {}
+    
+    for chunk in chunked(patient_cds):
         try:
-            cursor.execute(check_query, (date, time))
-            count = cursor.fetchone()[0]
+            patient_query = f"""
+                SELECT ゲスト番号, 漢字氏名, 性別, 生年月日
+                FROM view_cresc_data.ゲスト基本情報
+                WHERE ゲスト番号 IN ({in_placeholders(len(chunk))})
+                    AND isActive = 1 AND isDelete = 0
+            """
             
-            if count > 0:
-                # Kbn=1があるので、Kbn=3の予約枠を表示
-                return f"診：{appointment['予約枠'] or '予約'}"
-            else:
-                # Kbn=1がないので診察として表示
-                return "診：診察"
+            cursor.execute(patient_query, chunk)
+            for patient_cd, name, gender, birth_date in cursor.fetchall():
+                patient_infos.setdefault(str(patient_cd), {
+                    "name": name or "不明",
+                    "gender": gender or "不明",
+                    "birthDate": format_birth_date(birth_date)
+                })
         except Exception as e:
-            logger.debug(f"予約Kbn判定エラー: {e}")
-            return f"診：{appointment['予約枠'] or '予約'}"
+            logger.debug(f"患者情報一括取得エラー: {e}")
+            mark_fallback()
+    
+    return patient_infos
+
+def get_user_infos(user_cds, cursor):
+    """複数のユーザー情報をまとめて取得（Code -> ユーザー情報）
+
+    マスターキャッシュにないCodeだけをIN句で検索する。
+    """
+    cached_names, missing_cds = master_cache.lookup_many('user_code', user_cds)
+    user_names = {user_cd: name for user_cd, name in cached_names.items() if name}
     
-    return "診：予約"
+    for chunk in chunked(missing_cds):
+        try:
+            user_query = f"""
+                SELECT Code, name
+                FROM cresc_data.ユーザー
+                WHERE Code IN ({in_placeholders(len(chunk))}) AND isActive = 1
+            """
+            
+            cursor.execute(user_query, chunk)
+            fetched = {str(user_cd): name for user_cd, name in cursor.fetchall() if name}
+            master_cache.store('user_code', {user_cd: fetched.get(user_cd) for user_cd in chunk})
+            user_names.update(fetched)
+        except Exception as e:
+            logger.debug(f"ユーザー情報一括取得エラー: {e}")
+            mark_fallback()
+    
+    return {
+        user_cd: {"name": name, "code": user_cd}
+        for user_cd, name in user_names.items()
+    }
+
+def lookup_patient_info(patient_infos, patient_cd):
+    """一括取得した患者情報から1件を引く"""
+    if patient_cd:
+        patient_info = patient_infos.get(str(patient_cd))
+        if patient_info:
+            return patient_info
+    return {"name": "不明", "gender": "不明", "birthDate": "不明"}
+
+def lookup_user_info(user_infos, user_cd):
+    """一括取得したユーザー情報から1件を引く"""
+    if user_cd:
+        user_info = user_infos.get(str(user_cd))
+        if user_info:
+            return user_info
+    return {"name": "不明", "code": str(user_cd) if user_cd else ""}
+
+def _distinct_codes(codes):
+    """空値を除いた重複なしのコード一覧（出現順）"""
+    return list(dict.fromkeys(code for code in codes if code))
+
+def _display_consultation(appointment, context):
+    """診察として表示"""
+    return "診：診察"
+
+def _display_slot(appointment, context):
+    """予約枠名を表示"""
+    return f"診：{appointment['予約枠'] or '予約'}"
+
+def _display_shared_slot(appointment, context):
+    """同じ時刻にKbn=1の予約があれば予約枠、なければ診察として表示"""
+    if appointment['診療x予約時刻'] in context['consultation_times']:
+        return _display_slot(appointment, context)
+    return _display_consultation(appointment, context)
+
+# 予約Kbnごとの表示ルール（新しいKbnはここに追加する）
+APPOINTMENT_DISPLAY_RULES = {
+    1: _display_consultation,
+    2: _display_slot,
+    3: _display_shared_slot,
+}
+
+def build_display_context(appointments):
+    """取得済みの当日予約から表示判定用の情報を作る"""
+    return {
+        'consultation_times': {
+            appointment['診療x予約時刻']
+            for appointment in appointments
+            if appointment['予約Kbn'] == 1
+        }
+    }
+
+def determine_appointment_display(appointment, context):
+    """予約表示内容を決定"""
+    rule = APPOINTMENT_DISPLAY_RULES.get(appointment['予約Kbn'])
+    if rule is None:
+        return "診：予約"
+    
+    try:
+        return rule(appointment, context)
+    except Exception as e:
+        logger.debug(f"予約Kbn判定エラー: {e}")
+        return _display_slot(appointment, context)
 
 def format_time(time_obj):
     """時刻をフォーマット"""
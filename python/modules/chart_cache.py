@@ -0,0 +1,173 @@
+# python/modules/chart_cache.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+from config.database import chunked, in_placeholders
+from modules.record_content import split_content_ids
+from modules.response_encoding import dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+# 組み立て済みカルテの上限
+CHART_CACHE_MAX_ENTRIES = 200
+CHART_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# 診療科名・職員名などマスター由来の表示の変更を反映するまでの最大時間（秒）
+CHART_CACHE_TTL = 3600
+
+# 患者のカルテ全体の版（記載の最新のupdateStampと件数を1行で集計）
+CHART_VERSION_QUERY = """
+    SELECT MAX(記載.updateStamp), COUNT(*)
+    FROM cresc_data.カルテ記載 as 記載
+    WHERE
+        記載.患者uId = ?
+        AND 記載.isActive = 1
+        AND 記載.isDelete = 0
+"""
+
+# 直近の記載の記載内容リスト（最新のSOAPを探す範囲の版に使う）
+RECENT_CONTENT_LISTS_QUERY = """
+    SELECT TOP {depth} 記載.記載内容リスト
+    FROM cresc_data.カルテ記載 as 記載
+    WHERE
+        記載.患者uId = ?
+        AND 記載.isActive = 1
+        AND 記載.isDelete = 0
+    ORDER BY 記載.updateStamp DESC
+"""
+
+def fetch_chart_version(cursor, patient_uid, content_ids=()):
+    """患者のカルテの版 (最新のupdateStamp, 記載数, 記載内容の最新のupdateStamp, 記載内容数)
+
+    記載の部分はカルテ全体の集計、記載内容の部分は応答に含める記載（表示するページなど）の
+    記載内容リストにあるcontent_idsに限る。記載内容リストは記載内容との結合に索引が
+    使えないため、全記載の記載内容をSQLで集計すると記載内容の全件走査になる。
+    """
+    cursor.execute(CHART_VERSION_QUERY, (patient_uid,))
+    row = cursor.fetchone()
+    stamp, count = row if row else (None, 0)
+
+    content_stamp, content_count = fetch_content_version(cursor, content_ids)
+    return (_stamp_key(stamp), int(count or 0), content_stamp, content_count)
+
+def fetch_recent_content_ids(cursor, patient_uid, depth):
+    """新しい順にdepth件の記載の記載内容uId"""
+    cursor.execute(RECENT_CONTENT_LISTS_QUERY.format(depth=int(depth)), (patient_uid,))
+    return [cid for (content_list,) in cursor.fetchall() for cid in split_content_ids(content_list)]
+
+def fetch_content_version(cursor, content_ids):
+    """記載内容の版 (最新のupdateStamp, 有効な件数) をIN句でまとめて取得"""
+    content_ids = list(dict.fromkeys(str(cid) for cid in content_ids if cid))
+    latest, count = None, 0
+
+    for chunk in chunked(content_ids):
+        content_version_query = f"""
+            SELECT MAX(updateStamp), COUNT(*)
+            FROM cresc_data.カルテ記載内容
+            WHERE
+                uId IN ({in_placeholders(len(chunk))})
+                AND isActive = 1
+                AND isDelete = 0
+        """
+
+        cursor.execute(content_version_query, chunk)
+        row = cursor.fetchone()
+        if not row:
+            continue
+        stamp, chunk_count = row
+        if stamp is not None and (latest is None or stamp > latest):
+            latest = stamp
+        count += int(chunk_count or 0)
+
+    return (_stamp_key(latest), count)
+
+def _stamp_key(stamp):
+    if isinstance(stamp, float) and stamp.is_integer():
+        stamp = int(stamp)
+    return "" if stamp is None else str(stamp)
+
+class RenderedChartCache:
+    """組み立て済みの診療記録レスポンスを患者ごとに保持するLRUキャッシュ
+
+    エントリはカルテの版（fetch_chart_versionの結果）とともに保存し、取得時に
+    現在の版と一致する場合だけ返す。記載の追加・更新・削除と、応答に含まれる
+    記載内容の更新・削除で版が変わる。
+    """
+
+    def __init__(self, max_entries=CHART_CACHE_MAX_ENTRIES, max_bytes=CHART_CACHE_MAX_BYTES, ttl=CHART_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # キー -> (版, 保存時刻, 結果, サイズ)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # staleはmissesのうち版の不一致・期限切れで破棄したもの
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(patient_uid, response_format, records_filter):
+        """患者・形式・絞り込み条件ごとのキー"""
+        return (str(patient_uid), response_format, tuple(sorted(records_filter.items())))
+
+    def get(self, key, version):
+        """現在の版と一致する結果を返す（なければNone）。結果は変更しないこと"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            cached_version, stored_at, result, size = entry
+            if cached_version != version or time.monotonic() - stored_at >= self.ttl:
+                del self._entries[key]
+                self._bytes -= size
+                self.stats['misses'] += 1
+                self.stats['stale'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return result
+
+    def put(self, key, version, result):
+        """結果を保存（versionは組み立て前に取得したもの）"""
+        size = len(dumps_bytes(result))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+
+            self._entries[key] = (version, time.monotonic(), result, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[3]
+                self.stats['evictions'] += 1
+
+    def status(self):
+        """キャッシュの状態とヒット率"""
+        with self._lock:
+            stats = dict(self.stats)
+            entries, size = len(self._entries), self._bytes
+
+        total = stats['hits'] + stats['misses']
+        return {
+            **stats,
+            'hit_ratio': round(stats['hits'] / total, 4) if total else None,
+            'entries': entries,
+            'bytes': size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+# アプリ全体で共有するキャッシュ
+chart_cache = RenderedChartCache()
@@ -0,0 +1,68 @@
+# python/modules/conditional.py
+import contextvars
+import hashlib
+import logging
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+# ETagの計算方法やレスポンス形式を変えたときに上げる（既存のETagを無効にする）
+ETAG_VERSION = 1
+
+# 検索エラーで「不明」などの代用値を使ったかどうか（リクエストごと）
+_fallback = contextvars.ContextVar('etag_fallback', default=None)
+
+def make_etag(*parts):
+    """データの版情報からETagを作る
+
+    本文ではなく版情報（最新の更新日時・件数など）から作るため、組み立て前に判定できる。
+    圧縮の有無で本文のバイト列は変わるため弱いETagとする。
+    """
+    digest = hashlib.sha1(repr((ETAG_VERSION,) + parts).encode('utf-8')).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def is_not_modified(etag):
+    """If-None-Matchがetagと一致するか"""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = {_opaque_tag(tag) for tag in header.split(',')}
+    return '*' in tags or _opaque_tag(etag) in tags
+
+def not_modified(etag):
+    """304 Not Modified のレスポンス"""
+    return with_etag(Response(status=304), etag)
+
+def with_etag(response, etag):
+    """レスポンスにETagを付ける（キャッシュする場合も毎回再検証させる）
+
+    代用値を使った応答はETagを付けずno-storeにし、次回は必ず取得し直させる。
+    """
+    if fallback_used():
+        logger.info("代用値を含む応答のためETagを付けません")
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def track_fallbacks():
+    """このリクエストで代用値を使ったかの記録を開始する
+
+    スレッドプールに渡す処理（propagate_context）からの記録も同じリクエストに加算される。
+    """
+    _fallback.set({'used': False})
+
+def mark_fallback():
+    """検索に失敗して代用値を使ったことを記録する（記録中でなければ何もしない）"""
+    state = _fallback.get()
+    if state is not None:
+        state['used'] = True
+
+def fallback_used():
+    state = _fallback.get()
+    return state is not None and state['used']
+
+def _opaque_tag(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
@@ -0,0 +1,222 @@
+# python/modules/content_cache.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config.database import chunked, in_placeholders
+
+logger = logging.getLogger(__name__)
+
+# 解析済み記載内容キャッシュの上限
+CONTENT_CACHE_MAX_ENTRIES = 100000
+CONTENT_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# 指定するとSQLiteファイルに保存して再起動後も再利用する
+# ファイルには解析済みのカルテ本文（患者の診療情報）が平文で入る。所有者のみ読み書きできる
+# 権限（0600）で作成するが、暗号化されたボリュームかアクセスを制限したディレクトリに置くこと
+CONTENT_CACHE_DB_PATH = os.environ.get('CONTENT_CACHE_DB_PATH')
+# SQLiteに保存する上限（件数）と保存期間（秒）。超えたものは保存の古い順に削除する
+CONTENT_CACHE_DB_MAX_ENTRIES = int(os.environ.get('CONTENT_CACHE_DB_MAX_ENTRIES', 500000))
+CONTENT_CACHE_DB_MAX_AGE = float(os.environ.get('CONTENT_CACHE_DB_MAX_AGE', 30 * 24 * 3600))
+# 古いエントリの削除を行う間隔（秒）
+CONTENT_CACHE_DB_PRUNE_INTERVAL = 600
+
+class ParsedContentCache:
+    """解析済みのカルテ記載内容を(uId, updateStamp)で保持するLRUキャッシュ
+
+    件数とバイト数の両方で上限を設ける。db_pathを指定するとSQLiteにも書き込み、
+    メモリにないエントリはSQLiteから読み戻す。SQLiteのエントリは件数と保存期間で削除する。
+    SQLiteへのアクセスはメモリ上のLRUとは別のロックで行う。
+    """
+
+    def __init__(self, max_entries=CONTENT_CACHE_MAX_ENTRIES, max_bytes=CONTENT_CACHE_MAX_BYTES, db_path=None,
+                 db_max_entries=CONTENT_CACHE_DB_MAX_ENTRIES, db_max_age=CONTENT_CACHE_DB_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db_max_entries = db_max_entries
+        self.db_max_age = db_max_age
+
+        self._entries = OrderedDict()  # uId -> (version, section, text, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._last_prune = 0.0
+        if db_path:
+            self._db = _open_private_db(db_path)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS parsed_content (
+                    uid TEXT PRIMARY KEY,
+                    version TEXT,
+                    section TEXT,
+                    text TEXT,
+                    stored_at REAL
+                )
+            """)
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(parsed_content)")}
+            if 'stored_at' not in columns:
+                # 保存日時のない旧形式のエントリは次回の削除で対象になる
+                self._db.execute("ALTER TABLE parsed_content ADD COLUMN stored_at REAL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS parsed_content_stored_at ON parsed_content (stored_at)")
+            self._db.commit()
+            self.prune()
+            logger.info(f"記載内容キャッシュをSQLiteに保存します: {db_path}")
+
+        self.stats = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'evictions': 0, 'disk_evictions': 0}
+
+    def contains_many(self, uids):
+        """バージョンを問わずエントリを持っているuIdの集合"""
+        uids = [str(uid) for uid in uids]
+        with self._lock:
+            found = {uid for uid in uids if uid in self._entries}
+
+        remaining = [uid for uid in uids if uid not in found]
+        if self._db is not None and remaining:
+            with self._db_lock:
+                for chunk in chunked(remaining):
+                    rows = self._db.execute(
+                        f"SELECT uid FROM parsed_content WHERE uid IN ({in_placeholders(len(chunk))})", chunk
+                    ).fetchall()
+                    found.update(row[0] for row in rows)
+        return found
+
+    def get(self, uid, version):
+        """(記載区分, 解析済みテキスト) を返す。ないかバージョンが違えばNone"""
+        uid, version = str(uid), _version_key(version)
+
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(uid)
+                self.stats['hits'] += 1
+                return entry[1], entry[2]
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT section, text FROM parsed_content WHERE uid = ? AND version = ?",
+                    (uid, version)
+                ).fetchone()
+            if row is not None:
+                with self._lock:
+                    self._store_locked(uid, version, row[0], row[1])
+                    self.stats['disk_hits'] += 1
+                return row[0], row[1]
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put_many(self, entries):
+        """(uId, updateStamp, 記載区分, 解析済みテキスト) をまとめて登録"""
+        rows = [(str(uid), _version_key(version), section, text) for uid, version, section, text in entries]
+        if not rows:
+            return
+
+        with self._lock:
+            for uid, version, section, text in rows:
+                self._store_locked(uid, version, section, text)
+
+        if self._db is not None:
+            stored_at = time.time()
+            with self._db_lock:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO parsed_content (uid, version, section, text, stored_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [row + (stored_at,) for row in rows]
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"記載内容キャッシュの保存に失敗しました: {e}")
+            if time.monotonic() - self._last_prune >= CONTENT_CACHE_DB_PRUNE_INTERVAL:
+                self.prune()
+
+    def prune(self):
+        """SQLiteから保存期間を過ぎたエントリと、件数の上限を超えた古いエントリを削除"""
+        if self._db is None:
+            return
+        self._last_prune = time.monotonic()
+        with self._db_lock:
+            try:
+                deleted = self._db.execute(
+                    "DELETE FROM parsed_content WHERE stored_at < ?", (time.time() - self.db_max_age,)
+                ).rowcount
+                count = self._db.execute("SELECT COUNT(*) FROM parsed_content").fetchone()[0]
+                if count > self.db_max_entries:
+                    deleted += self._db.execute(
+                        "DELETE FROM parsed_content WHERE uid IN "
+                        "(SELECT uid FROM parsed_content ORDER BY stored_at LIMIT ?)",
+                        (count - self.db_max_entries,)
+                    ).rowcount
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"記載内容キャッシュの削除に失敗しました: {e}")
+                return
+        if deleted:
+            with self._lock:
+                self.stats['disk_evictions'] += deleted
+            logger.info(f"記載内容キャッシュ（SQLite）から{deleted}件を削除しました")
+
+    def status(self):
+        """キャッシュの状態とヒット率"""
+        with self._lock:
+            stats = dict(self.stats)
+            entries, size = len(self._entries), self._bytes
+
+        total = stats['hits'] + stats['disk_hits'] + stats['misses']
+        return {
+            **stats,
+            'hit_ratio': round((stats['hits'] + stats['disk_hits']) / total, 4) if total else None,
+            'entries': entries,
+            'bytes': size,
+            'persistent': self._db is not None,
+        }
+
+    def clear(self):
+        """メモリ上のエントリを破棄"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store_locked(self, uid, version, section, text):
+        size = len(uid) + len(version) + len((section or "").encode('utf-8')) + len((text or "").encode('utf-8'))
+
+        old = self._entries.pop(uid, None)
+        if old is not None:
+            self._bytes -= old[3]
+
+        if size > self.max_bytes:
+            return
+
+        self._entries[uid] = (version, section, text, size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[3]
+            self.stats['evictions'] += 1
+
+def _open_private_db(path):
+    """所有者のみ読み書きできる権限でSQLiteファイルを開く（ジャーナルも同じ権限で作られる）"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    os.close(fd)
+    try:
+        os.chmod(path, 0o600)
+    except OSError as e:
+        logger.warning(f"記載内容キャッシュの権限を変更できません ({path}): {e}")
+    return sqlite3.connect(path, check_same_thread=False)
+
+def _version_key(version):
+    """updateStampを比較用の文字列にする"""
+    if version is None:
+        return ""
+    if isinstance(version, float) and version.is_integer():
+        version = int(version)
+    return str(version)
+
+# アプリ全体で共有するキャッシュ
+content_cache = ParsedContentCache(db_path=CONTENT_CACHE_DB_PATH)
@@ -0,0 +1,146 @@
+# python/modules/content_parser.py
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_decoder = json.JSONDecoder()
+
+# 解析できない断片からTextを拾うための正規表現
+_TEXT_PATTERN = re.compile(r'"Text"\s*:\s*"([^"]*)"')
+
+# 括弧の対応を探すときに注目する文字
+_BRACKET_TOKENS = re.compile(r'[\[\]"\\]')
+
+_EXCESS_NEWLINES = re.compile(r'\n{3,}')
+
+def split_json_arrays(content):
+    """カンマ等で連結された複数のJSON配列を1パスで分割する
+
+    例: [{"Text":"a"}]","[{"Text":"b"}] -> 2つの断片
+    (断片の文字列, 解析結果) のリストを返す。JSONとして解析できない断片の解析結果はNone。
+    """
+    fragments = []
+    pos = 0
+
+    while True:
+        start = content.find('[', pos)
+        if start < 0:
+            break
+
+        try:
+            value, end = _decoder.raw_decode(content, start)
+        except json.JSONDecodeError:
+            end = _find_closing_bracket(content, start)
+            value = None
+
+        fragments.append((content[start:end], value))
+        pos = end
+
+    if not fragments:
+        # JSON配列が見つからなかった場合は全体を1つとして扱う
+        try:
+            value = json.loads(content)
+        except json.JSONDecodeError:
+            value = None
+        fragments.append((content, value))
+
+    return fragments
+
+def _find_closing_bracket(content, start):
+    """startの'['に対応する']'の次の位置（閉じていなければ末尾）"""
+    depth = 0
+    in_quotes = False
+    escaped_until = -1
+
+    for match in _BRACKET_TOKENS.finditer(content, start):
+        index = match.start()
+        if index < escaped_until:
+            continue
+
+        char = match.group()
+        if char == '\\':
+            escaped_until = index + 2
+        elif char == '"':
+            in_quotes = not in_quotes
+        elif not in_quotes:
+            if char == '[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+
+    return len(content)
+
+def iter_texts(fragments):
+    """分割した断片からTextの値を順に取り出す（空のTextは空文字列として残す）"""
+    for fragment, value in fragments:
+        if value is None:
+            logger.debug(f"JSON解析エラー, 内容: {fragment[:100]}...")
+            texts = _TEXT_PATTERN.findall(fragment)
+        elif isinstance(value, list):
+            texts = [item['Text'] for item in value if isinstance(item, dict) and 'Text' in item]
+        elif isinstance(value, dict) and 'Text' in value:
+            # 単一のオブジェクトの場合
+            texts = [value['Text']]
+        else:
+            texts = []
+
+        for text in texts:
+            if not isinstance(text, str):
+                text = str(text)
+            if text == "":
+                yield ""
+            elif text.strip():
+                yield text.strip()
+
+def join_paragraphs(texts):
+    """JSONコンバーターの規則に従って結合する
+
+    連続する非空行は改行で結合し、空のTextは段落の区切りとして扱う。
+    """
+    result_parts = []
+    current_paragraph = []
+
+    for text in texts:
+        if text == "":
+            if current_paragraph:
+                result_parts.append('\n'.join(current_paragraph))
+                current_paragraph = []
+            result_parts.append("")
+        else:
+            current_paragraph.append(text)
+
+    if current_paragraph:
+        result_parts.append('\n'.join(current_paragraph))
+
+    # 連続する改行を整理
+    return _EXCESS_NEWLINES.sub('\n\n', '\n'.join(result_parts))
+
+def extract_text_from_json(content):
+    """JSON配列からテキストを抽出する - JSONコンバーター形式に対応"""
+    if not content:
+        return ""
+
+    # 文字列でない場合はそのまま返す
+    if not isinstance(content, str):
+        return str(content)
+
+    # JSONフォーマットでない場合はそのまま返す
+    if '"Text"' not in content:
+        return content
+
+    try:
+        # 一番外側の引用符を除去し、エスケープされた引用符を元に戻す
+        cleaned_content = content.strip()
+        if cleaned_content.startswith('"') and cleaned_content.endswith('"'):
+            cleaned_content = cleaned_content[1:-1]
+        cleaned_content = cleaned_content.replace('""', '"')
+
+        return join_paragraphs(iter_texts(split_json_arrays(cleaned_content)))
+
+    except Exception as e:
+        logger.error(f"JSONテキスト抽出エラー: {e}")
+        return content
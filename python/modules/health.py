@@ -1,60 +1,173 @@
 # python/modules/health.py
 from flask import Blueprint, jsonify
 import logging
-from config.database import get_db_connection
+import threading
+import time
+from datetime import datetime
+from config.database import DATABASE_CONFIGS, PoolTimeoutError, db_connection, get_pool
 
 logger = logging.getLogger(__name__)
 health_bp = Blueprint('health', __name__)
 
+# レディネスチェックで接続の空きを待つ時間（秒）。空かなければbusyとして準備完了扱い
+READINESS_POOL_WAIT = 0.5
+
+# 件数統計の再計算間隔（秒）
+STATS_REFRESH_INTERVAL = 600
+
+# 件数統計のクエリ（データベース名, キー, SQL）
+STATS_QUERIES = [
+    ('cresc-sora', 'patient_count',
+     "SELECT COUNT(*) FROM view_cresc_data.ゲスト基本情報 WHERE isActive = 1 AND isDelete = 0"),
+    ('cresc-sora', 'record_count',
+     "SELECT COUNT(*) FROM cresc_data.カルテ記載 WHERE isActive = 1 AND isDelete = 0"),
+    ('wrb-sora', 'appointment_count',
+     "SELECT COUNT(*) FROM wrb_data.診療予約 WHERE delete = 0"),
+]
+
+_stats = {'counts': {}, 'computedAt': None, 'durationSeconds': None, 'errors': {}}
+_stats_lock = threading.Lock()
+_stats_thread = None
+
+def ping_database(db_name, timeout=READINESS_POOL_WAIT):
+    """プールから接続を借りて疎通を確認し、状態と応答時間を返す
+
+    貸出時の検証（validation_query）か新規接続の確立を疎通確認とみなし、SELECT 1を重ねて実行しない。
+    プールの接続がすべて使用中の場合は処理中のリクエストがあるだけなので準備完了（busy）とする。
+    """
+    pool = get_pool(db_name)
+    started = time.perf_counter()
+    try:
+        with pool.connection(timeout=timeout) as conn:
+            if not pool.validation_query:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+                cursor.close()
+    except PoolTimeoutError:
+        return {"status": "busy", "latencyMs": None}
+    return {"status": "ok", "latencyMs": round((time.perf_counter() - started) * 1000, 1)}
+
+def check_readiness():
+    """全データベースへの疎通を確認（接続を取得できればbusyでも準備完了とする）"""
+    databases = {}
+    ready = True
+
+    for db_name in DATABASE_CONFIGS:
+        try:
+            databases[db_name] = ping_database(db_name)
+        except Exception as e:
+            logger.warning(f"レディネスチェック失敗 ({db_name}): {e}")
+            databases[db_name] = {"status": "error", "message": str(e)}
+            ready = False
+
+    return ready, databases
+
+def refresh_stats():
+    """件数統計を再計算してキャッシュする"""
+    started = time.perf_counter()
+    counts = {}
+    errors = {}
+
+    for db_name, key, query in STATS_QUERIES:
+        try:
+            with db_connection(db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute(query)
+                counts[key] = cursor.fetchone()[0]
+                cursor.close()
+        except Exception as e:
+            logger.warning(f"件数統計の取得に失敗しました ({key}): {e}")
+            errors[key] = str(e)
+
+    with _stats_lock:
+        # 失敗した項目は前回の値を残す
+        _stats['counts'] = {**_stats['counts'], **counts}
+        _stats['errors'] = errors
+        _stats['computedAt'] = datetime.now().isoformat(timespec='seconds')
+        _stats['durationSeconds'] = round(time.perf_counter() - started, 3)
+
+def start_stats_refresher(interval=STATS_REFRESH_INTERVAL):
+    """件数統計をバックグラウンドで定期更新するスレッドを開始"""
+    global _stats_thread
+
+    with _stats_lock:
+        if _stats_thread is not None:
+            return
+
+        def refresh_loop():
+            while True:
+                refresh_stats()
+                time.sleep(interval)
+
+        _stats_thread = threading.Thread(target=refresh_loop, name='health-stats-refresh', daemon=True)
+        _stats_thread.start()
+
+def get_cached_stats():
+    """キャッシュ済みの件数統計（未計算なら値はNone）"""
+    start_stats_refresher()
+    with _stats_lock:
+        return {
+            'counts': dict(_stats['counts']),
+            'computedAt': _stats['computedAt'],
+            'durationSeconds': _stats['durationSeconds'],
+            'errors': dict(_stats['errors']),
+        }
+
+@health_bp.route('/health/live', methods=['GET'])
+def liveness_check():
+    """プロセスの生存確認（DBには接続しない）"""
+    return jsonify({"status": "ok"})
+
+@health_bp.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """プールの接続で各データベースへの疎通を確認"""
+    ready, databases = check_readiness()
+    pools = {db_name: get_pool(db_name).status() for db_name in DATABASE_CONFIGS}
+
+    return jsonify({
+        "status": "ok" if ready else "error",
+        "databases": databases,
+        "pools": pools
+    }), 200 if ready else 503
+
+@health_bp.route('/health/stats', methods=['GET'])
+def stats_check():
+    """バックグラウンドで集計した件数統計"""
+    return jsonify(get_cached_stats())
+
 @health_bp.route('/health', methods=['GET'])
 def health_check():
     try:
-        # CRESC-sora接続テスト
-        cresc_conn = get_db_connection('cresc-sora')
-        cresc_cursor = cresc_conn.cursor()
-        
-        cresc_cursor.execute("SELECT 1 as test")
-        cresc_result = cresc_cursor.fetchone()
-        
-        cresc_cursor.execute("SELECT COUNT(*) FROM view_cresc_data.ゲスト基本情報 WHERE isActive = 1 AND isDelete = 0")
-        patient_count = cresc_cursor.fetchone()[0]
-        
-        cresc_cursor.close()
-        cresc_conn.close()
-        
-        # Warabee接続テスト
-        try:
-            wrb_conn = get_db_connection('wrb-sora')
-            wrb_cursor = wrb_conn.cursor()
-            
-            wrb_cursor.execute("SELECT 1 as test")
-            wrb_result = wrb_cursor.fetchone()
-            
-            wrb_cursor.execute("SELECT COUNT(*) FROM wrb_data.診療予約 WHERE delete = 0")
-            appointment_count = wrb_cursor.fetchone()[0]
-            
-            wrb_cursor.close() 
-            wrb_conn.close()
-            
+        ready, databases = check_readiness()
+        stats = get_cached_stats()
+        counts = stats['counts']
+
+        cresc = databases.get('cresc-sora', {})
+        if cresc.get('status') == 'error' or not cresc:
+            raise RuntimeError(cresc.get('message', 'cresc-sora に接続できません'))
+
+        wrb = databases.get('wrb-sora', {})
+        if wrb.get('status') in ('ok', 'busy'):
             warabee_status = "成功"
-        except Exception as wrb_error:
-            logger.warning(f"Warabee接続エラー: {wrb_error}")
-            appointment_count = 0
-            warabee_status = f"失敗: {str(wrb_error)}"
-        
+        else:
+            logger.warning(f"Warabee接続エラー: {wrb.get('message')}")
+            warabee_status = f"失敗: {wrb.get('message')}"
+
         return jsonify({
-            "status": "ok", 
+            "status": "ok",
             "message": "Python サーバーは正常に動作しています",
             "cresc_db_connection": "成功",
             "warabee_db_connection": warabee_status,
-            "patient_count": patient_count,
-            "appointment_count": appointment_count,
-            "cresc_test_result": cresc_result[0] if cresc_result else None
+            "patient_count": counts.get('patient_count'),
+            "record_count": counts.get('record_count'),
+            "appointment_count": counts.get('appointment_count', 0),
+            "stats_computed_at": stats['computedAt']
         })
     except Exception as e:
         logger.error(f"ヘルスチェックエラー: {e}")
         return jsonify({
-            "status": "error", 
+            "status": "error",
             "message": f"データベース接続エラー: {str(e)}",
             "db_connection": "失敗"
-        })
\ No newline at end of file
+        })
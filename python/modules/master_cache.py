@@ -0,0 +1,274 @@
+# python/modules/master_cache.py
+import hashlib
+import logging
+import threading
+import time
+from config.database import db_connection
+from modules.conditional import mark_fallback
+
+logger = logging.getLogger(__name__)
+
+# マスターテーブルの一括読込クエリと1件検索クエリ
+# bulk: (キー, 値) を返すクエリ。後のクエリの非空値が優先される
+# single: キー1件を引くクエリ。先に非空値を返したものを採用する
+MASTER_TABLES = {
+    'department': {
+        'bulk': [
+            "SELECT uId, name FROM cresc_data.診療科マスター WHERE isActive = 1 AND isDelete = 0",
+        ],
+        'single': [
+            "SELECT name FROM cresc_data.診療科マスター WHERE uId = ? AND isActive = 1 AND isDelete = 0",
+        ],
+    },
+    'user': {
+        # nameがない場合はview_cresc_dataの漢字氏名を使う
+        'bulk': [
+            "SELECT uId, 漢字氏名 FROM view_cresc_data.ユーザー WHERE isActive = 1 AND isDelete = 0",
+            "SELECT uId, name FROM cresc_data.ユーザー WHERE isActive = 1 AND isDelete = 0",
+        ],
+        'single': [
+            "SELECT name FROM cresc_data.ユーザー WHERE uId = ? AND isActive = 1 AND isDelete = 0",
+            "SELECT 漢字氏名 FROM view_cresc_data.ユーザー WHERE uId = ? AND isActive = 1 AND isDelete = 0",
+        ],
+    },
+    'user_code': {
+        'bulk': [
+            "SELECT Code, name FROM cresc_data.ユーザー WHERE isActive = 1",
+        ],
+        'single': [
+            "SELECT name FROM cresc_data.ユーザー WHERE Code = ? AND isActive = 1",
+        ],
+    },
+    'record_type': {
+        'bulk': [
+            "SELECT uId, name FROM cresc_data.カルテ記載種別マスター WHERE isActive = 1 AND isDelete = 0",
+        ],
+        'single': [
+            "SELECT name FROM cresc_data.カルテ記載種別マスター WHERE uId = ? AND isActive = 1 AND isDelete = 0",
+        ],
+    },
+    'tag': {
+        'bulk': [
+            "SELECT uId, name FROM cresc_data.カルテ記載タグマスター WHERE isActive = 1 AND isDelete = 0",
+        ],
+        'single': [
+            "SELECT name FROM cresc_data.カルテ記載タグマスター WHERE uId = ? AND isActive = 1 AND isDelete = 0",
+        ],
+    },
+}
+
+class MasterDataCache:
+    """診療科・ユーザー・記載種別・タグのマスターデータをメモリに保持するキャッシュ
+
+    初回参照時（またはload()呼び出し時）に全件を読み込み、ttl秒ごとに再読込する。
+    キャッシュにないキーはcursorが渡されていれば1件検索して補完する。
+    """
+
+    def __init__(self, db_name='cresc-sora', ttl=3600.0, retry_interval=60.0):
+        self.db_name = db_name
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+
+        self._tables = {}
+        self._version = None
+        self._loaded_at = None
+        self._last_attempt = None
+        self._loading = False
+        self._lock = threading.Lock()
+        self._timer = None
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'fallback_queries': 0,
+            'loads': 0,
+            'load_errors': 0,
+        }
+
+    def load(self, cursor=None):
+        """全マスターを一括読込して差し替える"""
+        with self._lock:
+            if self._loading:
+                return False
+            self._loading = True
+            self._last_attempt = time.monotonic()
+
+        try:
+            started = time.perf_counter()
+            if cursor is not None:
+                tables = self._load_tables(cursor)
+            else:
+                with db_connection(self.db_name) as conn:
+                    own_cursor = conn.cursor()
+                    try:
+                        tables = self._load_tables(own_cursor)
+                    finally:
+                        own_cursor.close()
+
+            version = hashlib.sha1(repr(sorted(
+                (name, sorted(values.items(), key=str)) for name, values in tables.items()
+            )).encode('utf-8')).hexdigest()[:16]
+
+            with self._lock:
+                self._tables = tables
+                self._version = version
+                self._loaded_at = time.monotonic()
+                self.stats['loads'] += 1
+
+            counts = ", ".join(f"{name}={len(values)}" for name, values in tables.items())
+            logger.info(f"マスターデータを読み込みました ({counts}, {time.perf_counter() - started:.3f}秒)")
+            return True
+        except Exception as e:
+            with self._lock:
+                self.stats['load_errors'] += 1
+            logger.error(f"マスターデータ読込エラー: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._loading = False
+
+    def warm(self):
+        """未読込または期限切れなら読み込む"""
+        self._ensure_fresh()
+
+    def lookup(self, table, key, cursor=None, default="不明"):
+        """マスターから名称を引く"""
+        if not key:
+            return default
+
+        self._ensure_fresh()
+        key = str(key)
+        values = self._tables.get(table)
+
+        if values is not None and key in values:
+            with self._lock:
+                self.stats['hits'] += 1
+            value = values[key]
+            return value if value else default
+
+        with self._lock:
+            self.stats['misses'] += 1
+
+        if cursor is None:
+            return default
+
+        value, failed = self._query_single(table, key, cursor)
+        if failed:
+            # 検索エラーの代用値は記憶せず、次回も検索し直す
+            mark_fallback()
+            return default
+        with self._lock:
+            # 見つからなかったキーも次回の再読込まで記憶する
+            self._tables.setdefault(table, {})[key] = value
+        return value if value else default
+
+    def version(self):
+        """読み込んだマスターの内容から作る版（名称が変わると変わる。ETag用）"""
+        self._ensure_fresh()
+        return self._version
+
+    def lookup_many(self, table, keys):
+        """キャッシュにあるものだけを返す（キー -> 名称）と、見つからなかったキーの一覧"""
+        self._ensure_fresh()
+        values = self._tables.get(table, {})
+        found = {}
+        missing = []
+
+        for key in dict.fromkeys(str(key) for key in keys if key):
+            if key in values:
+                found[key] = values[key]
+            else:
+                missing.append(key)
+
+        with self._lock:
+            self.stats['hits'] += len(found)
+            self.stats['misses'] += len(missing)
+        return found, missing
+
+    def store(self, table, values):
+        """呼び出し側で取得した値をキャッシュへ追加する"""
+        with self._lock:
+            self._tables.setdefault(table, {}).update(
+                (str(key), value) for key, value in values.items()
+            )
+
+    def start_refresh_timer(self, interval=None):
+        """バックグラウンドで定期的に再読込するスレッドを開始"""
+        interval = interval or self.ttl
+        if self._timer is not None:
+            return
+
+        def refresh_loop():
+            while True:
+                self.load()
+                time.sleep(interval)
+
+        self._timer = threading.Thread(target=refresh_loop, name='master-cache-refresh', daemon=True)
+        self._timer.start()
+
+    def status(self):
+        """キャッシュの状態とヒット率"""
+        with self._lock:
+            stats = dict(self.stats)
+            sizes = {name: len(values) for name, values in self._tables.items()}
+            age = time.monotonic() - self._loaded_at if self._loaded_at else None
+
+        total = stats['hits'] + stats['misses']
+        return {
+            **stats,
+            'hit_ratio': round(stats['hits'] / total, 4) if total else None,
+            'sizes': sizes,
+            'age_seconds': round(age, 1) if age is not None else None,
+        }
+
+    def clear(self):
+        """キャッシュを破棄（次回参照時に再読込）"""
+        with self._lock:
+            self._tables = {}
+            self._version = None
+            self._loaded_at = None
+            self._last_attempt = None
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+
+        if self._loaded_at is None:
+            # 未読込: 直近に失敗していなければ同期で読み込む
+            if self._last_attempt is None or now - self._last_attempt >= self.retry_interval:
+                self.load()
+        elif now - self._loaded_at >= self.ttl and not self._loading:
+            # 期限切れ: 古い値を返しつつバックグラウンドで再読込
+            if self._last_attempt is None or now - self._last_attempt >= self.retry_interval:
+                threading.Thread(target=self.load, name='master-cache-reload', daemon=True).start()
+
+    def _load_tables(self, cursor):
+        tables = {}
+        for name, definition in MASTER_TABLES.items():
+            values = {}
+            for query in definition['bulk']:
+                cursor.execute(query)
+                for key, value in cursor.fetchall():
+                    if value or str(key) not in values:
+                        values[str(key)] = value
+            tables[name] = values
+        return tables
+
+    def _query_single(self, table, key, cursor):
+        """(名称, 検索エラーがあったか)。いずれかのクエリで見つかればエラーは問わない"""
+        with self._lock:
+            self.stats['fallback_queries'] += 1
+
+        failed = False
+        for query in MASTER_TABLES[table]['single']:
+            try:
+                cursor.execute(query, (key,))
+                result = cursor.fetchone()
+                if result and result[0]:
+                    return result[0], False
+            except Exception as e:
+                logger.debug(f"マスター検索エラー ({table}): {e}")
+                failed = True
+        return None, failed
+
+# アプリ全体で共有するキャッシュ
+master_cache = MasterDataCache()
@@ -0,0 +1,212 @@
+# python/modules/metrics.py
+from flask import Blueprint, Response, g, request
+import logging
+import threading
+import time
+from config.database import pool_statuses
+from config.query_stats import add_execute_listener
+
+logger = logging.getLogger(__name__)
+metrics_bp = Blueprint('metrics', __name__)
+
+# レイテンシーのヒストグラムの区切り（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """ラベルごとの累積ヒストグラム（Prometheusのhistogram形式で出力）"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # ラベル値のタプル -> [各区切りの件数..., 合計, 件数]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((labels, list(series)) for labels, series in self._series.items())
+
+        for labels, series in series_items:
+            base = list(zip(self.label_names, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(base + [('le', repr(bound))])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(base + [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {series[-1]}")
+        return lines
+
+class Counter:
+    """ラベルごとのカウンター"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, labels)))} {value}")
+        return lines
+
+REQUEST_LATENCY = Histogram(
+    'api_request_duration_seconds', 'APIリクエストの処理時間', ('route', 'method'))
+REQUEST_ERRORS = Counter(
+    'api_request_errors_total', 'ステータス4xx/5xxで終わったAPIリクエスト数', ('route', 'method', 'status'))
+REQUEST_EXCEPTIONS = Counter(
+    'api_request_exceptions_total', '未処理の例外で終わったAPIリクエスト数', ('route', 'method'))
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'SQLの実行時間（APIリクエスト中のもの）', ('database',))
+
+def observe_query(db_name, elapsed):
+    DB_QUERY_LATENCY.observe((db_name,), elapsed)
+
+def init_metrics(app):
+    """リクエストの処理時間とエラー数の計測をアプリに組み込む"""
+    add_execute_listener(observe_query)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+
+        labels = (_route_label(), request.method)
+        REQUEST_LATENCY.observe(labels, time.perf_counter() - started)
+        if response.status_code >= 400:
+            REQUEST_ERRORS.inc(labels + (str(response.status_code),))
+        return response
+
+    @app.teardown_request
+    def record_request_exception(exc):
+        if exc is not None:
+            REQUEST_EXCEPTIONS.inc((_route_label(), request.method))
+
+def _route_label():
+    """URLのパラメータを含まないルート名（例: /api/appointments/<date>）"""
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+def render_pool_metrics():
+    statuses = pool_statuses()
+    gauges = [
+        ('db_pool_connections', '物理接続数（貸出中＋アイドル）', 'size'),
+        ('db_pool_connections_in_use', '貸出中の接続数', 'in_use'),
+        ('db_pool_connections_idle', 'アイドルの接続数', 'idle'),
+        ('db_pool_max_connections', 'プールの上限', 'max_size'),
+    ]
+    counters = [
+        ('db_pool_acquired_total', '接続の貸出回数', 'acquired'),
+        ('db_pool_created_total', '物理接続の作成回数', 'created'),
+        ('db_pool_timeouts_total', '貸出待ちのタイムアウト回数', 'timeouts'),
+        ('db_pool_validation_failures_total', '貸出時の接続検証の失敗回数', 'validation_failures'),
+        ('db_pool_leaked_total', '返却されずに破棄した接続の数', 'leaked'),
+    ]
+
+    lines = []
+    for metric_type, definitions in (('gauge', gauges), ('counter', counters)):
+        for name, help_text, key in definitions:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for db_name, status in sorted(statuses.items()):
+                lines.append(f"{name}{_format_labels([('database', db_name)])} {status[key]}")
+
+    lines.append("# HELP db_pool_utilization 貸出中の接続数 / プールの上限")
+    lines.append("# TYPE db_pool_utilization gauge")
+    for db_name, status in sorted(statuses.items()):
+        lines.append(f"db_pool_utilization{_format_labels([('database', db_name)])} "
+                     f"{status['in_use'] / status['max_size']:.4f}")
+    return lines
+
+def render_cache_metrics():
+    caches = {}
+    try:
+        from modules.master_cache import master_cache
+        caches['master'] = master_cache.status()
+    except Exception as e:
+        logger.debug(f"マスターキャッシュの状態を取得できません: {e}")
+    try:
+        from modules.content_cache import content_cache
+        caches['content'] = content_cache.status()
+    except Exception as e:
+        logger.debug(f"記載内容キャッシュの状態を取得できません: {e}")
+    try:
+        from modules.chart_cache import chart_cache
+        caches['chart'] = chart_cache.status()
+    except Exception as e:
+        logger.debug(f"カルテキャッシュの状態を取得できません: {e}")
+    try:
+        from modules.search_cache import typeahead_cache
+        caches['search'] = typeahead_cache.status()
+    except Exception as e:
+        logger.debug(f"検索キャッシュの状態を取得できません: {e}")
+
+    lines = [
+        "# HELP cache_hits_total キャッシュのヒット数",
+        "# TYPE cache_hits_total counter",
+    ]
+    for name, status in sorted(caches.items()):
+        hits = status['hits'] + status.get('disk_hits', 0)
+        lines.append(f"cache_hits_total{_format_labels([('cache', name)])} {hits}")
+
+    lines += ["# HELP cache_misses_total キャッシュのミス数", "# TYPE cache_misses_total counter"]
+    for name, status in sorted(caches.items()):
+        lines.append(f"cache_misses_total{_format_labels([('cache', name)])} {status['misses']}")
+
+    lines += ["# HELP cache_hit_ratio キャッシュのヒット率（起動後の累計）", "# TYPE cache_hit_ratio gauge"]
+    for name, status in sorted(caches.items()):
+        if status.get('hit_ratio') is not None:
+            lines.append(f"cache_hit_ratio{_format_labels([('cache', name)])} {status['hit_ratio']}")
+    return lines
+
+def render_metrics():
+    """全メトリクスをPrometheusのテキスト形式で返す"""
+    lines = []
+    for metric in (REQUEST_LATENCY, REQUEST_ERRORS, REQUEST_EXCEPTIONS, DB_QUERY_LATENCY):
+        lines += metric.render()
+    lines += render_pool_metrics()
+    lines += render_cache_metrics()
+    return "\n".join(lines) + "\n"
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus形式のメトリクス
+
+    カウンター・ヒストグラム・接続プールの値はプロセスごとに持つ。serve.pyで複数の
+    ワーカーを起動すると、1回の取得で見えるのは応答したワーカー1つ分だけになる。
+    全体を集計する場合はワーカーを1つにするか、ワーカーごとに別ポートで公開して取得すること。
+    """
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -1,10 +1,223 @@
 from flask import Blueprint, request, jsonify
 import logging
-from config.database import get_db_connection
+from config.database import get_db_connection, close_quietly, chunked, in_placeholders
+from modules.record_content import split_content_ids, fetch_parsed_contents
 
 logger = logging.getLogger(__name__)
 next_record_bp = Blueprint('next_record', __name__)
 
+# 1回のリクエストで受け付けるゲストIDの上限
+MAX_GUEST_IDS = 1000
+
+# 最新SOAPカルテを探す際に遡る記録の件数（患者ごと）
+SOAP_SEARCH_DEPTH = 10
+
+SOAP_SECTIONS = ['Subject', 'Object', 'Assessment', 'Plan']
+
+def fetch_guests(guest_ids, cursor):
+    """ゲスト基本情報をIN句でまとめて取得（ゲスト番号 -> 行）"""
+    guest_ids = list(dict.fromkeys(str(guest_id) for guest_id in guest_ids if guest_id))
+    guests = {}
+    
+    for chunk in chunked(guest_ids):
+        guest_query = f"""
+            SELECT 
+                uId, ゲスト番号, 漢字氏名, 生年月日, 性別
+            FROM 
+                view_cresc_data.ゲスト基本情報
+            WHERE 
+                ゲスト番号 IN ({in_placeholders(len(chunk))})
+                AND isActive = 1
+                AND isDelete = 0
+        """
+        
+        cursor.execute(guest_query, chunk)
+        guest_columns = [column[0] for column in cursor.description]
+        for guest_row in cursor.fetchall():
+            guest = dict(zip(guest_columns, guest_row))
+            guests.setdefault(str(guest['ゲスト番号']), guest)
+    
+    return guests
+
+def fetch_latest_soap_records(patient_uids, cursor, depth=SOAP_SEARCH_DEPTH):
+    """患者ごとの最新のSOAPカルテをまとめて取得（患者uId -> SOAPレコード）
+
+    各患者の直近depth件の記録をウィンドウ関数で1回に取得し、
+    SOAPセクションの記載内容uIdだけを軽量なクエリで絞り込む。
+    記載内容の取得と解析は、各患者で最も新しい候補の記録の分だけ行う。
+    """
+    patient_uids = list(dict.fromkeys(str(uid) for uid in patient_uids if uid))
+    records_by_patient = {}
+    
+    for chunk in chunked(patient_uids):
+        records_query = f"""
+            SELECT uId, 患者uId, updateStamp, 記載内容リスト
+            FROM (
+                SELECT 
+                    記載.uId,
+                    記載.患者uId,
+                    記載.updateStamp,
+                    記載.記載内容リスト,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY 記載.患者uId ORDER BY 記載.updateStamp DESC
+                    ) AS rn
+                FROM 
+                    cresc_data.カルテ記載 as 記載
+                WHERE
+                    記載.患者uId IN ({in_placeholders(len(chunk))})
+                    AND 記載.isActive = 1
+                    AND 記載.isDelete = 0
+            ) AS 最新記載
+            WHERE rn <= ?
+            ORDER BY 患者uId, updateStamp DESC
+        """
+        
+        cursor.execute(records_query, chunk + [depth])
+        for record_uid, patient_uid, update_stamp, content_list in cursor.fetchall():
+            records_by_patient.setdefault(str(patient_uid), []).append(
+                (update_stamp, split_content_ids(content_list))
+            )
+    
+    # SOAPセクションの記載内容だけに絞る（記載内容の本文は読まない）
+    soap_content_ids = fetch_soap_content_ids(
+        [cid for records in records_by_patient.values() for _, content_ids in records for cid in content_ids],
+        cursor
+    )
+    candidates = {
+        patient_uid: [
+            (update_stamp, [cid for cid in content_ids if cid in soap_content_ids])
+            for update_stamp, content_ids in records
+            if any(cid in soap_content_ids for cid in content_ids)
+        ]
+        for patient_uid, records in records_by_patient.items()
+    }
+    
+    # 各患者の最も新しい候補だけ記載内容を取得し、本文が空なら次の候補へ
+    soap_records = {}
+    while candidates:
+        current = {patient_uid: records.pop(0) for patient_uid, records in candidates.items() if records}
+        if not current:
+            break
+        contents = fetch_parsed_contents(
+            [cid for _, content_ids in current.values() for cid in content_ids], cursor
+        )
+        
+        for patient_uid, (update_stamp, content_ids) in current.items():
+            try:
+                soap_content = build_soap_content(content_ids, contents)
+            except Exception as e:
+                logger.error(f"患者uId {patient_uid} のSOAPカルテ処理中にエラー: {e}")
+                candidates.pop(patient_uid, None)
+                continue
+            
+            # 少なくとも一つのSOAPセクションが存在すれば採用
+            if any(text.strip() for text in soap_content.values()):
+                date_str = str(int(update_stamp)) if isinstance(update_stamp, (int, float)) else str(update_stamp)
+                soap_records[patient_uid] = {'date': date_str, **soap_content}
+                candidates.pop(patient_uid, None)
+        
+        candidates = {patient_uid: records for patient_uid, records in candidates.items() if records}
+    
+    return soap_records
+
+def fetch_soap_content_ids(content_ids, cursor):
+    """記載区分がSOAPセクションの記載内容uIdをまとめて取得"""
+    content_ids = list(dict.fromkeys(str(cid) for cid in content_ids if cid))
+    soap_content_ids = set()
+    
+    for chunk in chunked(content_ids):
+        section_query = f"""
+            SELECT 
+                uId
+            FROM 
+                cresc_data.カルテ記載内容
+            WHERE 
+                uId IN ({in_placeholders(len(chunk))})
+                AND RTRIM(LTRIM(記載区分)) IN ({in_placeholders(len(SOAP_SECTIONS))})
+                AND isActive = 1
+                AND isDelete = 0
+        """
+        
+        cursor.execute(section_query, chunk + SOAP_SECTIONS)
+        soap_content_ids.update(str(row[0]) for row in cursor.fetchall())
+    
+    return soap_content_ids
+
+def build_soap_content(content_ids, contents):
+    """記載内容uIdの一覧からSOAPセクションごとのテキストを組み立てる"""
+    soap_content = {section: '' for section in SOAP_SECTIONS}
+    
+    for content_id in content_ids:
+        content = contents.get(content_id)
+        if content:
+            section = str(content[0]).strip() if content[0] else ""
+            if section in soap_content:
+                soap_content[section] = content[1]
+    
+    return soap_content
+
+def format_date_for_display(date_str):
+    """日付を表示用にフォーマット"""
+    if not date_str:
+        return "不明"
+    
+    if len(str(date_str)) >= 8:
+        date_str = str(date_str)
+        return f"{date_str[:4]}年{date_str[4:6]}月{date_str[6:8]}日"
+    
+    return str(date_str)
+
+def build_guest_list(guest_ids, cursor):
+    """SOAPカルテを持つゲストの一覧を入力順で作成"""
+    guests_by_id = fetch_guests(guest_ids, cursor)
+    patient_uids = [guest.get('uId') for guest in guests_by_id.values()]
+    
+    try:
+        soap_records = fetch_latest_soap_records(patient_uids, cursor)
+    except Exception as e:
+        # まとめて取得できない場合は1人ずつ取得し、失敗したゲストだけを除く
+        logger.error(f"SOAPカルテの一括取得エラー（ゲストごとに再取得します）: {e}")
+        soap_records = {}
+        for patient_uid in patient_uids:
+            try:
+                soap_records.update(fetch_latest_soap_records([patient_uid], cursor))
+            except Exception as e:
+                logger.error(f"患者uId {patient_uid} のSOAPカルテ取得エラー: {e}")
+    
+    guests = []
+    
+    for guest_id in guest_ids:
+        try:
+            guest = guests_by_id.get(str(guest_id))
+            if not guest:
+                logger.debug(f"ゲスト情報が見つかりません: ID {guest_id}")
+                continue
+            
+            # SOAPカルテが存在する場合のみリストに追加
+            soap_record = soap_records.get(str(guest.get('uId')))
+            if not soap_record:
+                continue
+            
+            # 生年月日の整形
+            birth_date = guest.get('生年月日', '')
+            if birth_date and len(str(birth_date)) == 8:
+                birth_date_str = str(birth_date)
+                birth_date = f"{birth_date_str[:4]}年{birth_date_str[4:6]}月{birth_date_str[6:8]}日"
+            
+            guests.append({
+                'guestId': guest_id,
+                'guestName': guest.get('漢字氏名', ''),
+                'birthDate': birth_date,
+                'gender': guest.get('性別', ''),
+                'lastRecordDate': format_date_for_display(soap_record.get('date', ''))
+            })
+            
+        except Exception as e:
+            logger.error(f"ゲストID {guest_id} の処理中にエラー: {e}")
+            continue
+    
+    return guests
+
 @next_record_bp.route('/next-record/guest-list', methods=['POST'])
 def get_guest_list():
     try:
@@ -14,56 +227,21 @@ def get_guest_list():
         if not guest_ids:
             return jsonify({"error": "ゲストIDリストが必要です", "guests": []})
         
+        if len(guest_ids) > MAX_GUEST_IDS:
+            return jsonify({"error": f"ゲストIDは{MAX_GUEST_IDS}件までです", "guests": []}), 400
+        
         logger.info(f"ゲストリスト取得: {len(guest_ids)}件のゲストID")
         
         conn = get_db_connection('cresc-sora')
-        cursor = conn.cursor()
+        cursor = None
         
-        guests = []
+        try:
+            cursor = conn.cursor()
+            guests = build_guest_list(guest_ids, cursor)
+        finally:
+            close_quietly(cursor, conn)
         
-        for guest_id in guest_ids[:5]:  # 最初の5件のみテスト
-            try:
-                guest_query = """
-                    SELECT 
-                        ゲスト番号, 漢字氏名, 生年月日, 性別
-                    FROM 
-                        view_cresc_data.ゲスト基本情報
-                    WHERE 
-                        ゲスト番号 = ?
-                        AND isActive = 1
-                        AND isDelete = 0
-                """
-                
-                cursor.execute(guest_query, (guest_id,))
-                guest_row = cursor.fetchone()
-                
-                if guest_row:
-                    guest_columns = [column[0] for column in cursor.description]
-                    guest = dict(zip(guest_columns, guest_row))
-                    
-                    # 生年月日の整形
-                    birth_date = guest.get('生年月日', '')
-                    if birth_date and len(str(birth_date)) == 8:
-                        birth_date_str = str(birth_date)
-                        birth_date = f"{birth_date_str[:4]}年{birth_date_str[4:6]}月{birth_date_str[6:8]}日"
-                    
-                    guest_info = {
-                        'guestId': guest_id,
-                        'guestName': guest.get('漢字氏名', ''),
-                        'birthDate': birth_date,
-                        'gender': guest.get('性別', ''),
-                        'lastRecordDate': '2025年05月01日'  # 仮の値
-                    }
-                    guests.append(guest_info)
-                    
-            except Exception as e:
-                logger.error(f"ゲストID {guest_id} の処理中にエラー: {e}")
-                continue
-        
-        cursor.close()
-        conn.close()
-        
-        logger.info(f"ゲストリスト: {len(guests)}件")
+        logger.info(f"SOAPカルテ保有ゲスト: {len(guests)}件")
         return jsonify({"guests": guests})
         
     except Exception as e:
@@ -72,6 +250,7 @@ def get_guest_list():
 
 @next_record_bp.route('/next-record/guest-record/<guest_id>', methods=['GET'])
 def get_guest_record(guest_id):
+    conn = cursor = None
     try:
         logger.info(f"ゲスト記録取得: ゲストID = {guest_id}")
         
@@ -93,8 +272,6 @@ def get_guest_record(guest_id):
         guest_row = cursor.fetchone()
         
         if not guest_row:
-            cursor.close()
-            conn.close()
             return jsonify({"error": "ゲストが見つかりません"})
         
         guest_columns = [column[0] for column in cursor.description]
@@ -122,9 +299,6 @@ def get_guest_record(guest_id):
             'Plan': 'テストプラン'
         }
         
-        cursor.close()
-        conn.close()
-        
         return jsonify({
             "guestInfo": guest_info,
             "lastRecord": last_record
@@ -133,6 +307,9 @@ def get_guest_record(guest_id):
     except Exception as e:
         logger.error(f"ゲスト記録取得エラー: {e}")
         return jsonify({"error": str(e)})
+    
+    finally:
+        close_quietly(cursor, conn)
 
 @next_record_bp.route('/next-record/create', methods=['POST'])
 def create_next_record():
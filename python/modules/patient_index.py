@@ -0,0 +1,382 @@
+# python/modules/patient_index.py
+import heapq
+import logging
+import threading
+import time
+import unicodedata
+from config.database import db_connection
+
+logger = logging.getLogger(__name__)
+
+# 検索結果の最大件数
+SEARCH_LIMIT = 20
+
+# インデックスが使えない場合の検索クエリ（部分一致のため全件走査になる）
+SEARCH_QUERY = f"""
+    SELECT TOP {SEARCH_LIMIT}
+        ゲスト番号, 漢字氏名, 生年月日, 性別, uId
+    FROM
+        view_cresc_data.ゲスト基本情報
+    WHERE
+        (ゲスト番号 LIKE ? OR 漢字氏名 LIKE ?)
+        AND isActive = 1
+        AND isDelete = 0
+    ORDER BY
+        ゲスト番号 DESC
+"""
+
+# インデックス構築用の全件取得クエリ（{kana}はカナ氏名列があれば埋める）
+INDEX_LOAD_QUERY = """
+    SELECT uId, ゲスト番号, 漢字氏名, 生年月日, 性別{kana}
+    FROM view_cresc_data.ゲスト基本情報
+    WHERE isActive = 1 AND isDelete = 0
+"""
+
+# 差分更新用クエリ（削除・無効化された行も取得してインデックスから外す）
+INDEX_DELTA_QUERY = """
+    SELECT uId, ゲスト番号, 漢字氏名, 生年月日, 性別, isActive, isDelete, updateStamp{kana}
+    FROM view_cresc_data.ゲスト基本情報
+    WHERE updateStamp > ?
+"""
+
+# カナ氏名の列名（存在しなければカナ検索なしで動作する）
+KANA_COLUMN = 'カナ氏名'
+
+# 差分更新・全件再構築の間隔と、インデックスを古いとみなすまでの時間（秒）
+INDEX_REFRESH_INTERVAL = 60
+INDEX_REBUILD_INTERVAL = 3600
+INDEX_STALE_AFTER = 300
+# updateStampが使えず差分更新できない場合の全件再構築の間隔（秒）
+INDEX_FALLBACK_REBUILD_INTERVAL = 900
+
+# 候補がこれより多い場合はゲスト番号の降順に走査して上位だけを確認する
+SCAN_THRESHOLD = 2000
+
+def normalize(text):
+    """検索用の正規化（全角英数→半角、空白除去、ひらがな→カタカナ）"""
+    if text is None:
+        return ""
+    text = unicodedata.normalize('NFKC', str(text))
+    text = "".join(text.split())
+    return text.translate(_HIRAGANA_TO_KATAKANA)
+
+_HIRAGANA_TO_KATAKANA = {code: code + 0x60 for code in range(ord('ぁ'), ord('ゖ') + 1)}
+
+def ngrams(text):
+    """2文字なら2-gram、3文字以上なら3-gramの集合"""
+    size = 2 if len(text) == 2 else 3
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def _document_grams(texts):
+    grams = set()
+    for text in texts:
+        for size in (2, 3):
+            grams.update(text[i:i + size] for i in range(len(text) - size + 1))
+    return grams
+
+class PatientSearchIndex:
+    """漢字氏名・ゲスト番号（とカナ氏名）の部分一致検索用の2-gram/3-gram転置インデックス
+
+    全件読込で構築し、updateStampによる差分更新（使えない場合は fallback_rebuild_interval 秒
+    ごとの全件再構築）で最新に保つ。未構築または最終更新から stale_after 秒（差分更新できない
+    場合はさらに再構築の間隔分）を超えた場合はsearch()がNoneを返し、呼び出し側はSQLで検索する。
+    """
+
+    def __init__(self, db_name='cresc-sora', refresh_interval=INDEX_REFRESH_INTERVAL,
+                 rebuild_interval=INDEX_REBUILD_INTERVAL, stale_after=INDEX_STALE_AFTER,
+                 fallback_rebuild_interval=INDEX_FALLBACK_REBUILD_INTERVAL):
+        self.db_name = db_name
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.stale_after = stale_after
+        self.fallback_rebuild_interval = fallback_rebuild_interval
+
+        self._docs = {}       # uId -> (行のdict, 検索対象文字列, gramの集合, 並び順のキー)
+        self._postings = {}   # gram -> uIdの集合
+        self._order = []      # ゲスト番号の降順に並べたuId
+        self._rank = {}       # uId -> _order内の位置
+        self._ordered_docs = []  # _orderの順に並べたドキュメント
+        self._order_dirty = False
+
+        self._has_kana = None
+        self._has_delta = None
+        self._max_stamp = None
+        self._refreshed_at = None
+        self._built_at = None
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._thread = None
+
+        self.stats = {'searches': 0, 'stale': 0, 'builds': 0, 'deltas': 0, 'errors': 0}
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """行のdictのリスト（ゲスト番号の降順）。インデックスが使えなければNone"""
+        self.start_refresher()
+        if not self.is_fresh():
+            with self._lock:
+                self.stats['stale'] += 1
+            return None
+
+        term = normalize(query)
+        if len(term) < 2:
+            return None
+
+        with self._lock:
+            self.stats['searches'] += 1
+            postings = [self._postings.get(gram) for gram in ngrams(term)]
+            if not postings or any(posting is None for posting in postings):
+                return []
+            # 最も絞り込める1つのgramで候補を取り、ゲスト番号の降順に部分一致を確認する
+            candidates = min(postings, key=len)
+            if self._order_dirty:
+                self._rebuild_order()
+
+            if len(candidates) > SCAN_THRESHOLD:
+                # 候補が多い場合はゲスト番号の降順に全体を走査する
+                ordered = self._ordered_docs
+            else:
+                docs = self._docs
+                ordered = [docs[uid] for uid in sorted(candidates, key=self._rank.__getitem__)]
+
+            results = []
+            for doc in ordered:
+                if term in doc[1]:
+                    results.append(doc[0])
+                    if len(results) >= limit:
+                        break
+            return results
+
+    def is_fresh(self):
+        if self._refreshed_at is None:
+            return False
+        stale_after = self.stale_after
+        if self._has_delta is False:
+            # 差分更新できない場合は再構築の間隔の間も使い続ける
+            stale_after += self.fallback_rebuild_interval
+        return time.monotonic() - self._refreshed_at < stale_after
+
+    def build(self):
+        """全件を読み込んでインデックスを作り直す"""
+        with self._build_lock:
+            started = time.perf_counter()
+            try:
+                with db_connection(self.db_name) as conn:
+                    cursor = conn.cursor()
+                    try:
+                        rows = self._load_all(cursor)
+                        max_stamp = self._query_max_stamp(cursor)
+                    finally:
+                        cursor.close()
+            except Exception as e:
+                with self._lock:
+                    self.stats['errors'] += 1
+                logger.error(f"患者検索インデックスの構築に失敗しました: {e}")
+                return False
+
+            docs, postings = {}, {}
+            for row in rows:
+                uid, doc = self._make_doc(row)
+                docs[uid] = doc
+                for gram in doc[2]:
+                    postings.setdefault(gram, set()).add(uid)
+
+            with self._lock:
+                self._docs, self._postings = docs, postings
+                self._rebuild_order()
+                self._max_stamp = max_stamp
+                self._refreshed_at = self._built_at = time.monotonic()
+                self.stats['builds'] += 1
+
+            logger.info(f"患者検索インデックスを構築しました ({len(docs)}件, {len(postings)} grams, "
+                        f"{time.perf_counter() - started:.2f}秒)")
+            return True
+
+    def refresh(self):
+        """前回以降に更新された行だけを反映する（差分が取れなければ全件再構築）"""
+        if self._has_delta is False and self._built_at is not None \
+                and time.monotonic() - self._built_at < self.fallback_rebuild_interval:
+            # updateStampの有無は初回の構築時に一度だけ確認し、使えなければ再構築の間隔まで待つ
+            return True
+        if self._built_at is None or self._has_delta is False or self._max_stamp is None \
+                or time.monotonic() - self._built_at >= self.rebuild_interval:
+            return self.build()
+
+        with self._build_lock:
+            try:
+                with db_connection(self.db_name) as conn:
+                    cursor = conn.cursor()
+                    try:
+                        kana = f", {KANA_COLUMN}" if self._has_kana else ""
+                        cursor.execute(INDEX_DELTA_QUERY.format(kana=kana), (self._max_stamp,))
+                        columns = [column[0] for column in cursor.description]
+                        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                    finally:
+                        cursor.close()
+            except Exception as e:
+                with self._lock:
+                    self.stats['errors'] += 1
+                logger.error(f"患者検索インデックスの差分更新に失敗しました: {e}")
+                return False
+
+            with self._lock:
+                for row in rows:
+                    if row.get('isActive') == 1 and row.get('isDelete') == 0:
+                        self.upsert(row)
+                    else:
+                        self.remove(row['uId'])
+                    if row.get('updateStamp') is not None and row['updateStamp'] > self._max_stamp:
+                        self._max_stamp = row['updateStamp']
+                self._refreshed_at = time.monotonic()
+                self.stats['deltas'] += 1
+
+            if rows:
+                logger.info(f"患者検索インデックスを差分更新しました ({len(rows)}件)")
+            return True
+
+    def upsert(self, row):
+        """1行を追加・更新する"""
+        uid, doc = self._make_doc(row)
+        with self._lock:
+            self._remove_locked(uid)
+            self._docs[uid] = doc
+            for gram in doc[2]:
+                self._postings.setdefault(gram, set()).add(uid)
+            self._order_dirty = True
+
+    def remove(self, uid):
+        """1行を削除する"""
+        with self._lock:
+            if self._remove_locked(str(uid)):
+                self._order_dirty = True
+
+    def start_refresher(self):
+        """バックグラウンドで構築・差分更新を行うスレッドを開始（初回のみ）"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            def refresh_loop():
+                while True:
+                    self.refresh()
+                    time.sleep(self.refresh_interval)
+
+            self._thread = threading.Thread(target=refresh_loop, name='patient-index-refresh', daemon=True)
+            self._thread.start()
+
+    def status(self):
+        with self._lock:
+            age = time.monotonic() - self._refreshed_at if self._refreshed_at else None
+            return {
+                **self.stats,
+                'documents': len(self._docs),
+                'grams': len(self._postings),
+                'fresh': self.is_fresh(),
+                'kana': bool(self._has_kana),
+                'incremental': bool(self._has_delta),
+                'age_seconds': round(age, 1) if age is not None else None,
+            }
+
+    def _load_all(self, cursor):
+        if self._has_kana is not False:
+            try:
+                cursor.execute(INDEX_LOAD_QUERY.format(kana=f", {KANA_COLUMN}"))
+                self._has_kana = True
+            except Exception as e:
+                logger.info(f"カナ氏名列が使えないため漢字氏名とゲスト番号のみで索引します: {e}")
+                self._has_kana = False
+        if not self._has_kana:
+            cursor.execute(INDEX_LOAD_QUERY.format(kana=""))
+
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _query_max_stamp(self, cursor):
+        if self._has_delta is False:
+            return None
+        try:
+            cursor.execute("SELECT MAX(updateStamp) FROM view_cresc_data.ゲスト基本情報")
+            row = cursor.fetchone()
+            self._has_delta = True
+            return row[0] if row else None
+        except Exception as e:
+            logger.info(f"updateStampが使えないため定期的な全件再構築で更新します: {e}")
+            self._has_delta = False
+            return None
+
+    def _make_doc(self, row):
+        uid = str(row['uId'])
+        result = {key: row.get(key) for key in ('ゲスト番号', '漢字氏名', '生年月日', '性別', 'uId')}
+        if row.get(KANA_COLUMN) is not None:
+            result[KANA_COLUMN] = row[KANA_COLUMN]
+        number = row.get('ゲスト番号')
+        texts = (
+            "" if number is None else str(number),
+            normalize(row.get('漢字氏名')),
+            normalize(row.get(KANA_COLUMN)),
+        )
+        # SQLのORDER BY ゲスト番号 DESCと同じ順（NULLは最後）
+        sort_key = (number is not None, number if number is not None else "")
+        # 改行で連結してフィールドをまたいだ一致を防ぐ
+        return uid, (result, "\n".join(texts), _document_grams(texts), sort_key)
+
+    def _remove_locked(self, uid):
+        doc = self._docs.pop(uid, None)
+        if doc is None:
+            return False
+        for gram in doc[2]:
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(uid)
+                if not posting:
+                    del self._postings[gram]
+        return True
+
+    def _sort_key(self, uid):
+        return self._docs[uid][3]
+
+    def _rebuild_order(self):
+        self._order = sorted(self._docs, key=self._sort_key, reverse=True)
+        self._rank = {uid: position for position, uid in enumerate(self._order)}
+        self._ordered_docs = [self._docs[uid] for uid in self._order]
+        self._order_dirty = False
+
+# アプリ全体で共有するインデックス
+patient_index = PatientSearchIndex()
+
+def search_patient_rows(query, limit=SEARCH_LIMIT):
+    """患者を検索して行のdictのリストを返す（インデックスが古ければSQLで検索）"""
+    rows = patient_index.search(query, limit)
+    if rows is not None:
+        return rows
+
+    with db_connection('cresc-sora') as conn:
+        cursor = conn.cursor()
+        try:
+            search_pattern = f"%{query}%"
+            cursor.execute(SEARCH_QUERY, (search_pattern, search_pattern))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()][:limit]
+        finally:
+            cursor.close()
+
+def format_search_result(patient):
+    """検索結果の行を画面表示用のdictにする"""
+    patient_id = patient.get('ゲスト番号', '')
+    if isinstance(patient_id, (int, float)):
+        patient_id = f"{int(patient_id):08d}"
+    elif isinstance(patient_id, str):
+        patient_id = patient_id.zfill(8)
+
+    birth_date = patient.get('生年月日', '')
+    if birth_date and len(str(birth_date)) == 8:
+        birth_date_str = str(birth_date)
+        birth_date = f"{birth_date_str[:4]}年{birth_date_str[4:6]}月{birth_date_str[6:8]}日"
+
+    return {
+        '患者ID': patient_id,
+        '患者名': patient.get('漢字氏名', '不明'),
+        '生年月日': birth_date,
+        '性別': patient.get('性別', '不明')
+    }
@@ -0,0 +1,121 @@
+# python/modules/record_content.py
+import logging
+from config.database import chunked, in_placeholders
+from modules.content_cache import content_cache
+from modules.content_parser import extract_text_from_json
+
+logger = logging.getLogger(__name__)
+
+def split_content_ids(content_list):
+    """記載内容リスト（カンマ区切り）を記載内容uIdのリストに分割"""
+    if not content_list:
+        return []
+    return [cid.strip() for cid in str(content_list).split(',') if cid.strip()]
+
+def fetch_record_contents(content_ids, cursor):
+    """カルテ記載内容をIN句でまとめて取得（uId -> (記載区分, 記載内容)）
+
+    並び順は呼び出し側が持つ記載内容リストの順序で復元する。
+    """
+    content_ids = list(dict.fromkeys(str(cid) for cid in content_ids if cid))
+    contents = {}
+
+    for chunk in chunked(content_ids):
+        content_query = f"""
+            SELECT
+                uId, 記載区分, 記載内容
+            FROM
+                cresc_data.カルテ記載内容
+            WHERE
+                uId IN ({in_placeholders(len(chunk))})
+                AND isActive = 1
+                AND isDelete = 0
+        """
+
+        cursor.execute(content_query, chunk)
+        for content_uid, section, content_text in cursor.fetchall():
+            contents[str(content_uid)] = (section, content_text)
+
+    logger.debug(f"記載内容一括取得: {len(contents)}/{len(content_ids)}件")
+    return contents
+
+def fetch_parsed_contents(content_ids, cursor, cache=content_cache):
+    """解析済みの記載内容をまとめて取得（uId -> (記載区分, テキスト)）
+
+    キャッシュにあるuIdは軽量なクエリでupdateStampだけを確認し、
+    変更がなければ記載内容の取得と解析を省略する。
+    """
+    content_ids = list(dict.fromkeys(str(cid) for cid in content_ids if cid))
+    contents = {}
+    to_fetch = []
+
+    # キャッシュにあるものはバージョンを確認
+    cached_present = cache.contains_many(content_ids)
+    cached_ids = [cid for cid in content_ids if cid in cached_present]
+    cached_set = set(cached_ids)
+    to_fetch.extend(cid for cid in content_ids if cid not in cached_set)
+
+    for chunk in chunked(cached_ids):
+        version_query = f"""
+            SELECT
+                uId, updateStamp
+            FROM
+                cresc_data.カルテ記載内容
+            WHERE
+                uId IN ({in_placeholders(len(chunk))})
+                AND isActive = 1
+                AND isDelete = 0
+        """
+
+        cursor.execute(version_query, chunk)
+        for content_uid, update_stamp in cursor.fetchall():
+            cached = cache.get(content_uid, update_stamp)
+            if cached is not None:
+                contents[str(content_uid)] = cached
+            else:
+                to_fetch.append(str(content_uid))
+
+    # キャッシュにない・更新されたものを取得して解析
+    for chunk in chunked(to_fetch):
+        content_query = f"""
+            SELECT
+                uId, 記載区分, 記載内容, updateStamp
+            FROM
+                cresc_data.カルテ記載内容
+            WHERE
+                uId IN ({in_placeholders(len(chunk))})
+                AND isActive = 1
+                AND isDelete = 0
+        """
+
+        cursor.execute(content_query, chunk)
+        parsed = []
+        for content_uid, section, content_text, update_stamp in cursor.fetchall():
+            text = extract_text_from_json(content_text)
+            contents[str(content_uid)] = (section, text)
+            parsed.append((content_uid, update_stamp, section, text))
+        cache.put_many(parsed)
+
+    logger.debug(f"記載内容取得: {len(contents)}/{len(content_ids)}件 (解析 {len(to_fetch)}件)")
+    return contents
+
+def fetch_record_tag_items(record_uids, cursor):
+    """カルテ記載タグをIN句でまとめて取得（記載uId -> タグuIdのリスト）"""
+    record_uids = list(dict.fromkeys(str(uid) for uid in record_uids if uid))
+    tag_items = {}
+
+    for chunk in chunked(record_uids):
+        tag_query = f"""
+            SELECT uId, items
+            FROM cresc_data.カルテ記載タグ
+            WHERE uId IN ({in_placeholders(len(chunk))}) AND isActive = 1 AND isDelete = 0
+        """
+
+        cursor.execute(tag_query, chunk)
+        for record_uid, items in cursor.fetchall():
+            if items:
+                tag_items.setdefault(str(record_uid), []).extend(
+                    uid.strip() for uid in str(items).split(',') if uid.strip()
+                )
+
+    return tag_items
@@ -0,0 +1,50 @@
+# python/modules/request_stats.py
+from flask import g, request
+import json
+import logging
+from config.query_stats import start_query_stats, stop_query_stats
+
+logger = logging.getLogger(__name__)
+
+# リクエストごとのDB集計を返すレスポンスヘッダー
+QUERY_STATS_HEADER = 'X-DB-Stats'
+
+def init_request_stats(app):
+    """リクエストごとのSQL実行回数・DB時間・取得行数の集計をアプリに組み込む
+
+    集計結果はレスポンスヘッダーと1行のJSONログに出力する。
+    N+1の疑いがあるSQLが見つかった場合は警告レベルで出力する。
+    """
+
+    @app.before_request
+    def begin_query_stats():
+        g.query_stats, g.query_stats_token = start_query_stats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        # ストリーミング応答は本文の生成前なので、この時点までの集計になる
+        response.headers[QUERY_STATS_HEADER] = stats.header_value()
+
+        summary = stats.to_dict()
+        summary.update({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+        })
+        line = json.dumps(summary, ensure_ascii=False, default=str)
+        if summary['nPlusOne']:
+            logger.warning(f"N+1の疑いがあるクエリ: {line}")
+        elif summary['statements']:
+            logger.info(f"DBクエリ統計: {line}")
+        return response
+
+    @app.teardown_request
+    def end_query_stats(exc):
+        token = g.pop('query_stats_token', None)
+        if token is not None:
+            stop_query_stats(token)
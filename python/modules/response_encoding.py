@@ -0,0 +1,117 @@
+# python/modules/response_encoding.py
+import dataclasses
+import decimal
+import gzip
+import json
+import logging
+import uuid
+from datetime import date
+from flask import request
+from werkzeug.http import http_date
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # orjsonが無い環境では標準のjsonを使う
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotliが無い環境ではgzipのみ
+    brotli = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask 2.2未満
+    DefaultJSONProvider = None
+
+# これ以上の大きさの応答だけ圧縮する（バイト）
+COMPRESS_MIN_SIZE = 1024
+# 圧縮レベル（速度と圧縮率の兼ね合い。brotliの最大11は遅すぎる）
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# 圧縮対象のContent-Type
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/plain', 'text/html'}
+
+if orjson is not None:
+    # 日時はFlaskの既定（HTTP日付形式）に合わせるため_defaultで処理する
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+def _default(obj):
+    """orjsonが直接扱わない型（Flaskの既定のJSONプロバイダーと同じ変換）"""
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_bytes(obj):
+    """JSONをUTF-8のバイト列で生成（日本語は\\uエスケープしない）"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, ensure_ascii=False, default=_default).encode('utf-8')
+
+if DefaultJSONProvider is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        """jsonify・app.json をorjsonで処理するJSONプロバイダー
+
+        キーは並べ替えず、日本語はエスケープせずにUTF-8で出力する。
+        """
+
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return dumps_bytes(obj).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            if kwargs or orjson is None:
+                return super().loads(s, **kwargs)
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+else:
+    OrjsonProvider = None
+
+def init_response_encoding(app, min_size=COMPRESS_MIN_SIZE):
+    """高速なJSON生成と、大きな応答のgzip/brotli圧縮をアプリに組み込む"""
+    if OrjsonProvider is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        logger.warning("Flask 2.2未満のため、JSONプロバイダーの置き換えを行いません")
+
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    logger.info(f"JSON: {'orjson' if orjson is not None else '標準json'}, 圧縮: {'/'.join(encodings)} ({min_size}バイト以上)")
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or not 200 <= response.status_code < 300 or response.status_code == 204
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0: 同じ本文からは常に同じ圧縮結果にする
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
@@ -0,0 +1,143 @@
+# python/modules/search_cache.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from modules.patient_index import KANA_COLUMN, SEARCH_LIMIT, normalize, search_patient_rows
+
+logger = logging.getLogger(__name__)
+
+# 検索結果を使い回す時間（秒）と保持する検索語の数
+SEARCH_CACHE_TTL = 30
+SEARCH_CACHE_MAX_ENTRIES = 2000
+
+class TypeaheadSearchCache:
+    """入力途中の患者検索向けのキャッシュ
+
+    - 同じ検索語の同時リクエストは1回の検索にまとめる
+    - 検索語ごとの結果を短時間保持する
+    - 結果が上限件数未満（打ち切られていない）の検索語を含む、より長い検索語は
+      その結果を絞り込んで返す（「山田」→「山田太」でDBに問い合わせない）
+    """
+
+    def __init__(self, search_func=search_patient_rows, ttl=SEARCH_CACHE_TTL,
+                 max_entries=SEARCH_CACHE_MAX_ENTRIES, limit=SEARCH_LIMIT):
+        self.search_func = search_func
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.limit = limit
+
+        self._entries = OrderedDict()  # 検索語 -> (保存時刻, 行のリスト)
+        self._inflight = {}            # 検索語 -> Future
+        self._lock = threading.Lock()
+
+        self.stats = {'hits': 0, 'refined': 0, 'coalesced': 0, 'misses': 0}
+
+    def search(self, query):
+        """検索結果の行のリスト（キャッシュ・絞り込み・同時リクエストの合流を利用）"""
+        query = query.strip()
+
+        with self._lock:
+            rows = self._get_locked(query)
+            if rows is not None:
+                self.stats['hits'] += 1
+                return rows
+
+            refined = self._refine_locked(query)
+            if refined is not None:
+                # 絞り込んだ結果は元の検索語と同じ時刻に期限切れにする
+                stored_at, rows = refined
+                self.stats['refined'] += 1
+                self._put_locked(query, rows, stored_at)
+                return rows
+
+            future = self._inflight.get(query)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                owner = False
+            else:
+                future = self._inflight[query] = Future()
+                self.stats['misses'] += 1
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            rows = self.search_func(query)
+        except Exception as e:
+            with self._lock:
+                del self._inflight[query]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[query]
+            self._put_locked(query, rows)
+        future.set_result(rows)
+        return rows
+
+    def status(self):
+        with self._lock:
+            stats = dict(self.stats)
+            entries = len(self._entries)
+        total = sum(stats.values())
+        served = stats['hits'] + stats['refined'] + stats['coalesced']
+        return {
+            **stats,
+            'hit_ratio': round(served / total, 4) if total else None,
+            'entries': entries,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get_locked(self, query):
+        entry = self._get_entry_locked(query)
+        return None if entry is None else entry[1]
+
+    def _get_entry_locked(self, query):
+        """期限内の (保存時刻, 行のリスト)。なければNone"""
+        entry = self._entries.get(query)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.ttl:
+            del self._entries[query]
+            return None
+        self._entries.move_to_end(query)
+        return entry
+
+    def _refine_locked(self, query):
+        """queryの先頭部分で、打ち切られていない結果があれば (元の保存時刻, 絞り込んだ行) を返す"""
+        for length in range(len(query) - 1, 1, -1):
+            entry = self._get_entry_locked(query[:length])
+            if entry is None:
+                continue
+            stored_at, prefix_rows = entry
+            if len(prefix_rows) >= self.limit:
+                # 上限で打ち切られている可能性があるため使えない
+                return None
+            return stored_at, [row for row in prefix_rows if matches(row, query)]
+        return None
+
+    def _put_locked(self, query, rows, stored_at=None):
+        self._entries[query] = (time.monotonic() if stored_at is None else stored_at, rows)
+        self._entries.move_to_end(query)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+def matches(row, query):
+    """行が検索語に部分一致するか（SQLのLIKEと、インデックスの正規化後の一致の両方を見る）"""
+    term = normalize(query)
+    for key in ('ゲスト番号', '漢字氏名', KANA_COLUMN):
+        value = row.get(key)
+        if value is None:
+            continue
+        if query in str(value) or (term and term in normalize(value)):
+            return True
+    return False
+
+# アプリ全体で共有するキャッシュ
+typeahead_cache = TypeaheadSearchCache()
@@ -1,12 +1,13 @@
 from flask import Blueprint, request, jsonify
 import logging
-from config.database import get_db_connection
+from config.database import get_db_connection, close_quietly
 
 logger = logging.getLogger(__name__)
 patient_records_bp = Blueprint('patient_records', __name__)
 
 @patient_records_bp.route('/patient-records/<patient_id>', methods=['GET'])
 def get_patient_records(patient_id):
+    conn = cursor = None
     try:
         logger.info(f"患者記録取得: 患者ID = {patient_id}")
         
@@ -32,8 +33,6 @@ def get_patient_records(patient_id):
         patient_row = cursor.fetchone()
         
         if not patient_row:
-            cursor.close()
-            conn.close()
             return jsonify({
                 "error": "患者情報が見つかりません",
                 "records": "",
@@ -49,9 +48,6 @@ def get_patient_records(patient_id):
             birth_date_str = str(birth_date)
             birth_date = f"{birth_date_str[:4]}年{birth_date_str[4:6]}月{birth_date_str[6:8]}日"
         
-        cursor.close()
-        conn.close()
-        
         result = {
             "records": "診療記録を取得中です...\n\n---\n\n簡易実装版",
             "patientName": patient.get('漢字氏名', ''),
@@ -67,4 +63,7 @@ def get_patient_records(patient_id):
             "error": f"診療記録の取得に失敗しました: {str(e)}",
             "records": "",
             "patientName": ""
-        })
\ No newline at end of file
+        })
+    
+    finally:
+        close_quietly(cursor, conn)
\ No newline at end of file
@@ -0,0 +1,71 @@
+# python/serve.py
+"""本番用のマルチワーカー起動スクリプト
+
+asgi.py のASGIアプリ（server_build.py のFlaskアプリをa2wsgiで変換したもの）を
+uvicornで複数ワーカープロセスとして起動する。開発時は server_build.py を直接実行する。
+
+使い方（pythonディレクトリで実行）:
+    pip install uvicorn a2wsgi
+    python serve.py --workers 4 --port 8000
+
+gunicornで管理する場合:
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:8000 asgi:app
+
+設定:
+    --workers        ワーカープロセス数（既定はCPU数、最大8）
+    --threads        1ワーカーあたりのリクエスト処理スレッド数（環境変数 ASGI_THREADS）
+    --max-pending    1ワーカーあたりの同時受付数。超えると503を返す（環境変数 ASGI_MAX_PENDING）
+
+接続プールはワーカーごとに作られるため、IRISへの接続数は最大で
+「ワーカー数 × データベースごとのmax_size」になる。スレッド数はmax_size以下にしておくと、
+接続待ちでスレッドが塞がることがない。
+
+/api/metrics の値（リクエスト数・処理時間・接続プール）もワーカーごとに集計される。
+複数ワーカーでは、1回の取得で見えるのは応答したワーカー1つ分だけになる。
+"""
+import argparse
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 8)
+
+def main():
+    parser = argparse.ArgumentParser(description='ASGIサーバー（uvicorn）で本番モードを起動')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--threads', type=int)
+    parser.add_argument('--max-pending', type=int)
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    try:
+        import uvicorn
+    except ImportError:
+        logger.error("uvicornがインストールされていません: pip install uvicorn")
+        sys.exit(1)
+
+    # ワーカープロセスはasgi.pyの読込時にこの値を参照する
+    if args.threads:
+        os.environ['ASGI_THREADS'] = str(args.threads)
+    if args.max_pending:
+        os.environ['ASGI_MAX_PENDING'] = str(args.max_pending)
+
+    logger.info(f"ASGIサーバーを起動しています (ポート: {args.port}, ワーカー数: {args.workers})...")
+    uvicorn.run(
+        'asgi:app',
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        lifespan='on',
+    )
+
+if __name__ == '__main__':
+    main()
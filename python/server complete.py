@@ -6,6 +6,8 @@ import json
 import re
 from datetime import datetime
 from flask_cors import CORS
+from modules.content_parser import split_json_arrays
+from modules.record_content import split_content_ids, fetch_record_contents
 
 # ログ設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -342,63 +344,7 @@ def process_json_array(json_array):
 
 def split_multiple_json_arrays(content):
     """カンマで区切られた複数のJSON配列を分割"""
-    json_arrays = []
-    current_array = ""
-    bracket_count = 0
-    in_quotes = False
-    escaped = False
-    
-    i = 0
-    while i < len(content):
-        char = content[i]
-        
-        if escaped:
-            escaped = False
-            current_array += char
-            i += 1
-            continue
-        
-        if char == '\\':
-            escaped = True
-            current_array += char
-            i += 1
-            continue
-        
-        if char == '"' and not escaped:
-            in_quotes = not in_quotes
-            current_array += char
-        elif not in_quotes:
-            if char == '[':
-                if bracket_count == 0:
-                    current_array = char
-                else:
-                    current_array += char
-                bracket_count += 1
-            elif char == ']':
-                current_array += char
-                bracket_count -= 1
-                if bracket_count == 0:
-                    json_arrays.append(current_array)
-                    current_array = ""
-                    # 次のJSON配列まで進む
-                    while i + 1 < len(content) and content[i + 1] in ['"', ',', ' ']:
-                        i += 1
-            elif bracket_count > 0:
-                current_array += char
-        else:
-            current_array += char
-        
-        i += 1
-    
-    # 残ったものがあれば追加
-    if current_array.strip():
-        json_arrays.append(current_array.strip())
-    
-    # JSON配列が見つからなかった場合は全体を一つとして扱う
-    if not json_arrays:
-        json_arrays = [content]
-    
-    return json_arrays
+    return [fragment for fragment, _ in split_json_arrays(content)]
 
 @app.route('/api/patient-records/<patient_id>', methods=['GET'])
 def get_patient_records(patient_id):
@@ -496,10 +442,15 @@ def get_patient_records(patient_id):
         # 記録をテキスト形式に変換
         formatted_records = []
         records_columns = [column[0] for column in cursor.description]
+        records = [dict(zip(records_columns, record_row)) for record_row in records_rows]
         
-        for record_row in records_rows:
-            record = dict(zip(records_columns, record_row))
-            
+        # 全記録の記載内容をまとめて取得
+        all_content_ids = []
+        for record in records:
+            all_content_ids.extend(split_content_ids(record.get('記載内容リスト', '')))
+        record_contents = fetch_record_contents(all_content_ids, cursor)
+        
+        for record in records:
             # 日付の整形
             record_date = record.get('updateStamp', '')
             if record_date:
@@ -523,7 +474,7 @@ def get_patient_records(patient_id):
                 logger.debug(f"記載内容リストが空: record_uId = {record.get('uId')}")
                 continue
             
-            content_ids = [cid.strip() for cid in str(content_list).split(',') if cid.strip()]
+            content_ids = split_content_ids(content_list)
             logger.debug(f"記載内容ID一覧: {content_ids}")
             
             # SOAPセクション用の辞書
@@ -544,23 +495,11 @@ def get_patient_records(patient_id):
             content_found = False
             for content_id in content_ids:
                 try:
-                    content_query = """
-                        SELECT 
-                            uId, 記載区分, 記載内容
-                        FROM 
-                            cresc_data.カルテ記載内容
-                        WHERE 
-                            uId = ?
-                            AND isActive = 1
-                            AND isDelete = 0
-                    """
-                    
-                    cursor.execute(content_query, (content_id,))
-                    content_row = cursor.fetchone()
+                    content_row = record_contents.get(content_id)
                     
                     if content_row:
                         content_found = True
-                        content_uid, section, content_text = content_row
+                        section, content_text = content_row
                         
                         logger.debug(f"記載内容取得: ID={content_id}, セクション={section}")
                         
@@ -591,7 +530,7 @@ def get_patient_records(patient_id):
                         logger.debug(f"記載内容が見つかりません: ID={content_id}")
                 
                 except Exception as e:
-                    logger.error(f"記載内容ID {content_id} の取得中にエラー: {e}")
+                    logger.error(f"記載内容ID {content_id} の処理中にエラー: {e}")
             
             if not content_found:
                 logger.warning(f"記録にコンテンツが見つかりません: record_uId = {record.get('uId')}")
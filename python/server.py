@@ -13,6 +13,19 @@ def create_app():
     app = Flask(__name__)
     CORS(app)
     
+    # orjsonによるJSON生成と大きな応答のgzip/brotli圧縮（他のafter_requestより後に実行される）
+    from modules.response_encoding import init_response_encoding
+    init_response_encoding(app)
+    
+    # リクエストごとのDBクエリ集計（X-DB-Statsヘッダーとログ）
+    from modules.request_stats import init_request_stats
+    init_request_stats(app)
+    
+    # Prometheus形式のメトリクス（/api/metrics）。他のモジュールの読み込みに失敗しても計測する
+    from modules.metrics import metrics_bp, init_metrics
+    app.register_blueprint(metrics_bp, url_prefix='/api')
+    init_metrics(app)
+    
     # 各機能のブループリントを登録
     try:
         from modules.health import health_bp
@@ -66,4 +79,12 @@ if __name__ == '__main__':
     logger.info(f"Python Flask サーバーを起動しています (ポート: {port})...")
     
     app = create_app()
+    
+    from config.database import warm_pools
+    from modules.master_cache import master_cache
+    from modules.patient_index import patient_index
+    warm_pools()
+    master_cache.start_refresh_timer()
+    patient_index.start_refresher()
+    
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -1,11 +1,16 @@
 # python/server.py
-from flask import Flask, request, jsonify
-import pyodbc
+from flask import Flask, Response, request, jsonify
 import logging
-import json
-import re
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_cors import CORS
+from config.database import get_db_connection as get_pooled_connection, close_quietly, warm_pools
+from modules.master_cache import master_cache
+from modules.patient_index import patient_index, format_search_result
+from modules.search_cache import typeahead_cache
+from modules.chart_cache import chart_cache, fetch_chart_version, fetch_recent_content_ids
+from modules.conditional import make_etag, is_not_modified, not_modified, with_etag, track_fallbacks, mark_fallback, fallback_used
+from modules.next_record import MAX_GUEST_IDS, SOAP_SEARCH_DEPTH, build_guest_list, fetch_latest_soap_records
+from modules.record_content import split_content_ids, fetch_parsed_contents, fetch_record_tag_items
 
 # ログ設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -14,302 +19,71 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
+# orjsonによるJSON生成と大きな応答のgzip/brotli圧縮（他のafter_requestより後に実行される）
+from modules.response_encoding import init_response_encoding, dumps_bytes
+init_response_encoding(app)
+
+# リクエストごとのDBクエリ集計（X-DB-Statsヘッダーとログ）
+from modules.request_stats import init_request_stats
+init_request_stats(app)
+
+# ヘルスチェック（/api/health, /api/health/live, /api/health/ready, /api/health/stats）
+from modules.health import health_bp
+app.register_blueprint(health_bp, url_prefix='/api')
+
+# 予約一覧・差分・期間・カレンダー（/api/appointments...）
+from modules.appointment import appointment_bp
+app.register_blueprint(appointment_bp, url_prefix='/api')
+
+# Prometheus形式のメトリクス（/api/metrics）
+from modules.metrics import metrics_bp, init_metrics
+app.register_blueprint(metrics_bp, url_prefix='/api')
+init_metrics(app)
+
 def get_db_connection():
-    try:
-        driver_name = "InterSystems IRIS ODBC35"
-        host = '172.21.2.3'
-        port = '1972'
-        cache_name = 'cresc-sora'
-        username = 'soranomori'
-        password = 'sora'
-        
-        connection_string = (
-            f"DRIVER={{{driver_name}}};"
-            f"SERVER={host};"
-            f"PORT={port};"
-            f"DATABASE={cache_name};"
-            f"UID={username};"
-            f"PWD={password}"
-        )
-        
-        return pyodbc.connect(connection_string)
-    except Exception as e:
-        logger.error(f"データベース接続エラー: {e}")
-        raise
+    """CRESC-soraの接続をコネクションプールから取得（close()でプールへ返却）"""
+    return get_pooled_connection('cresc-sora')
 
-def extract_text_from_json(content):
-    """JSON配列からテキストを抽出する - JSONコンバーター形式に対応"""
-    if not content:
-        return ""
-    
-    try:
-        # 文字列でない場合はそのまま返す
-        if not isinstance(content, str):
-            return str(content)
-        
-        # JSONフォーマットでない場合はそのまま返す
-        if '"Text"' not in content:
-            return content
-        
-        logger.debug(f"JSON抽出開始: 長さ={len(content)}")
-        
-        # カンマで区切られた複数のJSON配列を分割
-        # 例: "[{...}]","[{...}]" のような形式を処理
-        
-        # 一番外側の引用符を除去
-        cleaned_content = content.strip()
-        if cleaned_content.startswith('"') and cleaned_content.endswith('"'):
-            cleaned_content = cleaned_content[1:-1]
-        
-        # エスケープされた引用符を元に戻す
-        cleaned_content = cleaned_content.replace('""', '"')
-        
-        # カンマで区切られたJSON配列を分割
-        json_arrays = []
-        current_array = ""
-        bracket_count = 0
-        in_quotes = False
-        escaped = False
-        
-        i = 0
-        while i < len(cleaned_content):
-            char = cleaned_content[i]
-            
-            if escaped:
-                escaped = False
-                current_array += char
-                i += 1
-                continue
-            
-            if char == '\\':
-                escaped = True
-                current_array += char
-                i += 1
-                continue
-            
-            if char == '"' and not escaped:
-                in_quotes = not in_quotes
-                current_array += char
-            elif not in_quotes:
-                if char == '[':
-                    if bracket_count == 0:
-                        current_array = char
-                    else:
-                        current_array += char
-                    bracket_count += 1
-                elif char == ']':
-                    current_array += char
-                    bracket_count -= 1
-                    if bracket_count == 0:
-                        json_arrays.append(current_array)
-                        current_array = ""
-                        # 次のJSON配列まで進む（", を探す）
-                        while i + 1 < len(cleaned_content) and cleaned_content[i + 1] in ['"', ',', ' ']:
-                            i += 1
-                elif bracket_count > 0:
-                    current_array += char
-            else:
-                current_array += char
-            
-            i += 1
-        
-        # 残ったものがあれば追加
-        if current_array.strip():
-            json_arrays.append(current_array.strip())
-        
-        # JSON配列が見つからなかった場合は全体を1つの配列として処理
-        if not json_arrays:
-            json_arrays = [cleaned_content]
-        
-        # 各JSON配列からテキストを抽出
-        all_texts = []
-        
-        for json_array_str in json_arrays:
-            try:
-                # JSON配列として解析
-                json_array = json.loads(json_array_str)
-                
-                if isinstance(json_array, list):
-                    for item in json_array:
-                        if isinstance(item, dict) and 'Text' in item:
-                            text = item['Text']
-                            # JSONコンバーターの規則：空のTextは改行として扱う
-                            if text == "":
-                                all_texts.append("")  # 空行として保持
-                            elif text.strip():
-                                all_texts.append(text.strip())
-                elif isinstance(json_array, dict) and 'Text' in json_array:
-                    # 単一のオブジェクトの場合
-                    text = json_array['Text']
-                    if text == "":
-                        all_texts.append("")
-                    elif text.strip():
-                        all_texts.append(text.strip())
-            
-            except json.JSONDecodeError as e:
-                logger.debug(f"JSON解析エラー: {e}, 内容: {json_array_str[:100]}...")
-                # JSONとして解析できない場合は正規表現で抽出
-                text_matches = re.findall(r'"Text"\s*:\s*"([^"]*)"', json_array_str)
-                for match in text_matches:
-                    if match == "":
-                        all_texts.append("")
-                    elif match.strip():
-                        all_texts.append(match.strip())
-        
-        # JSONコンバーターの規則に従って結合
-        # 連続する非空行は改行で結合、空のTextは段落の区切りとして扱う
-        result_parts = []
-        current_paragraph = []
-        
-        for text in all_texts:
-            if text == "":
-                # 空行の場合、現在の段落を結合して追加
-                if current_paragraph:
-                    result_parts.append('\n'.join(current_paragraph))
-                    current_paragraph = []
-                # 空行として段落区切りを追加
-                result_parts.append("")
-            else:
-                # 非空行の場合、現在の段落に追加
-                current_paragraph.append(text)
-        
-        # 最後の段落を追加
-        if current_paragraph:
-            result_parts.append('\n'.join(current_paragraph))
-        
-        # 結果を改行で結合（空の要素は改行として扱う）
-        result = '\n'.join(result_parts)
-        
-        # 連続する改行を整理
-        result = re.sub(r'\n{3,}', '\n\n', result)
-        
-        logger.debug(f"抽出完了: {len(result)}文字")
-        return result
-        
-    except Exception as e:
-        logger.error(f"JSONテキスト抽出エラー: {e}")
-        return content
 def get_department_name(dept_uid, cursor):
     """診療科名を取得"""
-    if not dept_uid:
-        return "不明"
-    
-    try:
-        cursor.execute("""
-            SELECT name 
-            FROM cresc_data.診療科マスター 
-            WHERE uId = ? AND isActive = 1 AND isDelete = 0
-        """, (dept_uid,))
-        
-        result = cursor.fetchone()
-        if result:
-            return result[0]
-    except Exception as e:
-        logger.debug(f"診療科マスター検索エラー: {e}")
-    
-    return "不明"
+    return master_cache.lookup('department', dept_uid, cursor)
 
 def get_user_name(user_uid, cursor):
-    """ユーザー名を取得"""
-    if not user_uid:
-        return "不明"
-    
-    try:
-        # まずnameフィールドを試す
-        cursor.execute("""
-            SELECT name 
-            FROM cresc_data.ユーザー 
-            WHERE uId = ? AND isActive = 1 AND isDelete = 0
-        """, (user_uid,))
-        
-        result = cursor.fetchone()
-        if result and result[0]:
-            return result[0]
-        
-        # nameがない場合はview_cresc_dataから漢字氏名を取得
-        cursor.execute("""
-            SELECT 漢字氏名 
-            FROM view_cresc_data.ユーザー 
-            WHERE uId = ? AND isActive = 1 AND isDelete = 0
-        """, (user_uid,))
-        
-        result = cursor.fetchone()
-        if result and result[0]:
-            return result[0]
-    except Exception as e:
-        logger.debug(f"ユーザー名取得エラー: {e}")
-    
-    return "不明"
+    """ユーザー名を取得（nameがない場合はview_cresc_dataの漢字氏名）"""
+    return master_cache.lookup('user', user_uid, cursor)
 
 def get_record_type_name(type_uid, cursor):
     """記載種別名を取得"""
-    if not type_uid:
-        return "不明"
-    
-    try:
-        cursor.execute("""
-            SELECT name 
-            FROM cresc_data.カルテ記載種別マスター 
-            WHERE uId = ? AND isActive = 1 AND isDelete = 0
-        """, (type_uid,))
-        
-        result = cursor.fetchone()
-        if result:
-            return result[0]
-    except Exception as e:
-        logger.debug(f"記載種別取得エラー: {e}")
-    
-    return "不明"
+    return master_cache.lookup('record_type', type_uid, cursor)
 
-def get_record_tags(record_uid, cursor):
-    """記載記録に関連するタグを取得"""
+def get_record_tags(record_uid, cursor, tag_items=None):
+    """記載記録に関連するタグを取得
+
+    tag_itemsにfetch_record_tag_itemsの結果を渡すとタグの検索を省略する。
+    """
     if not record_uid:
         return ""
     
     try:
-        tag_query = """
-            SELECT items 
-            FROM cresc_data.カルテ記載タグ 
-            WHERE uId = ? AND isActive = 1 AND isDelete = 0
-        """
-        
-        cursor.execute(tag_query, (record_uid,))
-        tag_rows = cursor.fetchall()
+        if tag_items is None:
+            tag_items = fetch_record_tag_items([record_uid], cursor)
         
         tag_names = []
-        for tag_row in tag_rows:
-            if tag_row[0]:
-                tag_uids = [uid.strip() for uid in str(tag_row[0]).split(',') if uid.strip()]
-                for tag_uid in tag_uids:
-                    tag_name = get_tag_name(tag_uid, cursor)
-                    if tag_name and tag_name != "不明":
-                        tag_names.append(tag_name)
+        for tag_uid in tag_items.get(str(record_uid), []):
+            tag_name = get_tag_name(tag_uid, cursor)
+            if tag_name and tag_name != "不明":
+                tag_names.append(tag_name)
         
         return ", ".join(tag_names)
     except Exception as e:
         logger.debug(f"記載タグ取得エラー: {e}")
+        mark_fallback()
     
     return ""
 
 def get_tag_name(tag_uid, cursor):
     """記載タグ名を取得"""
-    if not tag_uid:
-        return "不明"
-    
-    try:
-        cursor.execute("""
-            SELECT name 
-            FROM cresc_data.カルテ記載タグマスター 
-            WHERE uId = ? AND isActive = 1 AND isDelete = 0
-        """, (tag_uid,))
-        
-        result = cursor.fetchone()
-        if result:
-            return result[0]
-    except Exception as e:
-        logger.debug(f"記載タグマスター検索エラー: {e}")
-    
-    return "不明"
+    return master_cache.lookup('tag', tag_uid, cursor)
 
 def format_insurance_type(insurance_code):
     """保険自費区分を文字列に変換"""
@@ -338,51 +112,8 @@ def search_patients():
         
         logger.info(f"患者検索: クエリ = {query}")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        sql_query = """
-            SELECT TOP 20
-                ゲスト番号, 漢字氏名, 生年月日, 性別, uId
-            FROM 
-                view_cresc_data.ゲスト基本情報
-            WHERE 
-                (ゲスト番号 LIKE ? OR 漢字氏名 LIKE ?)
-                AND isActive = 1 
-                AND isDelete = 0
-            ORDER BY 
-                ゲスト番号 DESC
-        """
-        
-        search_pattern = f"%{query}%"
-        cursor.execute(sql_query, (search_pattern, search_pattern))
-        
-        patients = []
-        columns = [column[0] for column in cursor.description]
-        
-        for row in cursor.fetchall():
-            patient = dict(zip(columns, row))
-            
-            patient_id = patient.get('ゲスト番号', '')
-            if isinstance(patient_id, (int, float)):
-                patient_id = f"{int(patient_id):08d}"
-            elif isinstance(patient_id, str):
-                patient_id = patient_id.zfill(8)
-                
-            birth_date = patient.get('生年月日', '')
-            if birth_date and len(str(birth_date)) == 8:
-                birth_date_str = str(birth_date)
-                birth_date = f"{birth_date_str[:4]}年{birth_date_str[4:6]}月{birth_date_str[6:8]}日"
-                
-            patients.append({
-                '患者ID': patient_id,
-                '患者名': patient.get('漢字氏名', '不明'),
-                '生年月日': birth_date,
-                '性別': patient.get('性別', '不明')
-            })
-        
-        cursor.close()
-        conn.close()
+        # 入力途中の検索は直前の結果を使い回し、なければインデックス（古ければSQL）で検索
+        patients = [format_search_result(patient) for patient in typeahead_cache.search(query)]
         
         logger.info(f"検索結果: {len(patients)}件の患者が見つかりました")
         return jsonify({"patients": patients})
@@ -391,68 +122,479 @@ def search_patients():
         logger.error(f"患者検索エラー: {e}")
         return jsonify({"error": str(e), "patients": []})
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT 1 as test")
-        result = cursor.fetchone()
-        
-        cursor.execute("SELECT COUNT(*) FROM view_cresc_data.ゲスト基本情報 WHERE isActive = 1 AND isDelete = 0")
-        patient_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM cresc_data.カルテ記載 WHERE isActive = 1 AND isDelete = 0")
-        record_count = cursor.fetchone()[0]
-        
-        cursor.close()
-        conn.close()
+# 診療記録の取得クエリ（TOP句・絞り込み条件・並び順はbuild_records_queryで埋める）
+RECORDS_QUERY = """
+    SELECT {top}
+        記載.uId,
+        記載.患者uId,
+        記載.updateStamp,
+        記載.診療科uId,
+        記載.記載者uId,
+        記載.指示者uId,
+        記載.updateUserId,
+        記載.記載種別uId,
+        記載.記載内容リスト,
+        記載.保険自費区分,
+        記載.入外区分
+    FROM 
+        cresc_data.カルテ記載 as 記載
+    WHERE
+        記載.患者uId = ?
+        AND 記載.isActive = 1
+        AND 記載.isDelete = 0{conditions}
+    ORDER BY
+        記載.updateStamp {order}, 記載.uId {order}
+"""
+
+# 1回に取得できる記録の上限（limitパラメータ）
+RECORDS_MAX_LIMIT = 500
+
+def parse_records_filter(args):
+    """クエリパラメータから記録の絞り込み条件を作る（不正な値はValueError）
+
+    limit: 取得件数、before/after: 前回レスポンスのカーソル、from/to: 日付（YYYY-MM-DD）
+    """
+    records_filter = {'limit': None, 'before': None, 'after': None, 'from': None, 'to': None}
+    
+    limit = args.get('limit')
+    if limit:
+        if not limit.isdigit() or not 1 <= int(limit) <= RECORDS_MAX_LIMIT:
+            raise ValueError(f"limitは1～{RECORDS_MAX_LIMIT}で指定してください")
+        records_filter['limit'] = int(limit)
+    
+    for key in ('before', 'after'):
+        if args.get(key):
+            records_filter[key] = parse_records_cursor(args.get(key))
+    
+    for key in ('from', 'to'):
+        if args.get(key):
+            try:
+                date = datetime.strptime(args.get(key).replace('-', ''), '%Y%m%d')
+            except ValueError:
+                raise ValueError(f"{key}の日付形式が無効です")
+            if key == 'to':
+                # 指定日の終わりまでを含める
+                date += timedelta(days=1)
+            records_filter[key] = int(date.strftime('%Y%m%d')) * 1000000
+    
+    return records_filter
+
+def parse_records_cursor(token):
+    """カーソル「updateStamp:uId」（uIdは省略可）を分解"""
+    stamp, _, uid = token.partition(':')
+    if not stamp.isdigit():
+        raise ValueError(f"カーソルが無効です: {token}")
+    return int(stamp), uid or None
+
+def make_records_cursor(record):
+    """記録の行からカーソル文字列を作る"""
+    stamp = record.get('updateStamp')
+    stamp = int(stamp) if isinstance(stamp, (int, float)) else stamp
+    return f"{stamp}:{record.get('uId')}"
+
+def build_records_query(patient_uid, records_filter):
+    """絞り込み条件を反映した記録取得クエリとパラメータを作る"""
+    conditions = []
+    params = [patient_uid]
+    
+    for key, op in (('before', '<'), ('after', '>')):
+        if records_filter[key]:
+            stamp, uid = records_filter[key]
+            if uid is None:
+                conditions.append(f"記載.updateStamp {op} ?")
+                params.append(stamp)
+            else:
+                conditions.append(f"(記載.updateStamp {op} ? OR (記載.updateStamp = ? AND 記載.uId {op} ?))")
+                params.extend([stamp, stamp, uid])
+    
+    if records_filter['from']:
+        conditions.append("記載.updateStamp >= ?")
+        params.append(records_filter['from'])
+    if records_filter['to']:
+        conditions.append("記載.updateStamp < ?")
+        params.append(records_filter['to'])
+    
+    # afterのみ指定時はカーソル直後から古い順に取得して後で並べ替える
+    ascending = bool(records_filter['after']) and not records_filter['before']
+    limit = records_filter['limit']
+    
+    query = RECORDS_QUERY.format(
+        top=f"TOP {limit + 1}" if limit else "",
+        conditions="".join(f"\n        AND {condition}" for condition in conditions),
+        order="ASC" if ascending else "DESC"
+    )
+    return query, params, ascending
+
+def fetch_record_rows(cursor, patient_uid, records_filter):
+    """記録の行を新しい順で取得し、ページ情報とともに返す"""
+    query, params, ascending = build_records_query(patient_uid, records_filter)
+    cursor.execute(query, params)
+    
+    records_columns = [column[0] for column in cursor.description]
+    records = [dict(zip(records_columns, record_row)) for record_row in cursor.fetchall()]
+    
+    limit = records_filter['limit']
+    has_more = bool(limit) and len(records) > limit
+    if has_more:
+        records = records[:limit]
+    if ascending:
+        records.reverse()
+    
+    return records, make_page_info(records, has_more, records_filter)
+
+def make_page_info(records, has_more, records_filter=None):
+    """続きを取得するためのカーソル情報
+
+    空のページでは、afterで指定されたカーソルをlatestCursorとして返す（新着の確認を続けられるように）。
+    """
+    if not records:
+        after = records_filter and records_filter['after']
+        return {
+            "hasMore": False,
+            "nextCursor": None,
+            "latestCursor": format_records_cursor(after) if after else None
+        }
+    return {
+        "hasMore": has_more,
+        "nextCursor": make_records_cursor(records[-1]),
+        "latestCursor": make_records_cursor(records[0])
+    }
+
+def format_records_cursor(parsed):
+    """parse_records_cursorの結果をカーソル文字列に戻す"""
+    stamp, uid = parsed
+    return f"{stamp}:{uid}" if uid else str(stamp)
+
+# ストリーミング時に1回で取得する記録の件数
+RECORDS_STREAM_BATCH_SIZE = 20
+
+SOAP_ORDER = ['Subject', 'Object', 'Assessment', 'Plan']
+
+INSURANCE_LABELS = {3: "保険", 1: "自費", 0: "未登録"}
+INOUT_LABELS = {0: "外来", 1: "入院"}
+
+# 診療記録のレスポンス形式（format=text: 従来のテキスト, format=structured: 構造化JSON）
+RECORDS_FORMATS = {'text': 1, 'structured': 2}
+
+def find_patient(patient_id, cursor):
+    """ゲスト番号から患者情報を取得（見つからなければNone）"""
+    patient_query = """
+        SELECT 
+            uId, ゲスト番号, 漢字氏名, 生年月日, 性別
+        FROM 
+            view_cresc_data.ゲスト基本情報
+        WHERE 
+            ゲスト番号 = ?
+            AND isActive = 1
+            AND isDelete = 0
+    """
+    
+    cursor.execute(patient_query, (patient_id,))
+    patient_row = cursor.fetchone()
+    
+    if not patient_row:
+        return None
+    
+    patient_columns = [column[0] for column in cursor.description]
+    patient = dict(zip(patient_columns, patient_row))
+    
+    # 生年月日の整形
+    birth_date = patient.get('生年月日', '')
+    if birth_date and len(str(birth_date)) == 8:
+        birth_date_str = str(birth_date)
+        birth_date = f"{birth_date_str[:4]}年{birth_date_str[4:6]}月{birth_date_str[6:8]}日"
+    
+    return {
+        'uId': patient.get('uId'),
+        'patientId': patient_id,
+        'patientName': patient.get('漢字氏名', ''),
+        'birthDate': birth_date,
+        'gender': patient.get('性別', '')
+    }
+
+def build_records(records, cursor):
+    """カルテ記載の行から構造化した記録を生成する（記載内容・タグは一括取得）"""
+    all_content_ids = []
+    for record in records:
+        all_content_ids.extend(split_content_ids(record.get('記載内容リスト', '')))
+    record_contents = fetch_parsed_contents(all_content_ids, cursor)
+    record_tag_items = fetch_record_tag_items([record.get('uId') for record in records], cursor)
+    
+    for record in records:
+        built = build_record(record, record_contents, record_tag_items, cursor)
+        if built:
+            yield built
+
+def build_record(record, record_contents, record_tag_items, cursor):
+    """1件のカルテ記載を構造化する（表示する内容がなければNone）"""
+    # 記載内容リストの取得
+    content_ids = split_content_ids(record.get('記載内容リスト', ''))
+    if not content_ids:
+        return None
+    
+    # 日付の整形
+    record_date = record.get('updateStamp', '')
+    if record_date:
+        date_str = str(int(record_date)) if isinstance(record_date, (int, float)) else str(record_date)
+    else:
+        date_str = ""
+    
+    # 各種情報の取得
+    診療科 = get_department_name(record.get('診療科uId'), cursor)
+    記載者 = get_user_name(record.get('記載者uId'), cursor)
+    指示者 = get_user_name(record.get('指示者uId'), cursor)
+    更新者 = get_user_name(record.get('updateUserId'), cursor)
+    記載種別 = get_record_type_name(record.get('記載種別uId'), cursor)
+    
+    # 記載タグの取得
+    記載タグ = get_record_tags(record.get('uId'), cursor, record_tag_items)
+    
+    # SOAPセクション用の辞書
+    soap_content = {section: [] for section in SOAP_ORDER}
+    
+    # その他のセクション用の辞書
+    other_content = {}
+    
+    # 記載方法の判定用
+    record_method = ""
+    
+    # 全ての記載内容を記載内容リストの順に処理
+    for content_id in content_ids:
+        try:
+            content_row = record_contents.get(content_id)
+            
+            if content_row:
+                # 解析済みのテキスト（キャッシュ済みの場合あり）
+                section, formatted_content = content_row
+                
+                # セクション名の正規化
+                section = str(section).strip() if section else "記録"
+                
+                # 記載方法の判定
+                if section in ['自由記載', '自由']:
+                    record_method = "自由記載"
+                elif section in ['超音波']:
+                    record_method = "超音波"
+                elif section in soap_content:
+                    record_method = "SOAP"
+                
+                # SOAPセクションか他のセクションかを判別
+                if section in soap_content:
+                    soap_content[section].append(formatted_content)
+                else:
+                    if section not in other_content:
+                        other_content[section] = []
+                    other_content[section].append(formatted_content)
         
-        return jsonify({
-            "status": "ok", 
-            "message": "Python サーバーは正常に動作しています",
-            "db_connection": "成功",
-            "patient_count": patient_count,
-            "record_count": record_count,
-            "test_result": result[0] if result else None
-        })
-    except Exception as e:
-        logger.error(f"ヘルスチェックエラー: {e}")
-        return jsonify({
-            "status": "error", 
-            "message": f"データベース接続エラー: {str(e)}",
-            "db_connection": "失敗"
-        })
+        except Exception as e:
+            logger.error(f"記載内容ID {content_id} の処理中にエラー: {e}")
+            mark_fallback()
+    
+    # 記載方法が判定できない場合のデフォルト
+    if not record_method:
+        if any(soap_content.values()):
+            record_method = "SOAP"
+        elif 記載種別 and ('自由' in 記載種別):
+            record_method = "自由記載"
+        elif 記載種別 and ('超音波' in 記載種別):
+            record_method = "超音波"
+        else:
+            record_method = "記録"
+    
+    # 空のセクションを削除し、テキストを結合
+    soap_content = {k: '\n\n'.join(v) for k, v in soap_content.items() if v}
+    other_content = {k: '\n\n'.join(v) for k, v in other_content.items() if v}
+    
+    # 何らかのコンテンツが存在する場合のみ記録を返す
+    if not (soap_content or other_content):
+        return None
+    
+    return {
+        'uId': record.get('uId'),
+        'date': date_str,
+        'department': 診療科,
+        'doctor': 記載者 or 更新者,
+        'author': 記載者,
+        'instructor': 指示者,
+        'updater': 更新者,
+        'method': record_method,
+        'recordType': 記載種別,
+        'insurance': INSURANCE_LABELS.get(record.get('保険自費区分')),
+        'inout': INOUT_LABELS.get(record.get('入外区分')),
+        'tags': 記載タグ,
+        'soap': soap_content,
+        'sections': other_content
+    }
+
+def format_record_text(record):
+    """構造化した記録を「項目：内容」形式のテキストに変換"""
+    record_text = f"日付：{record['date']}\n"
+    record_text += f"診療科：{record['department']}\n"
+    record_text += f"担当医：{record['doctor']}\n"
+    if record['author'] and record['author'] != "不明":
+        record_text += f"記載者：{record['author']}\n"
+    if record['instructor'] and record['instructor'] != "不明":
+        record_text += f"指示者：{record['instructor']}\n"
+    if record['updater'] and record['updater'] != "不明":
+        record_text += f"更新者：{record['updater']}\n"
+    record_text += f"記載方法：{record['method']}\n"
+    if record['recordType'] and record['recordType'] != "不明":
+        record_text += f"記載区分：{record['recordType']}\n"
+    
+    # 保険自費区分と入外区分
+    if record['insurance']:
+        record_text += f"保険区分：{record['insurance']}\n"
+    if record['inout']:
+        record_text += f"入外区分：{record['inout']}\n"
+    
+    if record['tags']:
+        record_text += f"記載タグ：{record['tags']}\n"
+    
+    # SOAPセクションを定義順に追加
+    for section in SOAP_ORDER:
+        if section in record['soap']:
+            record_text += f"{section}：{record['soap'][section]}\n"
+    
+    # その他のセクションを追加
+    for section, content in record['sections'].items():
+        record_text += f"{section}：{content}\n"
+    
+    return record_text.rstrip()
+
+def to_structured_record(record):
+    """構造化した記録をレスポンス用の型付きの形にする（format=structured）
+
+    日付はISO 8601、タグはリスト、不明・空の名称はnullにする。
+    テキスト形式が必要な場合はstructured_record_textで元の形に戻せる。
+    """
+    return {
+        'uId': record['uId'],
+        'date': format_stamp_iso(record['date']),
+        'updateStamp': record['date'],
+        'department': _known(record['department']),
+        'doctor': _known(record['doctor']),
+        'author': _known(record['author']),
+        'instructor': _known(record['instructor']),
+        'updater': _known(record['updater']),
+        'method': record['method'],
+        'recordType': _known(record['recordType']),
+        'insurance': record['insurance'],
+        'inout': record['inout'],
+        'tags': record['tags'].split(", ") if record['tags'] else [],
+        'soap': record['soap'],
+        'sections': record['sections']
+    }
+
+def structured_record_text(structured):
+    """to_structured_recordの結果からテキスト形式（format_record_textと同じ）を作る"""
+    return format_record_text({
+        **structured,
+        'date': structured['updateStamp'],
+        'department': structured['department'] or "不明",
+        'doctor': structured['doctor'] or "不明",
+        'author': structured['author'] or "不明",
+        'instructor': structured['instructor'] or "不明",
+        'updater': structured['updater'] or "不明",
+        'recordType': structured['recordType'] or "不明",
+        'tags': ", ".join(structured['tags'])
+    })
+
+def format_stamp_iso(stamp):
+    """updateStamp（YYYYMMDDhhmmss）をISO 8601に変換（変換できなければそのまま）"""
+    try:
+        return datetime.strptime(str(stamp)[:14], '%Y%m%d%H%M%S').isoformat()
+    except ValueError:
+        return stamp or None
+
+def _known(name):
+    return name if name and name != "不明" else None
+
+def iter_record_batches(cursor, patient_uid, records_filter, batch_size=RECORDS_STREAM_BATCH_SIZE):
+    """記録の行をbatch_size件ずつ新しい順に返す
+
+    (行のリスト, ページ情報) を返し、ページ情報は最後のバッチで確定する。
+    """
+    if records_filter['after'] and not records_filter['before']:
+        # 古い順に取得するため一旦全件読んでから返す（limitで件数は抑えられる）
+        records, page_info = fetch_record_rows(cursor, patient_uid, records_filter)
+        for start in range(0, len(records), batch_size):
+            yield records[start:start + batch_size], page_info
+        if not records:
+            yield [], page_info
+        return
+    
+    query, params, _ = build_records_query(patient_uid, records_filter)
+    cursor.execute(query, params)
+    records_columns = [column[0] for column in cursor.description]
+    
+    limit = records_filter['limit']
+    first = last = None
+    fetched = 0
+    has_more = False
+    
+    while True:
+        records_rows = cursor.fetchmany(batch_size)
+        if not records_rows:
+            break
+        
+        records = [dict(zip(records_columns, record_row)) for record_row in records_rows]
+        if limit and fetched + len(records) > limit:
+            # TOP limit+1 の最後の1行は続きの有無の判定用
+            records = records[:limit - fetched]
+            has_more = True
+        
+        if records:
+            fetched += len(records)
+            first = first or records[0]
+            last = records[-1]
+            yield records, make_page_info([first, last], has_more)
+        elif has_more:
+            # 判定用の1行だけのバッチ: 記録は返さず、送信済みの範囲でページ情報を確定する
+            yield [], make_page_info([first, last], has_more)
+        
+        if has_more:
+            break
+    
+    if not fetched:
+        yield [], make_page_info([], False, records_filter)
+
+def to_ndjson(obj):
+    """1行分のNDJSONを生成"""
+    return dumps_bytes(obj) + b"\n"
+
 @app.route('/api/patient-records/<patient_id>', methods=['GET'])
 def get_patient_records(patient_id):
+    conn = cursor = None
     try:
         logger.info(f"患者記録取得: 患者ID = {patient_id}")
         
         if patient_id.isdigit():
             patient_id = patient_id.zfill(8)
         
+        try:
+            records_filter = parse_records_filter(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e), "records": "", "patientName": ""}), 400
+        
+        response_format = request.args.get('format', 'text')
+        if response_format not in RECORDS_FORMATS:
+            return jsonify({
+                "error": f"formatは{'/'.join(RECORDS_FORMATS)}のいずれかを指定してください",
+                "records": "",
+                "patientName": ""
+            }), 400
+        
+        if request.args.get('stream') == 'ndjson':
+            return stream_patient_records(patient_id, records_filter)
+        
+        track_fallbacks()
         conn = get_db_connection()
         cursor = conn.cursor()
         
         # 患者情報の取得
-        patient_query = """
-            SELECT 
-                uId, ゲスト番号, 漢字氏名, 生年月日, 性別
-            FROM 
-                view_cresc_data.ゲスト基本情報
-            WHERE 
-                ゲスト番号 = ?
-                AND isActive = 1
-                AND isDelete = 0
-        """
-        
-        cursor.execute(patient_query, (patient_id,))
-        patient_row = cursor.fetchone()
+        patient_info = find_patient(patient_id, cursor)
         
-        if not patient_row:
-            cursor.close()
-            conn.close()
+        if not patient_info:
             logger.warning(f"患者が見つかりません: ID = {patient_id}")
             return jsonify({
                 "error": "患者情報が見つかりません",
@@ -460,56 +602,48 @@ def get_patient_records(patient_id):
                 "patientName": ""
             })
         
-        # 患者情報の整形
-        patient_columns = [column[0] for column in cursor.description]
-        patient = dict(zip(patient_columns, patient_row))
-        
-        patient_uid = patient.get('uId')
+        patient_uid = patient_info['uId']
         logger.info(f"患者UID: {patient_uid}")
         
-        # 生年月日の整形
-        birth_date = patient.get('生年月日', '')
-        if birth_date and len(str(birth_date)) == 8:
-            birth_date_str = str(birth_date)
-            birth_date = f"{birth_date_str[:4]}年{birth_date_str[4:6]}月{birth_date_str[6:8]}日"
-        
-        patient_info = {
-            'patientId': patient_id,
-            'patientName': patient.get('漢字氏名', ''),
-            'birthDate': birth_date,
-            'gender': patient.get('性別', '')
-        }
-        
-        # 診療記録の取得（正確なフィールド名を使用）
-        records_query = """
-            SELECT 
-                記載.uId,
-                記載.患者uId,
-                記載.updateStamp,
-                記載.診療科uId,
-                記載.記載者uId,
-                記載.指示者uId,
-                記載.updateUserId,
-                記載.記載種別uId,
-                記載.記載内容リスト,
-                記載.保険自費区分,
-                記載.入外区分
-            FROM 
-                cresc_data.カルテ記載 as 記載
-            WHERE
-                記載.患者uId = ?
-                AND 記載.isActive = 1
-                AND 記載.isDelete = 0
-            ORDER BY
-                記載.updateStamp DESC
-        """
-        
-        cursor.execute(records_query, (patient_uid,))
-        records_rows = cursor.fetchall()
+        # 診療記録の取得（このページの記録だけを読む）
+        records, page_info = fetch_record_rows(cursor, patient_uid, records_filter)
+        
+        # カルテの版が変わっていなければ組み立て済みの結果を返す
+        # （版は組み立て前に取るため、途中で更新されても次回の取得で作り直される）
+        # 記載内容はこのページの記録の分だけを版に含める
+        chart_version = fetch_chart_version(cursor, patient_uid, [
+            content_id for record in records for content_id in split_content_ids(record.get('記載内容リスト', ''))
+        ])
+        
+        # クライアントが同じ版を持っていれば304を返す（診療科・職員名はマスターの版で判定）
+        etag = make_etag('patient-records', patient_info, chart_version, master_cache.version(),
+                         response_format, records_filter)
+        if is_not_modified(etag):
+            logger.info(f"診療記録は変更されていません: 患者ID = {patient_id}")
+            return not_modified(etag)
+        
+        cache_key = chart_cache.make_key(patient_uid, response_format, records_filter)
+        cached = chart_cache.get(cache_key, chart_version)
+        if cached is not None:
+            logger.info(f"組み立て済みの診療記録を返します: 患者ID = {patient_id}, 版 = {chart_version}")
+            return with_etag(jsonify(cached), etag)
+        
+        if not records and any(records_filter.values()):
+            # ページ指定・新着確認で該当がない場合はエラーではなく空のページを返す
+            logger.info(f"該当する診療記録はありません: 患者ID = {patient_id}, 条件 = {records_filter}")
+            result = {
+                "records": [] if response_format == 'structured' else "",
+                "patientName": patient_info.get('patientName', ''),
+                "birthDate": patient_info.get('birthDate', ''),
+                "gender": patient_info.get('gender', ''),
+                **page_info
+            }
+            if response_format == 'structured':
+                result["version"] = RECORDS_FORMATS[response_format]
+                result["total"] = 0
+            return with_etag(jsonify(result), etag)
         
-        if not records_rows:
-            cursor.close()
-            conn.close()
+        if not records:
             logger.warning(f"診療記録が見つかりません: 患者ID = {patient_id}, UID = {patient_uid}")
             return jsonify({
                 "error": "該当する診療記録が見つかりません",
@@ -517,171 +651,41 @@ def get_patient_records(patient_id):
                 "patientName": patient_info.get('patientName', '')
             })
         
-        # 記録をテキスト形式に変換
-        formatted_records = []
-        records_columns = [column[0] for column in cursor.description]
-        
-        for record_row in records_rows:
-            record = dict(zip(records_columns, record_row))
-            
-            # 日付の整形
-            record_date = record.get('updateStamp', '')
-            if record_date:
-                date_str = str(int(record_date)) if isinstance(record_date, (int, float)) else str(record_date)
-            else:
-                date_str = ""
-            
-            # 各種情報の取得
-            診療科 = get_department_name(record.get('診療科uId'), cursor)
-            記載者 = get_user_name(record.get('記載者uId'), cursor)
-            指示者 = get_user_name(record.get('指示者uId'), cursor)
-            更新者 = get_user_name(record.get('updateUserId'), cursor)
-            記載種別 = get_record_type_name(record.get('記載種別uId'), cursor)
-            
-            # 記載タグの取得
-            記載タグ = get_record_tags(record.get('uId'), cursor)
-            
-            # 記載内容リストの取得
-            content_list = record.get('記載内容リスト', '')
-            if not content_list:
-                continue
-            
-            content_ids = [cid.strip() for cid in str(content_list).split(',') if cid.strip()]
-            
-            # SOAPセクション用の辞書
-            soap_content = {
-                'Subject': [],
-                'Object': [],
-                'Assessment': [],
-                'Plan': []
-            }
-            
-            # その他のセクション用の辞書
-            other_content = {}
-            
-            # 記載方法の判定用
-            record_method = ""
-            
-            # 全ての記載内容を取得
-            for content_id in content_ids:
-                try:
-                    content_query = """
-                        SELECT 
-                            uId, 記載区分, 記載内容
-                        FROM 
-                            cresc_data.カルテ記載内容
-                        WHERE 
-                            uId = ?
-                            AND isActive = 1
-                            AND isDelete = 0
-                    """
-                    
-                    cursor.execute(content_query, (content_id,))
-                    content_row = cursor.fetchone()
-                    
-                    if content_row:
-                        content_uid, section, content_text = content_row
-                        
-                        # JSONからテキストを抽出
-                        formatted_content = extract_text_from_json(content_text)
-                        
-                        # セクション名の正規化
-                        section = str(section).strip() if section else "記録"
-                        
-                        # 記載方法の判定
-                        if section in ['自由記載', '自由']:
-                            record_method = "自由記載"
-                        elif section in ['超音波']:
-                            record_method = "超音波"
-                        elif section in soap_content:
-                            record_method = "SOAP"
-                        
-                        # SOAPセクションか他のセクションかを判別
-                        if section in soap_content:
-                            soap_content[section].append(formatted_content)
-                        else:
-                            if section not in other_content:
-                                other_content[section] = []
-                            other_content[section].append(formatted_content)
-                
-                except Exception as e:
-                    logger.error(f"記載内容ID {content_id} の取得中にエラー: {e}")
-            
-            # 記載方法が判定できない場合のデフォルト
-            if not record_method:
-                if any(soap_content.values()):
-                    record_method = "SOAP"
-                elif 記載種別 and ('自由' in 記載種別):
-                    record_method = "自由記載"
-                elif 記載種別 and ('超音波' in 記載種別):
-                    record_method = "超音波"
-                else:
-                    record_method = "記録"
-            
-            # 空のセクションを削除し、テキストを結合
-            soap_content = {k: '\n\n'.join(v) for k, v in soap_content.items() if v}
-            other_content = {k: '\n\n'.join(v) for k, v in other_content.items() if v}
-            
-            # 何らかのコンテンツが存在する場合のみ記録を追加
-            if soap_content or other_content:
-                record_text = f"日付：{date_str}\n"
-                record_text += f"診療科：{診療科}\n"
-                record_text += f"担当医：{記載者 or 更新者}\n"
-                if 記載者 and 記載者 != "不明":
-                    record_text += f"記載者：{記載者}\n"
-                if 指示者 and 指示者 != "不明":
-                    record_text += f"指示者：{指示者}\n"
-                if 更新者 and 更新者 != "不明":
-                    record_text += f"更新者：{更新者}\n"
-                record_text += f"記載方法：{record_method}\n"
-                if 記載種別 and 記載種別 != "不明":
-                    record_text += f"記載区分：{記載種別}\n"
-                
-                # 保険自費区分と入外区分の処理
-                保険区分 = record.get('保険自費区分')
-                入外区分 = record.get('入外区分')
-                
-                if 保険区分 == 3:
-                    record_text += f"保険区分：保険\n"
-                elif 保険区分 == 1:
-                    record_text += f"保険区分：自費\n"
-                elif 保険区分 == 0:
-                    record_text += f"保険区分：未登録\n"
-                
-                if 入外区分 == 0:
-                    record_text += f"入外区分：外来\n"
-                elif 入外区分 == 1:
-                    record_text += f"入外区分：入院\n"
-                
-                if 記載タグ:
-                    record_text += f"記載タグ：{記載タグ}\n"
-                
-                # SOAPセクションを定義順に追加
-                soap_order = ['Subject', 'Object', 'Assessment', 'Plan']
-                for section in soap_order:
-                    if section in soap_content:
-                        record_text += f"{section}：{soap_content[section]}\n"
-                
-                # その他のセクションを追加
-                for section, content in other_content.items():
-                    record_text += f"{section}：{content}\n"
-                
-                formatted_records.append(record_text.rstrip())
+        if response_format == 'structured':
+            # 構造化JSON（テキストの組み立て・フロントでの再解析を行わない）
+            formatted_records = [to_structured_record(record) for record in build_records(records, cursor)]
+            records_value = formatted_records
+        else:
+            # 記録をテキスト形式に変換
+            formatted_records = [format_record_text(record) for record in build_records(records, cursor)]
+            records_value = "\n\n---\n\n".join(formatted_records)
         
-        cursor.close()
-        conn.close()
+        # 応答の生成前に接続を返却する
+        close_quietly(cursor, conn)
+        cursor = conn = None
         
         logger.info(f"{len(formatted_records)}件の診療記録を取得しました: 患者ID = {patient_id}")
         
         # 結果の作成
         result = {
-            "records": "\n\n---\n\n".join(formatted_records),
+            "records": records_value,
             "patientName": patient_info.get('patientName', ''),
             "birthDate": patient_info.get('birthDate', ''),
             "gender": patient_info.get('gender', '')
         }
         
-        return jsonify(result)
+        if response_format == 'structured':
+            result["version"] = RECORDS_FORMATS[response_format]
+            result["total"] = len(formatted_records)
+        
+        if any(records_filter.values()):
+            result.update(page_info)
+        
+        # 代用値を含む結果はキャッシュしない（次回は組み立て直す）
+        if not fallback_used():
+            chart_cache.put(cache_key, chart_version, result)
+        
+        return with_etag(jsonify(result), etag)
     
     except Exception as e:
         logger.error(f"診療記録取得エラー: {e}")
@@ -690,6 +694,62 @@ def get_patient_records(patient_id):
             "records": "",
             "patientName": ""
         })
+    
+    finally:
+        close_quietly(cursor, conn)
+
+def stream_patient_records(patient_id, records_filter):
+    """診療記録を1行1件のNDJSONで順次返す（?stream=ndjson）
+
+    1行目は患者情報（type=patient）、以降は新しい順に記録（type=record、format=structuredの記録と同じ形）、
+    最終行は件数とページ情報（type=end）。途中でエラーが起きた場合はtype=errorの行を返す。
+    """
+    # 患者の確認だけ先に行い、接続はすぐに返却する
+    conn = get_db_connection()
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        patient_info = find_patient(patient_id, cursor)
+    finally:
+        close_quietly(cursor, conn)
+    
+    if not patient_info:
+        logger.warning(f"患者が見つかりません: ID = {patient_id}")
+        return jsonify({
+            "error": "患者情報が見つかりません",
+            "records": "",
+            "patientName": ""
+        })
+    
+    def generate():
+        # 接続は送信を始めてから借りる（HEADや送信前の切断では生成が始まらず、返却されないため）
+        conn = cursor = content_cursor = None
+        total = 0
+        
+        try:
+            yield to_ndjson({"type": "patient", **{k: v for k, v in patient_info.items() if k != 'uId'}})
+            
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            # 記録の行を読み進めながら記載内容を引くため、カーソルを分ける
+            content_cursor = conn.cursor()
+            
+            for records, page_info in iter_record_batches(cursor, patient_info['uId'], records_filter):
+                for record in build_records(records, content_cursor):
+                    total += 1
+                    yield to_ndjson({"type": "record", **to_structured_record(record)})
+            
+            logger.info(f"{total}件の診療記録をストリーミングしました: 患者ID = {patient_id}")
+            yield to_ndjson({"type": "end", "total": total, **page_info})
+        
+        except Exception as e:
+            logger.error(f"診療記録ストリーミングエラー: {e}")
+            yield to_ndjson({"type": "error", "error": f"診療記録の取得に失敗しました: {str(e)}"})
+        
+        finally:
+            close_quietly(content_cursor, cursor, conn)
+    
+    return Response(generate(), mimetype='application/x-ndjson')
 
 
 def get_last_soap_record_date(patient_uid, cursor):
@@ -725,8 +785,10 @@ def get_last_soap_record_date(patient_uid, cursor):
         return None
 @app.route('/api/next-record/guest-record/<guest_id>', methods=['GET'])
 def get_guest_record(guest_id):
+    conn = cursor = None
     try:
         logger.info(f"ゲスト記録取得: ゲストID = {guest_id}")
+        track_fallbacks()
         
         if guest_id.isdigit():
             guest_id = guest_id.zfill(8)
@@ -750,8 +812,6 @@ def get_guest_record(guest_id):
         guest_row = cursor.fetchone()
         
         if not guest_row:
-            cursor.close()
-            conn.close()
             return jsonify({"error": "ゲストが見つかりません"})
         
         guest_columns = [column[0] for column in cursor.description]
@@ -771,104 +831,35 @@ def get_guest_record(guest_id):
             'gender': guest.get('性別', '')
         }
         
+        # カルテの版が前回と同じなら最新SOAPを探さずに304を返す
+        # （記載内容は最新SOAPを探す範囲の記載の分だけを版に含める）
+        etag = make_etag('guest-record', guest_info, fetch_chart_version(
+            cursor, patient_uid, fetch_recent_content_ids(cursor, patient_uid, SOAP_SEARCH_DEPTH)))
+        if is_not_modified(etag):
+            return not_modified(etag)
+        
         # 最新のSOAPカルテを取得
         last_record = get_latest_complete_soap_record(patient_uid, cursor)
         
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
+        return with_etag(jsonify({
             "guestInfo": guest_info,
             "lastRecord": last_record
-        })
+        }), etag)
         
     except Exception as e:
         logger.error(f"ゲスト記録取得エラー: {e}")
         return jsonify({"error": str(e)})
+    
+    finally:
+        close_quietly(cursor, conn)
 
 def get_latest_complete_soap_record(patient_uid, cursor):
     """最新の完全なSOAPカルテを取得"""
     try:
-        # 最新のSOAPカルテを検索
-        records_query = """
-            SELECT TOP 10
-                記載.uId,
-                記載.updateStamp,
-                記載.記載内容リスト
-            FROM 
-                cresc_data.カルテ記載 as 記載
-            WHERE
-                記載.患者uId = ?
-                AND 記載.isActive = 1
-                AND 記載.isDelete = 0
-            ORDER BY
-                記載.updateStamp DESC
-        """
-        
-        cursor.execute(records_query, (patient_uid,))
-        records_rows = cursor.fetchall()
-        
-        for record_row in records_rows:
-            record_uid, update_stamp, content_list = record_row
-            
-            if not content_list:
-                continue
-            
-            content_ids = [cid.strip() for cid in str(content_list).split(',') if cid.strip()]
-            
-            # SOAPセクションを収集
-            soap_content = {
-                'Subject': '',
-                'Object': '',  
-                'Assessment': '',
-                'Plan': ''
-            }
-            
-            # 各記載内容を取得
-            for content_id in content_ids:
-                try:
-                    content_query = """
-                        SELECT 
-                            記載区分, 記載内容
-                        FROM 
-                            cresc_data.カルテ記載内容
-                        WHERE 
-                            uId = ?
-                            AND isActive = 1
-                            AND isDelete = 0
-                    """
-                    
-                    cursor.execute(content_query, (content_id,))
-                    content_row = cursor.fetchone()
-                    
-                    if content_row:
-                        section, content_text = content_row
-                        section = str(section).strip() if section else ""
-                        
-                        if section in soap_content:
-                            soap_content[section] = extract_text_from_json(content_text)
-                
-                except Exception as e:
-                    logger.error(f"記載内容ID {content_id} の取得中にエラー: {e}")
-                    continue
-            
-            # 少なくとも一つのSOAPセクションが存在するかチェック
-            if any(soap_content[section].strip() for section in soap_content):
-                # 日付の整形
-                date_str = str(int(update_stamp)) if isinstance(update_stamp, (int, float)) else str(update_stamp)
-                
-                return {
-                    'date': date_str,
-                    'Subject': soap_content['Subject'],
-                    'Object': soap_content['Object'],
-                    'Assessment': soap_content['Assessment'],
-                    'Plan': soap_content['Plan']
-                }
-        
-        return None
-        
+        return fetch_latest_soap_records([patient_uid], cursor).get(str(patient_uid))
     except Exception as e:
         logger.error(f"最新SOAP記録取得エラー: {e}")
+        mark_fallback()
         return None
 
 @app.route('/api/next-record/guest-list', methods=['POST'])
@@ -880,65 +871,20 @@ def get_guest_list():
         if not guest_ids:
             return jsonify({"error": "ゲストIDリストが必要です", "guests": []})
         
+        if len(guest_ids) > MAX_GUEST_IDS:
+            return jsonify({"error": f"ゲストIDは{MAX_GUEST_IDS}件までです", "guests": []}), 400
+        
         logger.info(f"ゲストリスト取得: {len(guest_ids)}件のゲストID")
         
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        guests = []
-        
-        for guest_id in guest_ids:
-            try:
-                # ゲスト基本情報の取得
-                guest_query = """
-                    SELECT 
-                        uId, ゲスト番号, 漢字氏名, 生年月日, 性別
-                    FROM 
-                        view_cresc_data.ゲスト基本情報
-                    WHERE 
-                        ゲスト番号 = ?
-                        AND isActive = 1
-                        AND isDelete = 0
-                """
-                
-                cursor.execute(guest_query, (guest_id,))
-                guest_row = cursor.fetchone()
-                
-                if guest_row:
-                    guest_columns = [column[0] for column in cursor.description]
-                    guest = dict(zip(guest_columns, guest_row))
-                    
-                    # 生年月日の整形
-                    birth_date = guest.get('生年月日', '')
-                    if birth_date and len(str(birth_date)) == 8:
-                        birth_date_str = str(birth_date)
-                        birth_date = f"{birth_date_str[:4]}年{birth_date_str[4:6]}月{birth_date_str[6:8]}日"
-                    
-                    # SOAPカルテの存在確認
-                    soap_record = get_latest_complete_soap_record(guest.get('uId'), cursor)
-                    
-                    # SOAPカルテが存在する場合のみリストに追加
-                    if soap_record:
-                        guest_info = {
-                            'guestId': guest_id,
-                            'guestName': guest.get('漢字氏名', ''),
-                            'birthDate': birth_date,
-                            'gender': guest.get('性別', ''),
-                            'lastRecordDate': format_date_for_display(soap_record.get('date', ''))
-                        }
-                        guests.append(guest_info)
-                        logger.info(f"SOAPカルテ有り: ゲストID {guest_id}")
-                    else:
-                        logger.info(f"SOAPカルテなし: ゲストID {guest_id}")
-                else:
-                    logger.warning(f"ゲスト情報が見つかりません: ID {guest_id}")
-                    
-            except Exception as e:
-                logger.error(f"ゲストID {guest_id} の処理中にエラー: {e}")
-                continue
+        cursor = None
         
-        cursor.close()
-        conn.close()
+        try:
+            # ゲスト情報と最新SOAPカルテをまとめて取得
+            cursor = conn.cursor()
+            guests = build_guest_list(guest_ids, cursor)
+        finally:
+            close_quietly(cursor, conn)
         
         logger.info(f"SOAPカルテ保有ゲスト: {len(guests)}件")
         return jsonify({"guests": guests})
@@ -993,4 +939,7 @@ if __name__ == '__main__':
     import sys
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
     logger.info(f"Python Flask サーバーを起動しています (ポート: {port})...")
+    warm_pools()
+    master_cache.start_refresh_timer()
+    patient_index.start_refresher()
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
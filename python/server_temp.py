@@ -3,9 +3,9 @@ from flask import Flask, request, jsonify
 import pyodbc
 import logging
 import json
-import re
 from datetime import datetime
 from flask_cors import CORS
+from modules.content_parser import extract_text_from_json
 
 # ログ設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -64,156 +64,6 @@ def get_db_connection(db_name='cresc-sora'):
         raise
 
 # 既存の機能をここに統合（extract_text_from_json等の関数）
-def extract_text_from_json(content):
-    """JSON配列からテキストを抽出する - JSONコンバーター形式に対応"""
-    if not content:
-        return ""
-    
-    try:
-        # 文字列でない場合はそのまま返す
-        if not isinstance(content, str):
-            return str(content)
-        
-        # JSONフォーマットでない場合はそのまま返す
-        if '"Text"' not in content:
-            return content
-        
-        logger.debug(f"JSON抽出開始: 長さ={len(content)}")
-        
-        # 一番外側の引用符を除去
-        cleaned_content = content.strip()
-        if cleaned_content.startswith('"') and cleaned_content.endswith('"'):
-            cleaned_content = cleaned_content[1:-1]
-        
-        # エスケープされた引用符を元に戻す
-        cleaned_content = cleaned_content.replace('""', '"')
-        
-        # カンマで区切られたJSON配列を分割
-        json_arrays = []
-        current_array = ""
-        bracket_count = 0
-        in_quotes = False
-        escaped = False
-        
-        i = 0
-        while i < len(cleaned_content):
-            char = cleaned_content[i]
-            
-            if escaped:
-                escaped = False
-                current_array += char
-                i += 1
-                continue
-            
-            if char == '\\':
-                escaped = True
-                current_array += char
-                i += 1
-                continue
-            
-            if char == '"' and not escaped:
-                in_quotes = not in_quotes
-                current_array += char
-            elif not in_quotes:
-                if char == '[':
-                    if bracket_count == 0:
-                        current_array = char
-                    else:
-                        current_array += char
-                    bracket_count += 1
-                elif char == ']':
-                    current_array += char
-                    bracket_count -= 1
-                    if bracket_count == 0:
-                        json_arrays.append(current_array)
-                        current_array = ""
-                        # 次のJSON配列まで進む（", を探す）
-                        while i + 1 < len(cleaned_content) and cleaned_content[i + 1] in ['"', ',', ' ']:
-                            i += 1
-                elif bracket_count > 0:
-                    current_array += char
-            else:
-                current_array += char
-            
-            i += 1
-        
-        # 残ったものがあれば追加
-        if current_array.strip():
-            json_arrays.append(current_array.strip())
-        
-        # JSON配列が見つからなかった場合は全体を1つの配列として処理
-        if not json_arrays:
-            json_arrays = [cleaned_content]
-        
-        # 各JSON配列からテキストを抽出
-        all_texts = []
-        
-        for json_array_str in json_arrays:
-            try:
-                # JSON配列として解析
-                json_array = json.loads(json_array_str)
-                
-                if isinstance(json_array, list):
-                    for item in json_array:
-                        if isinstance(item, dict) and 'Text' in item:
-                            text = item['Text']
-                            # JSONコンバーターの規則：空のTextは改行として扱う
-                            if text == "":
-                                all_texts.append("")  # 空行として保持
-                            elif text.strip():
-                                all_texts.append(text.strip())
-                elif isinstance(json_array, dict) and 'Text' in json_array:
-                    # 単一のオブジェクトの場合
-                    text = json_array['Text']
-                    if text == "":
-                        all_texts.append("")
-                    elif text.strip():
-                        all_texts.append(text.strip())
-            
-            except json.JSONDecodeError as e:
-                logger.debug(f"JSON解析エラー: {e}, 内容: {json_array_str[:100]}...")
-                # JSONとして解析できない場合は正規表現で抽出
-                text_matches = re.findall(r'"Text"\s*:\s*"([^"]*)"', json_array_str)
-                for match in text_matches:
-                    if match == "":
-                        all_texts.append("")
-                    elif match.strip():
-                        all_texts.append(match.strip())
-        
-        # JSONコンバーターの規則に従って結合
-        # 連続する非空行は改行で結合、空のTextは段落の区切りとして扱う
-        result_parts = []
-        current_paragraph = []
-        
-        for text in all_texts:
-            if text == "":
-                # 空行の場合、現在の段落を結合して追加
-                if current_paragraph:
-                    result_parts.append('\n'.join(current_paragraph))
-                    current_paragraph = []
-                # 空行として段落区切りを追加
-                result_parts.append("")
-            else:
-                # 非空行の場合、現在の段落に追加
-                current_paragraph.append(text)
-        
-        # 最後の段落を追加
-        if current_paragraph:
-            result_parts.append('\n'.join(current_paragraph))
-        
-        # 結果を改行で結合（空の要素は改行として扱う）
-        result = '\n'.join(result_parts)
-        
-        # 連続する改行を整理
-        result = re.sub(r'\n{3,}', '\n\n', result)
-        
-        logger.debug(f"抽出完了: {len(result)}文字")
-        return result
-        
-    except Exception as e:
-        logger.error(f"JSONテキスト抽出エラー: {e}")
-        return content
-
 # 予約管理機能を追加
 @app.route('/api/appointments/<date>', methods=['GET'])
 def get_appointments_by_date(date):
@@ -0,0 +1,66 @@
+# python/tests/test_server_complete.py
+"""server complete.py の診療記録取得（記載内容の一括取得結果の扱い）のテスト
+
+合成データベース（benchmarks.synthetic_db）を使う。pythonディレクトリで実行:
+    python -m pytest -q tests
+"""
+import importlib.util
+import os
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('pyodbc')
+
+from benchmarks import synthetic_db
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope='module')
+def database(tmp_path_factory):
+    return synthetic_db.build(str(tmp_path_factory.mktemp('db')), patients=3, records_per_patient=5, days=1)
+
+@pytest.fixture(scope='module')
+def server_complete(database):
+    # ファイル名に空白を含むためimportlibで読み込む
+    spec = importlib.util.spec_from_file_location('server_complete', os.path.join(PYTHON_DIR, 'server complete.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.get_db_connection = database.connect
+    return module
+
+def test_patient_records_include_contents(server_complete, database):
+    from modules.content_parser import extract_text_from_json
+
+    client = server_complete.app.test_client()
+    data = client.get('/api/patient-records/00000001').get_json()
+
+    assert 'error' not in data
+    assert len(data['records'].split('\n\n---\n\n')) == 5
+
+    # 患者の全記載内容の本文が応答に含まれる（記載内容の取り違えで欠落しない）
+    cursor = database.connect().cursor()
+    cursor.execute("""
+        SELECT 内容.記載内容
+        FROM cresc_data.カルテ記載 as 記載, cresc_data.カルテ記載内容 as 内容
+        WHERE 記載.患者uId = 'P1' AND ',' || 記載.記載内容リスト || ',' LIKE '%,' || 内容.uId || ',%'
+    """)
+    texts = [extract_text_from_json(row[0]).strip() for row in cursor.fetchall()]
+    assert texts
+    for text in filter(None, texts):
+        assert text.splitlines()[0] in data['records']
+
+def test_content_rows_are_section_text_pairs(database):
+    from modules.record_content import fetch_record_contents
+
+    connection = database.connect()
+    cursor = connection.cursor()
+    cursor.execute("SELECT 記載内容リスト FROM cresc_data.カルテ記載 LIMIT 1")
+    content_ids = cursor.fetchone()[0].split(',')
+
+    contents = fetch_record_contents(content_ids, cursor)
+
+    assert set(contents) == set(content_ids)
+    for section, content_text in contents.values():
+        assert section
+        assert content_text
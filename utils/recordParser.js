@@ -48,6 +48,59 @@ export function parseRecords(recordsString) {
   return records;
 }
 
+// 構造化JSON（/api/patient-records/:id?format=structured）の記録を
+// parseRecords と同じ形のオブジェクトに変換（文字列の組み立て・再解析を行わない）
+export function recordsFromStructured(structuredRecords) {
+  return structuredRecords.map((item, index) => {
+    const record = { id: index };
+    structuredRecordFields(item).forEach(([label, value]) => {
+      record[label] = value;
+    });
+    
+    record.category = record['診療科'] || record['記載方法'] || 'その他';
+    record.recordId = index;
+    record.uId = item.uId;
+    record.dateTime = item.date;
+    
+    return record;
+  });
+}
+
+// 構造化JSONの記録を従来のテキスト形式（「項目：内容」）に変換（LLMのプロンプト用）
+// サーバーのformat_record_textと同じく末尾の改行・空白は取り除く
+export function structuredRecordToText(item) {
+  return structuredRecordFields(item)
+    .map(([label, value]) => `${label}：${value}`)
+    .join('\n')
+    .trimEnd();
+}
+
+// 構造化JSONの記録をテキスト形式と同じ順序の [項目名, 内容] に展開
+function structuredRecordFields(item) {
+  const fields = [
+    ['日付', item.updateStamp],
+    ['診療科', item.department || '不明'],
+    ['担当医', item.doctor || '不明']
+  ];
+  if (item.author) fields.push(['記載者', item.author]);
+  if (item.instructor) fields.push(['指示者', item.instructor]);
+  if (item.updater) fields.push(['更新者', item.updater]);
+  fields.push(['記載方法', item.method]);
+  if (item.recordType) fields.push(['記載区分', item.recordType]);
+  if (item.insurance) fields.push(['保険区分', item.insurance]);
+  if (item.inout) fields.push(['入外区分', item.inout]);
+  if (item.tags && item.tags.length > 0) fields.push(['記載タグ', item.tags.join(', ')]);
+  
+  soapOrder.forEach(section => {
+    if (item.soap && item.soap[section]) fields.push([section, item.soap[section]]);
+  });
+  Object.entries(item.sections || {}).forEach(([section, content]) => {
+    fields.push([section, content]);
+  });
+  
+  return fields;
+}
+
 // SOAPセクションの優先順位
 export const soapOrder = ['Subject', 'Object', 'Assessment', 'Plan'];
 